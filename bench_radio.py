@@ -0,0 +1,607 @@
+import array
+import datetime
+import gc
+import http.server
+import logging
+import math
+import mmap
+import os
+import random
+import signal
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+import radio
+
+class AlarmSimulator:
+
+    """Discrete-event simulation of the alarm state machine on the null audio backend.
+    Instead of running the main loop, the clock jumps to the next event (alarm, answer,
+    end of snooze or of ringing) plus a random loop latency. Weeks take milliseconds"""
+
+    def __init__(self, work_dir, start, time_zone='Europe/Berlin', alarm_time=(7, 0), snoozes=1, answer_delay=30, latency=1.0, stall_probability=0, suspend=False, resume_delay=0, seed=0):
+        self._random = random.Random(seed)
+        self._clock = radio.SimulatedClock(start, time_zone)
+        self._snoozes = snoozes
+        self._answer_delay = answer_delay # None to let the alarm ring until it times out
+        self._latency = latency
+        self._stall_probability = stall_probability # Loop stalled (suspended) over the alarm window
+        self._suspend = suspend # Suspends to RAM between alarms
+        self._resume_delay = resume_delay # Maximum time taken by a resume
+        channels_file = os.path.join(work_dir, 'channels')
+        with open(channels_file, 'w') as f:
+            f.write('Alarm|http://alarm.example.com/stream.mp3\n')
+        prefs = radio.ClockRadio.get_default_preferences()
+        prefs['CoreRadio.Backend'] = 'null'
+        prefs['ClockRadio.ChannelsFile'] = channels_file
+        prefs['ClockRadio.CatalogCacheFile'] = os.path.join(work_dir, 'catalog_cache')
+        prefs['ClockRadio.HistoryFile'] = os.path.join(work_dir, 'history')
+        prefs['ClockRadio.AlarmOn'] = True
+        prefs['ClockRadio.AlarmChannel'] = 'Alarm'
+        prefs['ClockRadio.AlarmTime'] = list(alarm_time)
+        radio.SimulatedSystem.wake_requests = list()
+        radio.SimulatedSystem.suspend_requests = list()
+        radio.SimulatedSystem.clock = self._clock
+        self._clock_radio = radio.ClockRadio(prefs, clock=self._clock, system=radio.SimulatedSystem)
+        self._clock_radio.set_fire_event_listener(self.on_fire)
+        self._scheduled = None
+        self._snoozed = 0
+        self._wake_requests = len(radio.SimulatedSystem.wake_requests)
+        self.fired = 0
+        self.snoozes = 0
+        self.timeouts = 0
+        self.stalls = 0
+        self.suspends = 0
+        self.jitters = list()
+        self.wake_errors = list()
+
+    def run(self, days):
+        end = self._clock.monotonic() + days * 86400
+        while self._clock.monotonic() < end:
+            self.step()
+        self._clock_radio.close()
+        radio.SimulatedSystem.clock = None
+        return self.get_report()
+
+    def step(self):
+        state = self._clock_radio.get_alarm_state()
+        if state == radio.ClockRadio.AlarmState.waiting and self._suspend and self._clock_radio.can_suspend():
+            radio.SimulatedSystem.resume_delay = self._random.uniform(0, self._resume_delay)
+            self._clock_radio.suspend_until_alarm()
+            self.suspends += 1
+            self.check_wake_request()
+        elif state == radio.ClockRadio.AlarmState.waiting:
+            self._scheduled = self._clock_radio.get_alarm_datetime()
+            self._snoozed = 0
+            delay = max(0, self._clock.seconds_until(self._scheduled))
+            if self._random.random() < self._stall_probability:
+                delay += 2 * radio.ALARM_WINDOW
+                self.stalls += 1
+            self.advance(delay)
+        elif state == radio.ClockRadio.AlarmState.ready_to_ring:
+            self.advance(0)
+        elif state == radio.ClockRadio.AlarmState.ringing:
+            countdown = self._clock_radio.get_ringing_countdown()
+            answer = None if self._answer_delay is None else self._random.uniform(0.5, 1.5) * self._answer_delay
+            if answer is None or answer >= countdown:
+                self.timeouts += 1
+                self.advance(countdown)
+            else:
+                self._clock.advance(answer)
+                if self._snoozed < self._snoozes and self._clock_radio.snooze():
+                    self._snoozed += 1
+                    self.snoozes += 1
+                else:
+                    if self._clock_radio.get_alarm_state() != radio.ClockRadio.AlarmState.waiting:
+                        self._clock_radio.exit_alarm()
+                    self._clock_radio.stop_radio()
+        elif state == radio.ClockRadio.AlarmState.snooze:
+            self.advance(self._clock_radio.get_snooze_countdown())
+
+    def advance(self, seconds):
+        # The main loop notices an event up to one loop period late
+        self._clock.advance(seconds + self._random.uniform(0.001, self._latency))
+        self._clock_radio.update()
+        self.check_wake_request()
+
+    def check_wake_request(self):
+        if len(radio.SimulatedSystem.wake_requests) > self._wake_requests:
+            self._wake_requests = len(radio.SimulatedSystem.wake_requests)
+            if radio.SimulatedSystem.wake_requests[-1] > 0 and self._clock.seconds_until(self._clock_radio.get_alarm_datetime()) > 0: # An alarm already passed is up to the late fire
+                self.wake_errors.append(abs(radio.SimulatedSystem.wake_requests[-1] - self._clock.seconds_until(self._clock_radio.get_alarm_datetime())))
+
+    def on_fire(self):
+        self.fired += 1
+        self.jitters.append(-self._clock.seconds_until(self._scheduled))
+
+    def get_report(self):
+        return dict(fired=self.fired, missed=self._clock_radio.get_missed_alarms(), snoozes=self.snoozes, timeouts=self.timeouts, stalls=self.stalls, suspends=self.suspends, jitter_mean=sum(self.jitters) / max(1, len(self.jitters)), jitter_max=max(self.jitters, default=0), wake_error_max=max(self.wake_errors, default=0))
+
+class StreamCacheSimulator:
+
+    """Player cache fed by a simulated network link. The link delivers throughput times the
+    stream bitrate, except during outages (Poisson arrivals, exponentially distributed
+    durations) or during the incidents of a given trace. Playback starts once the prefill
+    is buffered and waits for it again after an underrun, as mplayer does with -cache-min"""
+
+    def __init__(self, bitrate, throughput=1.5, outages_per_hour=0, outage_duration=1, seed=0):
+        self._random = random.Random(seed)
+        self._bitrate = bitrate # kbps
+        self._throughput = throughput
+        self._outages_per_hour = outages_per_hour
+        self._outage_duration = outage_duration
+
+    def play(self, cache, seconds, step=0.05, trace=None):
+        """Plays for seconds with cache, (size in KB, prefill percent, ...). The incidents
+        of trace, [(start, end, throughput)...] sorted by start, replace the outages.
+        Returns (startup latency, underruns, stalled seconds)"""
+        rate = self._bitrate / 8 # KB/s
+        (size, prefill) = (cache[0], cache[0] * cache[1] / 100)
+        outage_probability = self._outages_per_hour / 3600 * step if trace is None else 0
+        incidents = iter(trace or ())
+        incident = next(incidents, None)
+        (buffered, outage_end, playing, startup, underruns, stalled) = (0, 0, False, None, 0, 0)
+        for i in range(int(seconds / step)):
+            now = i * step
+            if now >= outage_end and self._random.random() < outage_probability:
+                outage_end = now + self._random.expovariate(1 / self._outage_duration)
+            while incident is not None and now >= incident[1]:
+                incident = next(incidents, None)
+            if incident is not None and now >= incident[0]:
+                buffered = min(size, buffered + incident[2] * rate * step)
+            elif now >= outage_end:
+                buffered = min(size, buffered + self._throughput * rate * step)
+            if playing and buffered >= rate * step:
+                buffered -= rate * step
+            elif playing:
+                playing = False
+                underruns += 1
+            elif buffered >= prefill:
+                playing = True
+                startup = now if startup is None else startup
+            if not playing and startup is not None:
+                stalled += step
+        return (seconds if startup is None else startup, underruns, stalled)
+
+    def random_trace(seconds, incidents_per_hour, median_duration, sigma=1, burst=3, degraded=0.5, seed=0):
+        """Network incidents of a session, drawn independently of the outage model above:
+        bursts of incidents (Poisson arrivals, geometric sizes of mean burst, 30 s apart
+        on average) lasting a lognormal time. With probability degraded an incident
+        lowers the throughput to 30-90% of the bitrate, otherwise it cuts the link.
+        Returns [(start, end, throughput)...] sorted by start"""
+        generator = random.Random(seed)
+        (trace, now) = (list(), 0)
+        while True:
+            now += generator.expovariate(incidents_per_hour / burst / 3600)
+            if now >= seconds:
+                return trace
+            start = now
+            while True:
+                end = start + generator.lognormvariate(math.log(median_duration), sigma)
+                throughput = generator.uniform(0.3, 0.9) if generator.random() < degraded else 0
+                trace.append((start, end, throughput))
+                if generator.random() < 1 / burst:
+                    break
+                start = end + generator.expovariate(1 / 30)
+            now = max(now, end)
+
+class StationServerSimulator:
+
+    """Local http servers standing in for radio stations, one per simulated host.
+    Paths: /stream (mp3 data), /empty (no data), /redirect (to /stream), anything
+    else is a 404. Each response is delayed, the peak number of concurrent requests
+    is recorded per host and overall"""
+
+    def __init__(self, hosts=1, delay=0.05):
+        simulator = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                simulator.on_request(self.server, self)
+            def log_message(self, format, *args):
+                pass
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._active = dict()
+        self.peak = dict()
+        self.peak_total = 0
+        self._servers = [http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler) for i in range(hosts)]
+        for server in self._servers:
+            server.daemon_threads = True
+            self._active[server] = 0
+            self.peak[server] = 0
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def get_urls(self, path, count=1):
+        """Returns count urls per host, distinct so that the scanner checks each of them"""
+        return ['http://127.0.0.1:{0:d}{1}?{2:d}'.format(server.server_address[1], path, i) for server in self._servers for i in range(count)]
+
+    def get_peaks(self):
+        return [self.peak[server] for server in self._servers]
+
+    def on_request(self, server, handler):
+        with self._lock:
+            self._active[server] += 1
+            self.peak[server] = max(self.peak[server], self._active[server])
+            self.peak_total = max(self.peak_total, sum(self._active.values()))
+        try:
+            time.sleep(self._delay)
+            path = handler.path.split('?')[0]
+            if path == '/redirect':
+                handler.send_response(302)
+                handler.send_header('Location', '/stream')
+                handler.end_headers()
+            elif path in ('/stream', '/empty'):
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'audio/mpeg')
+                handler.send_header('icy-br', '128')
+                handler.end_headers()
+                if path == '/stream':
+                    handler.wfile.write(b'ID3' + bytes(1024))
+            else:
+                handler.send_response(404)
+                handler.end_headers()
+        finally:
+            with self._lock:
+                self._active[server] -= 1
+
+    def close(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+class Benchmarks:
+
+    """Measurements of the runtime building blocks, results are printed to stdout"""
+
+    def run(names):
+        logging.disable(logging.INFO)
+        try:
+            for name in names:
+                print('== {0}'.format(name))
+                getattr(Benchmarks, name)()
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def names():
+        return sorted(n for n in vars(Benchmarks) if not n in ('run', 'names') and not n.startswith('_'))
+
+    def _write_channels_file(file_path, count):
+        with open(file_path, 'w') as f:
+            for i in range(count):
+                f.write('Channel {0:d}|http://stream{1:d}.example.com:8000/radio/{0:d}.mp3\n'.format(i, i % 500))
+
+    def channel_store(count=100000):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'channels')
+            Benchmarks._write_channels_file(file_path, count)
+            for columnar in (False, True):
+                prefs = radio.CoreRadio.get_default_preferences()
+                prefs['CoreRadio.ColumnarStore'] = columnar
+                gc.collect()
+                start_time = time.perf_counter()
+                core_radio = radio.CoreRadio(prefs)
+                names = core_radio.load_radio_list(file_path)
+                elapsed = time.perf_counter() - start_time
+                del core_radio, names
+                gc.collect()
+                tracemalloc.start()
+                core_radio = radio.CoreRadio(prefs)
+                names = core_radio.load_radio_list(file_path)
+                memory = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                del core_radio, names
+                print('{0:>8}: {1:d} channels loaded in {2:.3f} s, {3:.1f} bytes/channel'.format('columnar' if columnar else 'dict', count, elapsed, memory / count))
+
+    def preferences(count=1000, loops=200):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'prefs')
+            snapshot_path = os.path.join(tmp_dir, 'prefs.snapshot')
+            defaults = radio.CursesWrapper.get_default_preferences()
+            defaults.update(('Benchmark{0:d}.Key{1:d}'.format(i % 20, i), list(range(i % 10))) for i in range(count))
+            prefs = radio.Preferences(defaults, file_path, snapshot_file=snapshot_path)
+            prefs.save()
+            for snapshot in (None, snapshot_path):
+                start_time = time.perf_counter()
+                for i in range(loops):
+                    radio.Preferences(defaults, file_path, snapshot_file=snapshot)
+                elapsed = time.perf_counter() - start_time
+                print('{0:>8}: load in {1:.3f} ms'.format('snapshot' if snapshot else 'json', 1000 * elapsed / loops))
+            start_time = time.perf_counter()
+            for i in range(loops):
+                radio.Preferences(defaults, file_path, snapshot_file=snapshot_path)['CoreRadio.StartVolume']
+            elapsed = time.perf_counter() - start_time
+            print('{0:>8}: load and read one section in {1:.3f} ms'.format('snapshot', 1000 * elapsed / loops))
+            start_time = time.perf_counter()
+            for i in range(loops):
+                prefs['CoreRadio.StartVolume'] = i
+                prefs.save()
+            elapsed = time.perf_counter() - start_time
+            print('{0:>8}: one section changed, saved in {1:.3f} ms'.format('save', 1000 * elapsed / loops))
+
+    def catalog_import(count=100000):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sources = dict()
+            sources['m3u'] = os.path.join(tmp_dir, 'stations.m3u')
+            with open(sources['m3u'], 'w') as f:
+                f.write('#EXTM3U\n')
+                for i in range(count):
+                    f.write('#EXTINF:-1,Station {0:d}\nhttp://stream{1:d}.example.com:8000/radio/{0:d}.mp3\n'.format(i, i % 500))
+            sources['json'] = os.path.join(tmp_dir, 'stations.json')
+            with open(sources['json'], 'w') as f:
+                f.write('[\n' + ',\n'.join('{{"name": "Station {0:d}", "url": "http://stream{1:d}.example.com:8000/radio/{0:d}.mp3", "tags": "pop,rock"}}'.format(i, i % 500) for i in range(count)) + '\n]\n')
+            for (name, source) in sorted(sources.items()):
+                channels_file = os.path.join(tmp_dir, 'channels_{0}'.format(name))
+                importer = radio.CatalogImporter(channels_file)
+                start_time = time.perf_counter()
+                importer.index_catalog()
+                importer.import_files([source])
+                elapsed = time.perf_counter() - start_time
+                os.remove(channels_file)
+                tracemalloc.start()
+                radio.CatalogImporter(channels_file).import_files([source])
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print('{0:>8}: {1:d} channels ({2:.1f} MB) imported in {3:.3f} s, peak memory {4:.1f} MB'.format(name, importer.imported, os.path.getsize(source) / 1e6, elapsed, peak / 1e6))
+
+    def playback_outputs(loops=2000):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            channels_file = os.path.join(tmp_dir, 'channels')
+            Benchmarks._write_channels_file(channels_file, 100)
+            radio.PlaybackManager(radio.ClockRadio.get_default_preferences(), None).close() # Loads the modules before measuring
+            for count in (1, 4, 16):
+                prefs = radio.ClockRadio.get_default_preferences()
+                core_radio = radio.CoreRadio(prefs)
+                names = core_radio.load_radio_list(channels_file)
+                tracemalloc.start()
+                manager = radio.PlaybackManager(prefs, core_radio)
+                for i in range(count):
+                    manager.add_output('output{0:d}'.format(i), device='null{0:d}'.format(i), backend='null')
+                    manager.play('output{0:d}'.format(i), names[i % len(names)])
+                memory = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                start_cpu = time.process_time()
+                start_time = time.perf_counter()
+                for i in range(loops):
+                    if i % 10 == 0:
+                        manager.set_volume('output{0:d}'.format(i % count), i % 100)
+                    manager.update()
+                elapsed = time.perf_counter() - start_time
+                cpu = time.process_time() - start_cpu
+                manager.close()
+                print('{0:>8}: {1:.1f} us/update ({2:.1f} us cpu), {3:.1f} kB for the outputs'.format('{0:d} out'.format(count), 1e6 * elapsed / loops, 1e6 * cpu / loops, memory / 1e3))
+
+    def dead_air(polls=2000):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'export')
+            channels = 2
+            size = 2 * channels * radio.PCM_TAP_SAMPLES
+            with open(file_path, 'wb') as f:
+                f.write(bytes(radio.PcmTap.HEADER_SIZE + size))
+            noise = array.array('h', (random.randint(-8000, 8000) for i in range(channels * radio.PCM_TAP_SAMPLES))).tobytes()
+            silence = bytes(size)
+            with open(file_path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as export:
+                tap = radio.PcmTap(file_path)
+                detector = radio.DeadAirDetector(tap)
+                for (name, payload) in (('noise', noise), ('silence', silence)):
+                    export[radio.PcmTap.HEADER_SIZE:] = payload
+                    start_cpu = time.process_time()
+                    for i in range(polls):
+                        struct.pack_into(radio.PcmTap.HEADER_FORMAT, export, 0, channels, size, i + 1)
+                        detector.update(i * radio.PCM_TAP_POLL_INTERVAL)
+                    cpu = (time.process_time() - start_cpu) / polls
+                    print('{0:>8}: {1:.1f} us/poll ({2}), {3:.3f}% cpu at {4:g} polls/s, rms {5:.3f}, dead air {6}'.format(name, 1e6 * cpu, 'numpy' if radio.numpy is not None else 'pure python', 100 * cpu / radio.PCM_TAP_POLL_INTERVAL, 1 / radio.PCM_TAP_POLL_INTERVAL, detector.rms, detector.is_dead_air))
+                    detector.reset()
+                tap.close()
+
+    def audio_meter(seconds=60):
+        if radio.numpy is None:
+            print('needs numpy')
+            return
+        # One tap block per 10 ms of 44.1 kHz stereo audio, the display refreshed at radio.METER_REFRESH_INTERVAL
+        blocks_per_second = 44100 // radio.PCM_TAP_SAMPLES
+        t = radio.numpy.arange(radio.PCM_TAP_SAMPLES) / 44100
+        tone = (8000 * radio.numpy.sin(2 * radio.numpy.pi * 1000 * t)).astype(radio.numpy.int16)
+        block = radio.numpy.stack([tone, tone])
+        analyzer = radio.SpectrumAnalyzer()
+        analyzer.feed(block)
+        analyzer.get_bands() # Loads the fft module before measuring
+        refreshes = 0
+        tracemalloc.start()
+        start_cpu = time.process_time()
+        for i in range(seconds * blocks_per_second):
+            analyzer.feed(block)
+            if i % round(blocks_per_second * radio.METER_REFRESH_INTERVAL) == 0:
+                analyzer.get_bands()
+                refreshes += 1
+        cpu = time.process_time() - start_cpu
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('{0:d} blocks, {1:d} refreshes: {2:.3f}% cpu, {3:.1f} kB peak allocation, bands {4}'.format(seconds * blocks_per_second, refreshes, 100 * cpu / seconds, peak / 1e3, ' '.join('{0:.2f}'.format(band) for band in analyzer.get_bands().tolist())))
+
+    def process_supervisor(helpers=40):
+        supervisor = radio.ProcessSupervisor(kill_timeout=0.5, max_helpers=4)
+        supervisor.install_signal_handler()
+        start_time = time.perf_counter()
+        for i in range(helpers):
+            supervisor.spawn(['true'], 'true', is_helper=True)
+        stubborn = supervisor.spawn(['sh', '-c', 'trap "" TERM; exec sleep 30'], 'stubborn')
+        time.sleep(0.1)
+        supervisor.terminate(stubborn)
+        (updates, update_time, max_children) = (0, 0, 0)
+        while supervisor.get_child_count() > 0 or supervisor.get_queued_count() > 0:
+            max_children = max(max_children, supervisor.get_child_count())
+            update_start = time.perf_counter()
+            supervisor.update()
+            update_time += time.perf_counter() - update_start
+            updates += 1
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - start_time
+        zombies = 0
+        for pid in os.listdir('/proc'):
+            try:
+                with open('/proc/{0}/stat'.format(pid)) as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                if fields[0] == 'Z' and int(fields[1]) == os.getpid():
+                    zombies += 1
+            except (OSError, IndexError, ValueError):
+                pass
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        print('{0:d} helpers (max 4) and 1 child ignoring SIGTERM: {1:.2f} s, spawned {2:d}, reaped {3:d}, killed {4:d}, max {5:d} children, {6:d} zombies, {7:.1f} us/update'.format(helpers, elapsed, supervisor.spawned, supervisor.reaped, supervisor.killed, max_children, zombies, 1e6 * update_time / updates))
+        for (name, (count, mean, longest)) in sorted(supervisor.get_lifetimes().items()):
+            print('{0:>10}: {1:d} reaped, lifetime {2:.3f} s mean, {3:.3f} s max'.format(name, count, mean, longest))
+
+    def metrics(loops=1000000):
+        counter = radio.Metrics.Counter('benchmark_total', 'Benchmark counter')
+        histogram = radio.Metrics.Histogram('benchmark_seconds', 'Benchmark histogram', radio.METRICS_FRAME_BUCKETS)
+        start_time = time.perf_counter()
+        for i in range(loops):
+            counter.inc()
+        inc_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        for i in range(loops):
+            histogram.observe(0.003)
+        observe_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        text = radio.Metrics.render()
+        render_time = time.perf_counter() - start_time
+        exporter = radio.MetricsExporter(port=0)
+        start_time = time.perf_counter()
+        with urllib.request.urlopen('http://{0}:{1:d}/metrics'.format(radio.METRICS_HOST, exporter.get_port())) as response:
+            served = response.read().decode('utf-8')
+        request_time = time.perf_counter() - start_time
+        exporter.close()
+        print('inc {0:.0f} ns, observe {1:.0f} ns, render {2:.2f} ms for {3:d} metrics ({4:d} bytes), http scrape {5:.2f} ms ({6})'.format(1e9 * inc_time / loops, 1e9 * observe_time / loops, 1e3 * render_time, len(radio.Metrics.metrics), len(text), 1e3 * request_time, 'ok' if served.startswith('# HELP') else 'failed'))
+
+    def status_page(loops=100000):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'status')
+            page = radio.StatusPage(file_path)
+            reader = radio.StatusPageReader(file_path)
+            start_time = time.perf_counter()
+            for i in range(loops):
+                page.publish(radio.StatusPage.RUNNING, 0, 40, 100, 40, 0, 'Unchanged', 'Alarm')
+            unchanged_time = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            for i in range(loops):
+                page.publish(radio.StatusPage.RUNNING, 0, i % 100, 100, 40, 0, 'Channel {0:d}'.format(i % 100), 'Alarm')
+            changed_time = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            for i in range(loops):
+                reader.read()
+            read_time = time.perf_counter() - start_time
+            # A writer thread changes the channel and the volume together, a reader must never see them apart
+            stop = threading.Event()
+            def write():
+                i = 0
+                while not stop.is_set():
+                    i += 1
+                    page.publish(radio.StatusPage.RUNNING, 0, i % 100, 100, 40, 0, 'Channel {0:d}'.format(i % 100), 'Alarm')
+            writer = threading.Thread(target=write)
+            writer.start()
+            (reads, torn, failed) = (0, 0, 0)
+            end = time.monotonic() + 1
+            while time.monotonic() < end:
+                status = reader.read()
+                reads += 1
+                if status is None:
+                    failed += 1
+                elif status['playing_channel'] != 'Channel {0:d}'.format(status['radio_volume']):
+                    torn += 1
+            stop.set()
+            writer.join()
+            reader.close()
+            page.close()
+        print('publish {0:.2f} us unchanged, {1:.2f} us changed, read {2:.2f} us; concurrent: {3:d} reads, {4:d} retries, {5:d} failed, {6:d} torn'.format(1e6 * unchanged_time / loops, 1e6 * changed_time / loops, 1e6 * read_time / loops, reads, reader.retries, failed, torn))
+
+    def alarm_simulation():
+        scenarios = [
+            ('7:00 6 weeks, spring DST', datetime.datetime(2026, 3, 10), dict(alarm_time=(7, 0)), 42),
+            ('2:30 spring DST gap', datetime.datetime(2026, 3, 25), dict(alarm_time=(2, 30)), 7),
+            ('1:30 autumn DST fold', datetime.datetime(2026, 10, 20), dict(alarm_time=(1, 30)), 10),
+            ('7:00 no answer', datetime.datetime(2026, 1, 1), dict(answer_delay=None), 28),
+            ('7:00 5% stalled loops', datetime.datetime(2026, 1, 1), dict(stall_probability=0.05, snoozes=3), 365),
+            ('7:00 suspended', datetime.datetime(2026, 3, 10), dict(suspend=True), 42),
+            ('7:00 suspended, slow resume', datetime.datetime(2026, 1, 1), dict(suspend=True, resume_delay=3 * radio.SUSPEND_MARGIN), 365)]
+        for (name, start, settings, days) in scenarios:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                start_time = time.perf_counter()
+                report = AlarmSimulator(tmp_dir, start, **settings).run(days)
+                elapsed = time.perf_counter() - start_time
+            print('{0:>26}: {1:d} days in {2:.1f} ms, fired {fired:d}, missed {missed:d}, snoozes {snoozes:d}, timeouts {timeouts:d}, stalls {stalls:d}, suspends {suspends:d}, jitter {jitter_mean:.2f}/{jitter_max:.2f} s, wake error {wake_error_max:.1f} s'.format(name, days, 1000 * elapsed, **report))
+
+    def stream_cache(sessions=48, session_seconds=1800, seed=1):
+        # The sessions play randomised traces (see StreamCacheSimulator.random_trace), not the
+        # outage model the policy was tuned with. Each session draws its own incident rate and
+        # durations around the profile. All the sessions are measured, the ones the policy is
+        # still learning from included. Fails when the policy gets more underruns than the default
+        profiles = [
+            ('32 kbps, stable', dict(bitrate=32), (0.2, 2)),
+            ('128 kbps, stable', dict(bitrate=128), (0.5, 2)),
+            ('128 kbps, flaky wifi', dict(bitrate=128), (10, 4)),
+            ('320 kbps, flaky wifi', dict(bitrate=320, throughput=1.2), (10, 4))]
+        generator = random.Random(seed)
+        failures = list()
+        for (name, settings, (incidents_per_hour, median_duration)) in profiles:
+            traces = [StreamCacheSimulator.random_trace(session_seconds, incidents_per_hour * generator.uniform(0.5, 2), median_duration * generator.uniform(0.5, 2), sigma=generator.uniform(0.5, 1.5), seed=generator.random()) for session in range(sessions)]
+            bitrate = settings['bitrate']
+            bounds = (radio.STREAM_CACHE_DEFAULT[0], max(radio.STREAM_CACHE_DEFAULT[0], math.ceil(bitrate / 8 * radio.STREAM_CACHE_MAX_SECONDS)))
+            (results, out_of_bounds) = (dict(), 0)
+            for adaptive in (False, True):
+                simulator = StreamCacheSimulator(**settings)
+                entry = dict(bitrate=bitrate) # Announced by the station, see StationScanner
+                measured = list()
+                for trace in traces:
+                    learnt = radio.StreamCachePolicy.get_settings(entry) if adaptive else None
+                    if learnt and not (bounds[0] <= learnt[0] <= bounds[1] and 1 <= learnt[1] <= 99):
+                        out_of_bounds += 1
+                        logging.error('stream cache settings {0} out of bounds for {1}'.format(learnt, name))
+                    cache = learnt or radio.STREAM_CACHE_DEFAULT
+                    (startup, underruns, stalled) = simulator.play(cache, session_seconds, trace=trace)
+                    entry.update(radio.StreamCachePolicy.merge_stats(entry, session_seconds, underruns))
+                    measured.append((cache[0], cache[1], startup, underruns, stalled))
+                results[adaptive] = [sum(values) / len(values) for values in zip(*measured)]
+            for (adaptive, (size, prefill, startup, underruns, stalled)) in results.items():
+                print('{0:>21} {1:>8}: cache {2:4.0f} KB from {3:2.0f}%, startup {4:5.2f} s, {5:4.1f} underruns/h, stalled {6:5.1f} s/h'.format(name, 'adaptive' if adaptive else 'default', size, prefill, startup, 3600 * underruns / session_seconds, 3600 * stalled / session_seconds))
+            print('{0:>21} {1:>8}: cache sizes within {2:d}-{3:d} KB'.format(name, '', *bounds))
+            if out_of_bounds:
+                failures.append('{0}: {1:d} settings out of bounds'.format(name, out_of_bounds))
+            if results[True][3] > results[False][3]:
+                failures.append('{0}: {1:.1f} underruns/h with the adaptive cache, {2:.1f} with the default'.format(name, 3600 * results[True][3] / session_seconds, 3600 * results[False][3] / session_seconds))
+        if failures:
+            raise AssertionError('stream cache policy: ' + '; '.join(failures))
+
+    def scanner(hosts=3, count=40, delay=0.25):
+        (max_concurrency, max_per_host) = (3 * radio.SCAN_MAX_PER_HOST, radio.SCAN_MAX_PER_HOST)
+        simulator = StationServerSimulator(hosts, delay)
+        try:
+            urls = simulator.get_urls('/stream', count)
+            scanner = radio.StationScanner(max_concurrency, max_per_host)
+            start_time = time.perf_counter()
+            results = scanner.scan(urls)
+            elapsed = time.perf_counter() - start_time
+        finally:
+            simulator.close()
+        alive = sum(1 for h in results.values() if h['status'] == radio.StationScanner.Status.alive.name)
+        # Each host serves count requests max_per_host at a time, all hosts in parallel
+        ideal = math.ceil(count / max_per_host) * delay
+        print('{0:d} hosts x {1:d} urls, {2:.2f} s per request: {3:.2f} s (ideal {4:.2f} s), {5:d} alive, peak {6} per host, {7:d} overall'.format(hosts, count, delay, elapsed, ideal, alive, simulator.get_peaks(), simulator.peak_total))
+
+def parse_arguments():
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulations and benchmarks of the radio building blocks')
+    parser.add_argument('names', nargs='*', metavar='NAME', help='the benchmarks to run ({0}), all of them by default'.format(', '.join(Benchmarks.names())))
+    args = parser.parse_args()
+    # Not argparse choices, they reject an empty list
+    for name in args.names:
+        if name not in Benchmarks.names():
+            parser.error('unknown benchmark "{0}"'.format(name))
+    return args
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    logging.basicConfig(filename=radio.LOGGING_FILE, filemode='w', format=radio.LOGGING_FORMAT, level=radio.LOGGING_LEVEL)
+    Benchmarks.run(args.names or Benchmarks.names())
@@ -1,29 +1,133 @@
-'********************************************************************************
-'* The following is a python program that I wrote in order to listen to 		* 
-'* internet radio stations on my old Acer Aspire One netbook running Arch		*
-'* Linux. This program kicked in straight after boot, thus transforming my		*
-'* otherwise useless netbook into a sort of web radio (with alarm clock too!).	*
-'********************************************************************************/
+#********************************************************************************
+#* The following is a python program that I wrote in order to listen to 		* 
+#* internet radio stations on my old Acer Aspire One netbook running Arch		*
+#* Linux. This program kicked in straight after boot, thus transforming my		*
+#* otherwise useless netbook into a sort of web radio (with alarm clock too!).	*
+#********************************************************************************/
  
+import time
+MODULE_LOAD_START = time.monotonic()
+
 import curses
 import curses.ascii
-import curses.panel
 import datetime
 import enum
+import importlib.util
 import itertools
-import json
 import logging
+import math
 import os
-import subprocess
-import time
-import traceback
-import urllib.parse
+import sys
+import threading
+import urllib
+
+LAZY_MODULES = list() # Not loaded yet, see load_lazy_modules()
+
+def lazy_import(name):
+    """Returns a module whose loading is deferred until its first attribute access"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    (parent, _, child) = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    LAZY_MODULES.append(module)
+    return module
+
+def load_lazy_modules(*modules):
+    """Loads the given lazy modules, all of them by default. To be called before starting
+    a thread: LazyLoader is not thread safe before python 3.12, a module being loaded by
+    one thread looks empty to the others"""
+    for module in modules or list(LAZY_MODULES):
+        module.__dict__ # Any attribute access executes the module
+        if module in LAZY_MODULES:
+            LAZY_MODULES.remove(module)
+
+# Not needed before the first frame (or not needed at all, depending on the run mode)
+array = lazy_import('array')
+asyncio = lazy_import('asyncio')
+bisect = lazy_import('bisect')
+collections = lazy_import('collections')
+lazy_import('collections.abc')
+csv = lazy_import('csv')
+hashlib = lazy_import('hashlib')
+json = lazy_import('json')
+marshal = lazy_import('marshal')
+mmap = lazy_import('mmap')
+queue = lazy_import('queue')
+selectors = lazy_import('selectors')
+shutil = lazy_import('shutil')
+signal = lazy_import('signal')
+socket = lazy_import('socket')
+struct = lazy_import('struct')
+subprocess = lazy_import('subprocess')
+tempfile = lazy_import('tempfile')
+lazy_import('curses.panel')
+lazy_import('urllib.parse')
+lazy_import('urllib.request')
+# Optional, the audio levels are computed in pure python without it
+numpy = lazy_import('numpy') if importlib.util.find_spec('numpy') else None
 
 LOGGING_FILE = '.logfile'
 LOGGING_FORMAT = '%(asctime)s %(levelname)s %(message)s'
 LOGGING_LEVEL = logging.DEBUG
 
 PREFERENCES_FILE = '.saved_prefs'
+PREFERENCES_SNAPSHOT_FILE = '.saved_prefs.snapshot'
+PREFERENCES_SNAPSHOT_VERSION = 2
+
+AUDIO_BACKEND = 'mplayer'
+MPLAYER_EXECUTABLE = '/usr/bin/mplayer'
+MPV_EXECUTABLE = '/usr/bin/mpv'
+MPV_IPC_CONNECT_TIMEOUT = 2
+
+PROCESS_KILL_TIMEOUT = 3
+PROCESS_MAX_HELPERS = 2
+PROCESS_LIFETIME_HISTORY = 64
+
+METRICS_HOST = '127.0.0.1'
+METRICS_WRITE_INTERVAL = 15
+METRICS_FRAME_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+METRICS_LATENCY_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+STATUS_PAGE_FILE = None # Not published, a file in a tmpfs of the user such as /run/user/1000/radio-status publishes it
+STATUS_PAGE_MAGIC = b'RSTS'
+STATUS_PAGE_VERSION = 1
+STATUS_PAGE_READ_RETRIES = 100
+
+PLAYBACK_RESTART_DELAY = 2
+PLAYBACK_MAX_RESTARTS = 5
+PLAYBACK_RECOVERY_TIME = 60 # Of playback after a restart, for the restart delay to start over
+RESOLVER_CACHE_TTL = 600
+RESOLVER_TIMEOUT = 5
+RESOLVER_READ_BYTES = 64*1024
+
+STREAM_STATS_HALF_LIFE = 10*3600 # Seconds of listening after which older statistics weigh half
+STREAM_STATS_MIN_SECONDS = 300 # Listening needed before the cache is adapted
+STREAM_UNDERRUN_GAP = 0.5 # Seconds without new pcm blocks counted as an underrun
+STREAM_UNSTABLE_EVENTS = 2 # Underruns and reconnects per hour of the least stable streams
+STREAM_DEFAULT_BITRATE = 128 # kbps, neither observed nor announced
+STREAM_CACHE_MIN_SECONDS = 2
+STREAM_CACHE_MAX_SECONDS = 30
+STREAM_PREFILL_MIN_SECONDS = 0.5
+STREAM_PREFILL_MAX_SECONDS = 8
+STREAM_CACHE_DEFAULT = (320, 20) # KB, prefill percent: mplayer's network cache
+STREAM_CALM_SECONDS = 6*3600 # Listening without underruns or reconnects before the prefill goes below the default
+STREAM_CALM_HALVING = 3600 # Further calm listening after which the prefill halves again
+
+PCM_TAP_SAMPLES = 512
+PCM_TAP_POLL_INTERVAL = 0.1
+DEAD_AIR_THRESHOLD = -50 # dBFS
+DEAD_AIR_DURATION = 15
+DEAD_AIR_WINDOW = 1
+SPECTRUM_BANDS = 8
+SPECTRUM_BLOCKS = 4
+METER_RANGE_DB = 60
 
 BATTERY_STATUS_FILE = '/sys/class/power_supply/BAT0/status'
 BATTERY_CHARGE_FILE = '/sys/class/power_supply/BAT0/capacity'
@@ -39,13 +143,63 @@ SOFTVOL_GAIN = 400
 ALARM_TIME = (0, 0)
 ALARM_ON = False
 ALARM_RINGING_DURATION = 1800
+ALARM_WINDOW = 60
 MAX_SNOOZES = 3
 SNOOZE_DURATION = 600
+ALARM_FALLBACK_MOST_PLAYED = 3
+SUSPEND_MARGIN = 60 # Seconds resumed before the alarm, for the network and the player
+SUSPEND_MIN_DURATION = 300 # Shorter sleeps are not worth a suspend cycle
+SUSPEND_LATE_FIRE = 600 # An alarm passed during a slow resume still fires within this
+SUSPEND_TIMEOUT = 30 # Seconds the main loop waits for rtcwake, not counting the time suspended
+SLEEP_TIMER_DURATIONS = (15*60, 30*60, 45*60, 60*60, 90*60)
+SLEEP_FADE_DURATION = 60
 
 CHANNELS_FILE = 'radio_channels'
+CATALOG_CACHE_FILE = '.catalog_cache'
+HISTORY_FILE = '.history'
+HISTORY_MAX_SIZE = 1024*1024
+HISTORY_MAGIC = b'RHST'
+HISTORY_SAVE_INTERVAL = 3600 # Seconds between two saves of the statistics while recording
 ALARM_CHANNEL = None
 
-CURSES_UPDATE_TIME = 1/60
+SCAN_MAX_CONCURRENCY = 200
+SCAN_MAX_PER_HOST = 4
+SCAN_TIMEOUT = 5
+SCAN_READ_BYTES = 4096
+SCAN_MAX_REDIRECTS = 3
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_READ_SIZE = 64*1024
+IMPORT_MAX_ENTRY_SIZE = 1024*1024
+
+DEAD_CHANNELS_SHOW = 'show'
+DEAD_CHANNELS_MARK = 'mark'
+DEAD_CHANNELS_HIDE = 'hide'
+
+CHANNEL_ORDER_CATALOG = 'catalog'
+CHANNEL_ORDER_MOST_PLAYED = 'most_played'
+
+FAVOURITES_LIST = 'Favourites'
+
+RENDER_ACTIVE_INTERVAL = 1/60
+RENDER_ACTIVE_DURATION = 2
+RENDER_IDLE_INTERVAL = 1/10
+RENDER_BATTERY_INTERVAL = 1/15
+RENDER_LOW_BATTERY_INTERVAL = 1/5
+RENDER_LOW_BATTERY_TICK = 60
+RENDER_MAX_SLEEP = 1
+RENDER_PLAYER_START_SLEEP = 0.02 # While a player is starting, its events are only seen by the loop
+PLAYER_START_TIMEOUT = 30 # After which a player still silent is not considered starting
+RENDER_STATS_INTERVAL = 60
+METER_REFRESH_INTERVAL = 1/10
+METER_WIDTH = 8
+SCREEN_MIN_ROWS = 12
+SCREEN_MIN_COLS = 60
+KEY_REPEAT_INTERVAL = 0.15
+KEY_REPEAT_ACCELERATION_STEP = 4
+KEY_REPEAT_MAX_STEPS = 8
+VOLUME_REPEAT_MAX_STEPS = 2
+PREFERENCES_SAVE_DELAY = 1
 
 UP_ARROW_CH = u"\u25B2"
 DOWN_ARROW_CH = u"\u25BC"
@@ -55,6 +209,8 @@ LIGHT_SHADE_CH = u"\u2591"
 MEDIUM_SHADE_CH = u"\u2592"
 DARK_SHADE_CH = u"\u2593"
 BLACK_DIAMOND_CH = u"\u25C6"
+BALLOT_X_CH = u"\u2717"
+LOWER_BLOCKS_CH = u" \u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
 
 class System:
 
@@ -86,33 +242,771 @@ class System:
             args = ['sudo', '/usr/bin/rtcwake', '-m', 'no', '-s', '{0:d}'.format(seconds)]
         else:
             args = ['sudo', '/usr/bin/rtcwake', '-m', 'disable']
-        subprocess.Popen(args, stdout=subprocess.DEVNULL)
+        ProcessSupervisor.get_default().spawn(args, 'rtcwake', is_helper=True, stdout=subprocess.DEVNULL)
     
     def poweroff():
         args = ['sudo', '/usr/bin/poweroff']
-        subprocess.Popen(args, stdout=subprocess.DEVNULL)
+        ProcessSupervisor.get_default().spawn(args, 'poweroff', is_helper=True, stdout=subprocess.DEVNULL)
+
+    def suspend(seconds):
+        """Suspends to RAM, the RTC resumes the system after seconds. Returns once resumed,
+        False if the system could not be suspended. The monotonic clock stops while suspended,
+        a rtcwake still running after SUSPEND_TIMEOUT of it did not suspend and is stopped"""
+        args = ['sudo', '/usr/bin/rtcwake', '-m', 'mem', '-s', '{0:d}'.format(seconds)]
+        try:
+            process = ProcessSupervisor.get_default().spawn(args, 'rtcwake', stdout=subprocess.DEVNULL)
+            return process.wait(SUSPEND_TIMEOUT) == 0
+        except subprocess.TimeoutExpired:
+            logging.warning('rtcwake still running after {0:g} s, giving up the suspend'.format(SUSPEND_TIMEOUT))
+            ProcessSupervisor.get_default().terminate(process)
+            return False
+        except OSError:
+            logging.exception('could not suspend')
+            return False
+
+    def open_process_fd(pid):
+        """A file descriptor which becomes readable when the process exits, None if not supported"""
+        try:
+            return os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            return None
+
+class ProcessSupervisor:
+
+    """Tracks the child processes. Exited children are reaped by update(), which only
+    looks at them after a SIGCHLD (on every call if the handler could not be installed).
+    Stopped children get SIGTERM, then SIGKILL once the kill timeout is over. Helpers,
+    the short lived system commands, are capped: the ones over the cap wait in a queue"""
+
+    class Child:
+
+        __slots__ = ('process', 'name', 'is_helper', 'start_time', 'kill_time')
+
+        def __init__(self, process, name, is_helper):
+            self.process = process
+            self.name = name
+            self.is_helper = is_helper
+            self.start_time = time.monotonic()
+            self.kill_time = None # Set once terminated, math.inf once killed
+
+    default = None
+    default_lock = threading.Lock()
+
+    def __init__(self, kill_timeout=PROCESS_KILL_TIMEOUT, max_helpers=PROCESS_MAX_HELPERS):
+        self._kill_timeout = kill_timeout
+        self._max_helpers = max_helpers
+        self._children = dict() # pid -> Child
+        self._queued_helpers = collections.deque()
+        self._lifetimes = collections.deque(maxlen=PROCESS_LIFETIME_HISTORY)
+        self._lock = threading.Lock()
+        self._has_signal_handler = False
+        self._reap_pending = False
+        self._next_kill_time = math.inf
+        self.spawned = 0
+        self.reaped = 0
+        self.killed = 0
+
+    def get_default():
+        with ProcessSupervisor.default_lock:
+            if ProcessSupervisor.default is None:
+                ProcessSupervisor.default = ProcessSupervisor()
+        if not ProcessSupervisor.default._has_signal_handler and threading.current_thread() is threading.main_thread():
+            ProcessSupervisor.default.install_signal_handler()
+        return ProcessSupervisor.default
+
+    def install_signal_handler(self):
+        """Only works from the main thread"""
+        try:
+            signal.signal(signal.SIGCHLD, self.on_child_signal)
+            self._has_signal_handler = True
+        except ValueError:
+            logging.warning('could not install the SIGCHLD handler, children will be polled')
+
+    def on_child_signal(self, signum, frame):
+        # Runs between two bytecodes of the main thread, the children are left to update()
+        self._reap_pending = True
+
+    def spawn(self, args, name, is_helper=False, **popen_args):
+        """Starts args through subprocess.Popen. A helper over the cap is queued and None is returned"""
+        with self._lock:
+            if is_helper and self.get_helper_count() >= self._max_helpers:
+                logging.debug('queueing {0} process, {1:d} helpers running'.format(name, self.get_helper_count()))
+                self._queued_helpers.append((args, name, popen_args))
+                return None
+            return self.start(args, name, is_helper, popen_args)
+
+    def start(self, args, name, is_helper, popen_args):
+        process = subprocess.Popen(args, **popen_args)
+        self._children[process.pid] = ProcessSupervisor.Child(process, name, is_helper)
+        self.spawned += 1
+        logging.debug('started {0} process {1:d}'.format(name, process.pid))
+        return process
+
+    def terminate(self, process):
+        """Sends SIGTERM without waiting, SIGKILL follows from update() after the kill timeout"""
+        with self._lock:
+            child = self._children.get(process.pid)
+            if child is None:
+                if process.poll() is None:
+                    process.terminate()
+            elif child.kill_time is None and process.poll() is None:
+                process.terminate()
+                child.kill_time = time.monotonic() + self._kill_timeout
+                self._next_kill_time = min(self._next_kill_time, child.kill_time)
+
+    def update(self):
+        """Reaps the exited children, kills the ones past their timeout, starts the queued helpers.
+        To be called from the main loop"""
+        now = time.monotonic()
+        if self._has_signal_handler and not self._reap_pending and now < self._next_kill_time:
+            return
+        self._reap_pending = False # A signal arriving from now on is seen by the next call
+        with self._lock:
+            next_kill_time = math.inf
+            for (pid, child) in list(self._children.items()):
+                if child.process.poll() is not None:
+                    del self._children[pid]
+                    self.reaped += 1
+                    lifetime = now - child.start_time
+                    self._lifetimes.append((child.name, lifetime, child.process.returncode))
+                    logging.debug('reaped {0} process {1:d} after {2:.1f} s, exit code {3:d}'.format(child.name, pid, lifetime, child.process.returncode))
+                elif child.kill_time is not None and now >= child.kill_time:
+                    logging.warning('{0} process {1:d} still alive {2:g} s after SIGTERM, killing it'.format(child.name, pid, self._kill_timeout))
+                    child.process.kill()
+                    child.kill_time = math.inf
+                    self.killed += 1
+                elif child.kill_time is not None:
+                    next_kill_time = min(next_kill_time, child.kill_time)
+            self._next_kill_time = next_kill_time
+            while self._queued_helpers and self.get_helper_count() < self._max_helpers:
+                (args, name, popen_args) = self._queued_helpers.popleft()
+                try:
+                    self.start(args, name, True, popen_args)
+                except OSError:
+                    logging.exception('could not start {0} process'.format(name))
+
+    def close(self, timeout=PROCESS_KILL_TIMEOUT):
+        """Stops the children but the helpers, which may still have work to do (poweroff),
+        and starts the queued helpers. Waits at most timeout before killing"""
+        with self._lock:
+            while self._queued_helpers:
+                (args, name, popen_args) = self._queued_helpers.popleft()
+                try:
+                    self.start(args, name, True, popen_args)
+                except OSError:
+                    logging.exception('could not start {0} process'.format(name))
+            children = [child for child in self._children.values() if not child.is_helper]
+        for child in children:
+            self.terminate(child.process)
+        deadline = time.monotonic() + timeout
+        for child in children:
+            try:
+                child.process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logging.warning('killing {0} process {1:d} on exit'.format(child.name, child.process.pid))
+                child.process.kill()
+                child.process.wait()
+                self.killed += 1
+        self._reap_pending = True
+        self.update()
+
+    def get_helper_count(self):
+        return sum(1 for child in self._children.values() if child.is_helper)
+
+    def get_child_count(self):
+        return len(self._children)
+
+    def get_queued_count(self):
+        return len(self._queued_helpers)
+
+    def get_children(self):
+        """(pid, name, seconds alive) of the live children"""
+        now = time.monotonic()
+        with self._lock:
+            return [(pid, child.name, now - child.start_time) for (pid, child) in self._children.items()]
+
+    def get_lifetimes(self):
+        """name -> (count, mean, max seconds alive) over the last PROCESS_LIFETIME_HISTORY reaped children"""
+        lifetimes = dict()
+        for (name, lifetime, _) in list(self._lifetimes):
+            lifetimes.setdefault(name, list()).append(lifetime)
+        return dict((name, (len(values), sum(values) / len(values), max(values))) for (name, values) in lifetimes.items())
+
+class Metrics:
+
+    """Process wide registry of counters, gauges and histograms, rendered in the Prometheus
+    text format. Updates are plain attribute updates without any lock: a metric is written
+    by one thread at a time and the exporter may read a value a moment late. Metrics with
+    a function are computed when rendered, they cost nothing on the hot path"""
+
+    class Counter:
+
+        KIND = 'counter'
+
+        def __init__(self, name, help, label=None, function=None):
+            self.name = name
+            self.help = help
+            self.label = label # Name of the only label, values are then kept per label value
+            self.function = function
+            self.value = 0
+            self.values = dict()
+
+        def inc(self, amount=1):
+            self.value += amount
+
+        def inc_label(self, label_value, amount=1):
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+        def samples(self):
+            """(name suffix, value) pairs"""
+            if self.function is not None:
+                value = self.function()
+                values = value if self.label is not None else None
+            else:
+                value = self.value
+                values = self.values
+            if self.label is None:
+                return [('', value)]
+            return [('{{{0}="{1}"}}'.format(self.label, Metrics.escape(label_value)), value) for (label_value, value) in list(values.items())]
+
+    class Gauge(Counter):
+
+        KIND = 'gauge'
+
+        def set(self, value):
+            self.value = value
+
+        def set_label(self, label_value, value):
+            self.values[label_value] = value
+
+    class Histogram:
+
+        KIND = 'histogram'
+
+        def __init__(self, name, help, buckets):
+            self.name = name
+            self.help = help
+            self.buckets = tuple(buckets)
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.sum = 0
+
+        def observe(self, value):
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+        def samples(self):
+            samples = list()
+            total = 0
+            for (bound, count) in zip(self.buckets + (math.inf,), list(self.counts)):
+                total += count
+                samples.append(('_bucket{{le="{0}"}}'.format(Metrics.format_value(bound)), total))
+            samples += [('_sum', self.sum), ('_count', total)]
+            return samples
+
+    uptime = Gauge('radio_uptime_seconds', 'Time since the program started', function=lambda: time.monotonic() - MODULE_LOAD_START)
+    loop_iterations = Counter('radio_loop_iterations_total', 'Iterations of the GUI main loop')
+    frame_seconds = Histogram('radio_frame_seconds', 'Time spent drawing a frame', METRICS_FRAME_BUCKETS)
+    player_spawns = Counter('radio_player_spawns_total', 'Audio players started', 'backend')
+    stream_reconnects = Counter('radio_stream_reconnects_total', 'Streams restarted after their player failed', 'output')
+    stream_underruns = Counter('radio_stream_underruns_total', 'Times the cache of the playing channel ran empty')
+    dead_air = Counter('radio_dead_air_total', 'Times the playing channel went silent')
+    stream_uptime = Gauge('radio_stream_uptime_seconds', 'Time since the stream of the playing channel started', 'channel')
+    alarm_fire_latency = Histogram('radio_alarm_fire_latency_seconds', 'Delay between the alarm time and the alarm firing', METRICS_LATENCY_BUCKETS)
+    preference_writes = Counter('radio_preference_writes_total', 'Preference files written')
+    battery_charge = Gauge('radio_battery_charge_percent', 'Battery charge, -1 if unknown')
+    battery_charge.set(-1)
+    child_processes = Gauge('radio_child_processes', 'Live child processes', function=lambda: Metrics.get_supervisor_value('children'))
+    child_processes_reaped = Counter('radio_child_processes_reaped_total', 'Child processes reaped', function=lambda: Metrics.get_supervisor_value('reaped'))
+    child_processes_killed = Counter('radio_child_processes_killed_total', 'Child processes killed after ignoring SIGTERM', function=lambda: Metrics.get_supervisor_value('killed'))
+    suspends = Counter('radio_suspends_total', 'Suspends to RAM until the next alarm')
+    metrics = [uptime, loop_iterations, frame_seconds, player_spawns, stream_reconnects, stream_underruns, dead_air, stream_uptime, alarm_fire_latency, preference_writes, battery_charge, child_processes, child_processes_reaped, child_processes_killed, suspends] # Rendered in this order
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def format_value(value):
+        if value == math.inf:
+            return '+Inf'
+        return '{0:d}'.format(value) if isinstance(value, int) else '{0:.6g}'.format(value)
+
+    def render():
+        lines = list()
+        for metric in Metrics.metrics:
+            try:
+                samples = metric.samples()
+            except Exception:
+                logging.exception('could not collect metric {0}'.format(metric.name))
+                continue
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.KIND))
+            for (suffix, value) in samples:
+                lines.append('{0}{1} {2}'.format(metric.name, suffix, Metrics.format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def get_supervisor_value(name):
+        supervisor = ProcessSupervisor.default
+        if supervisor is None:
+            return 0
+        return supervisor.get_child_count() if name == 'children' else getattr(supervisor, name)
+
+class MetricsExporter:
+
+    """Serves the metrics on http://METRICS_HOST:port/metrics and/or writes them to a textfile
+    collector path every METRICS_WRITE_INTERVAL, atomically through a temporary file renamed
+    over it. Both run on daemon threads, the main loop only pays for the metric updates"""
+
+    def __init__(self, port=None, textfile_path=None, interval=METRICS_WRITE_INTERVAL):
+        self._server = None
+        self._textfile_path = textfile_path
+        self._interval = interval
+        self._stop_event = threading.Event()
+        if port is not None:
+            self.start_server(port)
+        if textfile_path:
+            load_lazy_modules()
+            threading.Thread(target=self.write_loop, name='metrics-textfile', daemon=True).start()
+
+    def start_server(self, port):
+        import http.server
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] not in ('/', '/metrics'):
+                    handler.send_error(404)
+                    return
+                body = Metrics.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+            def log_message(handler, format, *args):
+                logging.debug('metrics request: {0}'.format(format % args))
+        try:
+            self._server = http.server.HTTPServer((METRICS_HOST, port), RequestHandler)
+        except OSError:
+            logging.exception('could not serve the metrics on port {0:d}'.format(port))
+            return
+        load_lazy_modules()
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        logging.info('serving metrics on http://{0}:{1:d}/metrics'.format(METRICS_HOST, self.get_port()))
+
+    def get_port(self):
+        return self._server.server_address[1] if self._server else None
+
+    def write_loop(self):
+        while not self._stop_event.wait(self._interval):
+            self.write_textfile()
+
+    def write_textfile(self):
+        try:
+            MetricsExporter.write_file_atomically(Metrics.render(), self._textfile_path)
+        except OSError:
+            logging.exception('could not write the metrics to "{0}"'.format(self._textfile_path))
+
+    def write_file_atomically(text, file_path):
+        directory = os.path.dirname(os.path.abspath(file_path))
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, prefix='.metrics-', delete=False) as f:
+            f.write(text)
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, file_path)
+
+    def close(self):
+        self._stop_event.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._textfile_path:
+            self.write_textfile()
+
+    def get_default_preferences():
+        result = dict()
+        result['Metrics.Port'] = None
+        result['Metrics.TextfilePath'] = None
+        return result
+
+class StatusPage:
+
+    """Publishes the state of the clock radio in a fixed layout record of a memory mapped
+    file, for other local programs. The header holds a sequence number: odd while the
+    record is being written, bumped to the next even value once it is complete (seqlock).
+    The record is only rewritten when a value changed"""
+
+    HEADER_FORMAT = '=4sHHQ' # Magic, layout version, record size, sequence number
+    SEQUENCE_OFFSET = 8
+    RECORD_FORMAT = '=dIIiiiid128s128s' # Update time, pid, flags, alarm state, radio volume, radio max volume, alarm volume, next alarm time, playing channel, alarm channel
+    HEADER_SIZE = 16
+    RECORD_SIZE = 296
+
+    RUNNING = 1
+    PLAYING = 2
+    ALARM_ON = 4
+    DEAD_AIR = 8
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, StatusPage.HEADER_SIZE + StatusPage.RECORD_SIZE)
+            self._mmap = mmap.mmap(fd, StatusPage.HEADER_SIZE + StatusPage.RECORD_SIZE)
+        finally:
+            os.close(fd)
+        # A reader left from a previous run keeps its mapping, the sequence goes on from where it was
+        (magic, version, size, sequence) = struct.unpack_from(StatusPage.HEADER_FORMAT, self._mmap, 0)
+        self._sequence = sequence + (sequence & 1) if (magic, version, size) == (STATUS_PAGE_MAGIC, STATUS_PAGE_VERSION, StatusPage.RECORD_SIZE) else 0
+        struct.pack_into(StatusPage.HEADER_FORMAT, self._mmap, 0, STATUS_PAGE_MAGIC, STATUS_PAGE_VERSION, StatusPage.RECORD_SIZE, self._sequence)
+        self._values = None
+        logging.info('publishing the status to "{0}"'.format(file_path))
+
+    def publish(self, flags, alarm_state, radio_volume, radio_max_volume, alarm_volume, next_alarm, playing_channel, alarm_channel):
+        """next_alarm is a timestamp, 0 if none. Returns False if nothing changed"""
+        values = (os.getpid(), flags, alarm_state, radio_volume, radio_max_volume, alarm_volume, next_alarm, StatusPage.encode_string(playing_channel), StatusPage.encode_string(alarm_channel))
+        if values == self._values:
+            return False
+        self._values = values
+        record = struct.pack(StatusPage.RECORD_FORMAT, time.time(), *values)
+        struct.pack_into('=Q', self._mmap, StatusPage.SEQUENCE_OFFSET, self._sequence + 1)
+        self._mmap[StatusPage.HEADER_SIZE:] = record
+        self._sequence += 2
+        struct.pack_into('=Q', self._mmap, StatusPage.SEQUENCE_OFFSET, self._sequence)
+        return True
+
+    def encode_string(value):
+        # Cut on a character boundary, the record has room for 127 bytes and the terminating zero
+        return (value or '').encode('utf-8')[:127].decode('utf-8', 'ignore').encode('utf-8')
+
+    def close(self):
+        """Leaves the last state in place with the running flag cleared"""
+        if self._values is not None:
+            values = list(self._values)
+            values[1] &= ~StatusPage.RUNNING
+            self.publish(values[1], *values[2:7], *(value.decode('utf-8') for value in values[7:]))
+        self._mmap.close()
+
+    def get_default_preferences():
+        result = dict()
+        result['StatusPage.File'] = STATUS_PAGE_FILE
+        return result
+
+class StatusPageReader:
+
+    """Reads the record of a StatusPage. Once the file is mapped, a read is a copy of the
+    record between two reads of the sequence number, retried while they differ"""
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._mmap = None
+        self.retries = 0
+
+    def open(self):
+        if self._mmap is None:
+            try:
+                with open(self._file_path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), StatusPage.HEADER_SIZE + StatusPage.RECORD_SIZE, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return False
+        return True
+
+    def read(self):
+        """The published state as a dict, None if there is none or it could not be read consistently"""
+        if not self.open():
+            return None
+        (magic, version, size, _) = struct.unpack_from(StatusPage.HEADER_FORMAT, self._mmap, 0)
+        if (magic, version, size) != (STATUS_PAGE_MAGIC, STATUS_PAGE_VERSION, StatusPage.RECORD_SIZE):
+            return None
+        for attempt in range(STATUS_PAGE_READ_RETRIES):
+            (sequence,) = struct.unpack_from('=Q', self._mmap, StatusPage.SEQUENCE_OFFSET)
+            record = self._mmap[StatusPage.HEADER_SIZE:]
+            if sequence & 1 == 0 and struct.unpack_from('=Q', self._mmap, StatusPage.SEQUENCE_OFFSET)[0] == sequence:
+                return StatusPageReader.decode(record, sequence) if sequence > 0 else None
+            self.retries += 1
+            time.sleep(0) # Only when the writer is in the middle of an update, lets it finish
+        return None
+
+    def decode(record, sequence):
+        (update_time, pid, flags, alarm_state, radio_volume, radio_max_volume, alarm_volume, next_alarm, playing_channel, alarm_channel) = struct.unpack(StatusPage.RECORD_FORMAT, record)
+        return {
+            'sequence': sequence,
+            'update_time': update_time,
+            'pid': pid,
+            'running': bool(flags & StatusPage.RUNNING),
+            'playing': bool(flags & StatusPage.PLAYING),
+            'alarm_on': bool(flags & StatusPage.ALARM_ON),
+            'dead_air': bool(flags & StatusPage.DEAD_AIR),
+            'alarm_state': ClockRadio.AlarmState(alarm_state).name if alarm_state >= 0 else None,
+            'radio_volume': radio_volume,
+            'radio_max_volume': radio_max_volume,
+            'alarm_volume': alarm_volume,
+            'next_alarm': next_alarm or None,
+            'playing_channel': playing_channel.rstrip(b'\0').decode('utf-8') or None,
+            'alarm_channel': alarm_channel.rstrip(b'\0').decode('utf-8') or None}
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+class Clock:
+
+    """Wall and monotonic time of the clock radio, SimulatedClock fast-forwards it"""
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def resolve(self, local_datetime):
+        """The wall time at which local_datetime happens, times skipped by a DST change move forward"""
+        return datetime.datetime.fromtimestamp(local_datetime.timestamp())
+
+    def seconds_until(self, local_datetime):
+        return local_datetime.timestamp() - time.time()
+
+class SimulatedClock(Clock):
+
+    """Clock of a simulation in the given time zone, only moved by advance()"""
+
+    def __init__(self, start, time_zone):
+        import zoneinfo
+        self._time_zone = zoneinfo.ZoneInfo(time_zone)
+        self._start = start.replace(tzinfo=self._time_zone).timestamp()
+        self._time = self._start
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self._time, self._time_zone).replace(tzinfo=None)
+
+    def monotonic(self):
+        return self._time - self._start
+
+    def resolve(self, local_datetime):
+        return datetime.datetime.fromtimestamp(local_datetime.replace(tzinfo=self._time_zone).timestamp(), self._time_zone).replace(tzinfo=None)
+
+    def seconds_until(self, local_datetime):
+        return local_datetime.replace(tzinfo=self._time_zone).timestamp() - self._time
+
+    def advance(self, seconds):
+        self._time += seconds
+
+class SimulatedSystem(System):
+
+    """System of a simulation, wake up requests are recorded instead of programming the RTC.
+    A suspend moves the clock, if set, to the resume plus the resume delay"""
+
+    wake_requests = list()
+    suspend_requests = list()
+    clock = None
+    resume_delay = 0
+
+    def set_wake_time_after_seconds(seconds):
+        SimulatedSystem.wake_requests.append(seconds)
+
+    def poweroff():
+        pass
+
+    def suspend(seconds):
+        SimulatedSystem.suspend_requests.append(seconds)
+        if SimulatedSystem.clock:
+            SimulatedSystem.clock.advance(seconds + SimulatedSystem.resume_delay)
+        return True
         
+class StartupProfiler:
+
+    """Startup timing breakdown, relative to the process start"""
+
+    process_start = None
+    marks = list()
+
+    def get_process_start():
+        """Process start time on the time.monotonic() scale, falls back to the module load start"""
+        if StartupProfiler.process_start is None:
+            StartupProfiler.process_start = MODULE_LOAD_START
+            try:
+                with open('/proc/self/stat', 'r') as f:
+                    start_ticks = int(f.read().rpartition(')')[2].split()[19])
+                with open('/proc/uptime', 'r') as f:
+                    uptime = float(f.readline().split()[0])
+                process_age = uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+                StartupProfiler.process_start = min(MODULE_LOAD_START, time.monotonic() - process_age)
+            except (OSError, ValueError, IndexError) as err:
+                logging.warning('could not read the process start time: {0}'.format(err))
+        return StartupProfiler.process_start
+
+    def mark(name):
+        """Records the first occurrence of a startup milestone, returns True if it is new"""
+        if name in (n for (n, t) in StartupProfiler.marks):
+            return False
+        StartupProfiler.marks.append((name, time.monotonic()))
+        return True
+
+    def report():
+        start = StartupProfiler.get_process_start()
+        previous = start
+        steps = list()
+        for (name, t) in sorted(StartupProfiler.marks, key=lambda m: m[1]):
+            steps.append('{0} {1:.3f} s (+{2:.3f})'.format(name, t - start, t - previous))
+            previous = t
+        logging.info('startup timing: {0}'.format(', '.join(steps)))
+
 class Preferences:
 
-    """Application wide preferences with file load/save functionalities"""
+    """Application wide preferences with file load/save functionalities
+
+    Keys are namespaced by section ('CoreRadio.StartVolume' belongs to 'CoreRadio'),
+    only the sections changed since the last save are encoded again. The optional
+    snapshot holds the file values as one marshal dump per section, valid while the
+    file is unchanged. It is mapped at load, a section is decoded on the first access
+    to one of its keys.
+    """
+
+    class Snapshot:
+
+        """Memory mapped snapshot: a length prefixed marshal header (version, file
+        signature, section -> (offset, length)) followed by the sections"""
+
+        HEADER_SIZE = struct.Struct('<I')
+
+        def __init__(self, snapshot_path):
+            with open(snapshot_path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                (size,) = Preferences.Snapshot.HEADER_SIZE.unpack_from(self._map)
+                self._data_offset = Preferences.Snapshot.HEADER_SIZE.size + size
+                (self.version, self.signature, self.sections) = marshal.loads(self._map[Preferences.Snapshot.HEADER_SIZE.size:self._data_offset])
+            except:
+                self.close()
+                raise
+
+        def read(self, section):
+            (offset, length) = self.sections[section]
+            start = self._data_offset + offset
+            return marshal.loads(self._map[start:start + length])
+
+        def close(self):
+            self._map.close()
 
-    def __init__(self, default_values, preferences_file):
+        def write(sections, signature, snapshot_path):
+            (index, blobs, offset) = (dict(), list(), 0)
+            for (section, section_values) in sections.items():
+                blobs.append(marshal.dumps(section_values))
+                index[section] = (offset, len(blobs[-1]))
+                offset += len(blobs[-1])
+            header = marshal.dumps((PREFERENCES_SNAPSHOT_VERSION, signature, index))
+            tmp_path = '{0}.tmp'.format(snapshot_path)
+            with open(tmp_path, 'wb') as f:
+                f.write(Preferences.Snapshot.HEADER_SIZE.pack(len(header)))
+                f.write(header)
+                for blob in blobs:
+                    f.write(blob)
+            os.replace(tmp_path, snapshot_path)
+
+    def __init__(self, default_values, preferences_file, deferred=False, snapshot_file=None):
         self._prefs_dict = dict(default_values)
         self._preferences_file = preferences_file
-        self._prefs_dict.update(Preferences.load_from_file(self._preferences_file))
+        self._snapshot_file = snapshot_file
+        self._dirty_sections = set()
+        self._encoded_sections = dict() # Section name -> (JSON lines, values as read back from JSON)
+        self._snapshot = None
+        self._unread_sections = set() # Of the snapshot, not merged yet
+        self._snapshot_lock = threading.Lock()
+        self._loaded = threading.Event()
+        if deferred:
+            # Only the modules of the loader, the others stay lazy until the first frame
+            load_lazy_modules(json, marshal, mmap, struct)
+            threading.Thread(target=self.merge_from_file, name='preferences-loader', daemon=True).start()
+        else:
+            self.merge_from_file()
 
     def __del__(self):
         pass
 
     def __getitem__(self, key):
+        if not self._loaded.is_set():
+            self.wait_loaded()
+        if self._unread_sections:
+            self.read_section(Preferences.get_section(key))
         return self._prefs_dict[key]
 
     def __setitem__(self, key, val):
-        self._prefs_dict[key] = val
+        if not self._loaded.is_set():
+            self.wait_loaded()
+        if self._unread_sections:
+            self.read_section(Preferences.get_section(key))
+        if key not in self._prefs_dict or self._prefs_dict[key] != val:
+            self._prefs_dict[key] = val
+            self._dirty_sections.add(Preferences.get_section(key))
+
+    def get_section(key):
+        return key.partition('.')[0]
+
+    def split_sections(values):
+        """Returns a dict section -> values of the section"""
+        sections = dict()
+        for (key, value) in values.items():
+            sections.setdefault(Preferences.get_section(key), dict())[key] = value
+        return sections
+
+    def is_dirty(self):
+        return len(self._dirty_sections) > 0 or len(self._encoded_sections) == 0
+
+    def merge_from_file(self):
+        try:
+            if self._snapshot_file:
+                self._snapshot = Preferences.load_from_snapshot(self._snapshot_file, self._preferences_file)
+            if self._snapshot is not None:
+                self._unread_sections = set(self._snapshot.sections)
+            else:
+                values = Preferences.load_from_file(self._preferences_file)
+                if self._snapshot_file and len(values) > 0:
+                    Preferences.save_to_snapshot(Preferences.split_sections(values), self._snapshot_file, self._preferences_file)
+                self._prefs_dict.update(values)
+            StartupProfiler.mark('prefs')
+        finally:
+            # Set even on failure, the readers then get the defaults instead of waiting forever
+            self._loaded.set()
+
+    def wait_loaded(self):
+        self._loaded.wait()
+
+    def read_section(self, section):
+        """Merges the values of the section from the snapshot, if not done yet"""
+        if section not in self._unread_sections:
+            return
+        with self._snapshot_lock:
+            if section in self._unread_sections:
+                self._prefs_dict.update(self._snapshot.read(section))
+                self._unread_sections.discard(section)
+                if not self._unread_sections:
+                    self._snapshot.close()
+                    self._snapshot = None
 
     def save(self):
-        Preferences.save_to_file(self._prefs_dict, self._preferences_file)
-    
+        if not self._loaded.is_set():
+            self.wait_loaded()
+        for section in list(self._unread_sections):
+            self.read_section(section)
+        if not self.is_dirty():
+            logging.debug('preferences unchanged, skipping save')
+            return
+        sections = Preferences.split_sections(self._prefs_dict)
+        for section in sections:
+            if section in self._dirty_sections or section not in self._encoded_sections:
+                self._encoded_sections[section] = Preferences.encode_section(sections[section])
+        for section in list(self._encoded_sections):
+            if section not in sections:
+                del self._encoded_sections[section]
+        self._dirty_sections.clear()
+        text = '{\n' + ',\n'.join(self._encoded_sections[section][0] for section in sorted(sections)) + '\n}'
+        Preferences.save_to_file(text, self._preferences_file)
+        Metrics.preference_writes.inc()
+        if self._snapshot_file:
+            Preferences.save_to_snapshot({section: self._encoded_sections[section][1] for section in sections}, self._snapshot_file, self._preferences_file)
+
+    def encode_section(values):
+        # Same layout as json.dump(indent=2, sort_keys=True) of the whole dict
+        text = json.dumps(values, indent=2, sort_keys=True)[2:-2]
+        return (text, json.loads('{' + text + '}'))
+
     def load_from_file(file_path):
         logging.info('loading preferences from file {0}'.format(file_path))
         result = dict()
@@ -125,20 +1019,311 @@ class Preferences:
             logging.warning('could not load preferences from file: {0}'.format(err))
         return result
 
-    def save_to_file(values, file_path):
+    def save_to_file(text, file_path):
         logging.info('saving preferences to file: {0}'.format(file_path))
+        # Replaced at once, an interrupted save leaves the previous preferences
+        tmp_path = '{0}.tmp'.format(file_path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, file_path)
+
+    def get_file_signature(file_path):
+        stat = os.stat(file_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load_from_snapshot(snapshot_path, file_path):
+        """Returns the mapped snapshot of the file, None if missing or stale"""
+        try:
+            signature = Preferences.get_file_signature(file_path)
+            snapshot = Preferences.Snapshot(snapshot_path)
+        except (OSError, ValueError, EOFError, TypeError, struct.error) as err:
+            logging.debug('could not load preferences snapshot: {0}'.format(err))
+            return None
+        if snapshot.version != PREFERENCES_SNAPSHOT_VERSION or tuple(snapshot.signature) != signature:
+            logging.debug('preferences snapshot is stale')
+            snapshot.close()
+            return None
+        logging.info('mapped preferences snapshot {0}'.format(snapshot_path))
+        return snapshot
+
+    def save_to_snapshot(sections, snapshot_path, file_path):
+        try:
+            Preferences.Snapshot.write(sections, Preferences.get_file_signature(file_path), snapshot_path)
+        except (OSError, ValueError) as err:
+            logging.warning('could not save preferences snapshot: {0}'.format(err))
+
+class CatalogCache:
+
+    """Per url channel metadata (health, codec, bitrate...) with file load/save functionalities"""
+
+    def __init__(self, cache_file):
+        self._cache_file = cache_file
+        self._entries = CatalogCache.load_from_file(self._cache_file)
+        self._modified = False
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def get(self, url):
+        return self._entries.get(url, dict())
+
+    def update(self, url, values):
+        self._entries.setdefault(url, dict()).update(values)
+        self._modified = True
+
+    def is_dead(self, url):
+        return self.get(url).get('status') == StationScanner.Status.dead.name
+
+    def is_modified(self):
+        return self._modified
+
+    def save(self):
+        CatalogCache.save_to_file(self._entries, self._cache_file)
+        self._modified = False
+
+    def load_from_file(file_path):
+        logging.info('loading catalog cache from file {0}'.format(file_path))
+        result = dict()
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                result.update(json.load(f))
+        except ValueError as err:
+            logging.warning('could not parse catalog cache from file: {0}'.format(err))
+        except OSError as err:
+            logging.warning('could not load catalog cache from file: {0}'.format(err))
+        return result
+
+    def save_to_file(values, file_path):
+        logging.info('saving catalog cache to file: {0}'.format(file_path))
         with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(values, f, indent=2, sort_keys=True)
+            json.dump(values, f, indent=1, sort_keys=True)
+
+class ListeningHistory:
+
+    """Append-only binary log of playback events with incrementally maintained statistics
+
+    The log is a header (magic, generation) followed by records of time, event, value
+    and channel name. When it grows past max_size the oldest half is dropped, the
+    statistics are not: they are saved aside with the log offset they account for, so
+    loading only replays the records appended after the last save. They are saved on
+    compaction, on close and every HISTORY_SAVE_INTERVAL while recording.
+    """
+
+    class Event(enum.Enum):
+        play = 0
+        stop = 1
+        volume = 2
+        alarm = 3
+
+    def __init__(self, history_file, max_size=HISTORY_MAX_SIZE):
+        self._history_file = history_file
+        self._stats_file = '{0}.stats'.format(history_file)
+        self._max_size = max_size
+        self._header = struct.Struct('<4sI')
+        self._record = struct.Struct('<dBiH')
+        self._generation = 0
+        self._channels = dict() # Channel name -> [play count, listening seconds]
+        self._days = dict() # ISO date -> listening seconds
+        self._session = None # (channel name, start time) of the current listening session
+        self._last_time = None # Of the last record
+        self._offset = 0
+        self._file = None
+        self._save_time = time.monotonic()
+        self.load()
+
+    def load(self):
+        stats = ListeningHistory.load_stats(self._stats_file)
+        try:
+            with open(self._history_file, 'rb') as f:
+                (magic, self._generation) = self._header.unpack(f.read(self._header.size))
+                if magic != HISTORY_MAGIC:
+                    raise ValueError('unknown file format')
+                size = os.fstat(f.fileno()).st_size
+                if stats and stats['generation'] == self._generation and stats['offset'] <= size:
+                    self.set_stats(stats)
+                else:
+                    logging.warning('history statistics are out of date, rebuilding them from the log')
+                    self._offset = self._header.size
+                f.seek(self._offset)
+                tail = f.read()
+        except (OSError, ValueError, struct.error) as err:
+            logging.info('starting a new history: {0}'.format(err))
+            if stats:
+                self.set_stats(stats)
+            self._generation = stats['generation'] + 1 if stats else 0
+            self.end_orphan_session()
+            self.write_log(b'')
+            return
+        self.replay(tail)
+        if self._offset < size:
+            os.truncate(self._history_file, self._offset) # Drops a record truncated by a crash while appending
+        self.end_orphan_session()
+
+    def end_orphan_session(self):
+        """Ends a session left open by a crash or a kill at the last record, the
+        listening is not known to have lasted any longer"""
+        if self._session:
+            logging.info('ending the listening session of {0} left open at exit'.format(self._session[0]))
+            self.end_session(self._last_time)
+
+    def set_stats(self, stats):
+        self._channels = stats['channels']
+        self._days = stats['days']
+        self._session = tuple(stats['session']) if stats['session'] else None
+        self._last_time = stats.get('last_time', self._session and self._session[1])
+        self._offset = stats['offset']
+
+    def replay(self, data):
+        """Applies the records of data, read from the current offset of the log"""
+        position = 0
+        while position + self._record.size <= len(data):
+            (timestamp, event, value, name_size) = self._record.unpack_from(data, position)
+            name_start = position + self._record.size
+            if name_start + name_size > len(data):
+                break
+            name = data[name_start:name_start+name_size].decode('utf-8')
+            self.apply(timestamp, ListeningHistory.Event(event), value, name)
+            position = name_start + name_size
+        self._offset += position
+
+    def write_log(self, records):
+        tmp_path = '{0}.tmp'.format(self._history_file)
+        with open(tmp_path, 'wb') as f:
+            f.write(self._header.pack(HISTORY_MAGIC, self._generation))
+            f.write(records)
+        os.replace(tmp_path, self._history_file)
+        self._offset = self._header.size + len(records)
+        self.save()
+
+    def record(self, event, value=0, name=''):
+        timestamp = time.time()
+        encoded_name = name.encode('utf-8')
+        data = self._record.pack(timestamp, event.value, value, len(encoded_name)) + encoded_name
+        if self._offset + len(data) > self._max_size:
+            self.compact()
+        if self._file is None:
+            self._file = open(self._history_file, 'ab')
+        self._file.write(data)
+        self._file.flush()
+        self._offset += len(data)
+        self.apply(timestamp, event, value, name)
+        if time.monotonic() - self._save_time >= HISTORY_SAVE_INTERVAL:
+            self.save()
+
+    def compact(self):
+        """Drops the oldest half of the log, statistics are kept"""
+        self.close_log()
+        with open(self._history_file, 'rb') as f:
+            data = f.read()
+        offset = self._header.size
+        while offset + self._record.size <= len(data) and len(data) - offset > self._max_size // 2:
+            offset += self._record.size + self._record.unpack_from(data, offset)[3]
+        logging.info('compacting history, dropping {0:d} bytes'.format(offset - self._header.size))
+        self._generation += 1
+        self.write_log(data[offset:self._offset])
+
+    def apply(self, timestamp, event, value, name):
+        self._last_time = timestamp
+        if event == ListeningHistory.Event.play:
+            self.end_session(timestamp)
+            self._channels.setdefault(name, [0, 0])[0] += 1
+            self._session = (name, timestamp)
+        elif event == ListeningHistory.Event.stop:
+            self.end_session(timestamp)
+
+    def end_session(self, timestamp):
+        if self._session:
+            (name, start) = self._session
+            self._session = None
+            if timestamp > start:
+                self._channels.setdefault(name, [0, 0])[1] += timestamp - start
+                self.add_listening_time(start, timestamp)
+
+    def add_listening_time(self, start, end):
+        # Sessions across midnight are split between days
+        while start < end:
+            day = datetime.date.fromtimestamp(start)
+            next_day = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()).timestamp()
+            day_end = min(end, next_day)
+            self._days[day.isoformat()] = self._days.get(day.isoformat(), 0) + day_end - start
+            start = day_end
+
+    def get_session_time(self, name=None):
+        if self._session and (name is None or self._session[0] == name):
+            return max(0, time.time() - self._session[1])
+        return 0
+
+    def get_listening_time(self, name):
+        return self._channels.get(name, [0, 0])[1] + self.get_session_time(name)
+
+    def get_play_count(self, name):
+        return self._channels.get(name, [0, 0])[0]
+
+    def get_ranking(self):
+        """Channel name -> listening seconds"""
+        result = dict((name, values[1]) for name, values in self._channels.items())
+        if self._session:
+            result[self._session[0]] = result.get(self._session[0], 0) + self.get_session_time()
+        return result
+
+    def get_most_played(self, count=None):
+        ranking = self.get_ranking()
+        return sorted(ranking, key=ranking.get, reverse=True)[:count]
+
+    def get_listening_time_per_day(self, days=None):
+        """(ISO date, listening seconds) of the last days, the current session is not included"""
+        return sorted(self._days.items())[-days if days else None:]
+
+    def save(self):
+        ListeningHistory.save_stats(dict(generation=self._generation, offset=self._offset, channels=self._channels, days=self._days, session=self._session, last_time=self._last_time), self._stats_file)
+        self._save_time = time.monotonic()
+
+    def close(self):
+        self.close_log()
+        self.save()
+
+    def close_log(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def load_stats(file_path):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except OSError:
+            return None
+        except ValueError as err:
+            logging.warning('could not parse history statistics: {0}'.format(err))
+            return None
+
+    def save_stats(values, file_path):
+        tmp_path = '{0}.tmp'.format(file_path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(values, f)
+        os.replace(tmp_path, file_path)
 
 class MPlayer:
 
     """Basic MPlayer wrapper"""
 
-    def __init__(self, softvol_gain, initial_volume):
-        args = ['/usr/bin/mplayer', '-nogui', '-quiet', '-idle', '-slave', '-input', 'nodefault-bindings', '-noconfig', 'all', '-softvol', '-softvol-max', '{0:d}'.format(softvol_gain), '-volume', '{0:d}'.format(initial_volume)]
+    executable = None
+
+    def __init__(self, softvol_gain, initial_volume, device=None, export_file=None, cache=None):
+        args = [MPlayer.find_executable(), '-nogui', '-quiet', '-idle', '-slave', '-input', 'nodefault-bindings', '-noconfig', 'all', '-softvol', '-softvol-max', '{0:d}'.format(softvol_gain), '-volume', '{0:d}'.format(initial_volume)]
+        if device:
+            args += ['-ao', device]
+        if export_file:
+            # The export filter comes before the softvol one, the samples do not depend on the volume
+            args += ['-af', 'export={0}:{1:d}'.format(export_file, PCM_TAP_SAMPLES)]
+        if cache:
+            args += ['-cache', '{0:d}'.format(cache[0]), '-cache-min', '{0:d}'.format(cache[1])]
         logging.info('starting mplayer process with line: "{0}"'.format(' '.join(args)))
-        self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._process = ProcessSupervisor.get_default().spawn(args, 'mplayer', stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
         self._stdin = self._process.stdin
+        self._stdout = self._process.stdout
+        os.set_blocking(self._stdout.fileno(), False)
+        self._output = b''
         logging.info('mplayer process successfully started')
     
     def __del__(self):
@@ -161,56 +1346,1296 @@ class MPlayer:
         self.command('pause')
     
     def stop(self):
-        self._process.terminate()
-    
+        ProcessSupervisor.get_default().terminate(self._process)
+        try:
+            self._stdin.close()
+        except OSError:
+            pass
+        self.close_output()
+
+    def get_output_fd(self):
+        """File descriptor of the output, None once mplayer closed it"""
+        return None if self._stdout is None else self._stdout.fileno()
+
+    def read_lines(self):
+        """The complete lines printed since the last call, never blocks"""
+        while self._stdout is not None:
+            try:
+                data = os.read(self._stdout.fileno(), 65536)
+            except BlockingIOError:
+                break
+            except OSError as err:
+                logging.warning('could not read the mplayer output: {0}'.format(err))
+                data = b''
+            if not data:
+                self.close_output()
+                break
+            self._output += data
+        *lines, self._output = self._output.split(b'\n')
+        return [line.rstrip(b'\r') for line in lines]
+
+    def close_output(self):
+        if self._stdout is not None:
+            self._stdout.close()
+            self._stdout = None
+
     def mute(self, value):
-        self.command('mute {0:d}'.format(val))
+        self.command('mute {0:d}'.format(int(value)))
 
     def volume(self, value, absolute):
         self.command('volume {0:d} {1:d}'.format(value, int(absolute)))
-    
-class RadioChannel:
 
-    """Radio channel data"""
+    def find_executable():
+        if MPlayer.executable is None:
+            MPlayer.executable = shutil.which('mplayer') or MPLAYER_EXECUTABLE
+            logging.info('using mplayer executable {0}'.format(MPlayer.executable))
+        return MPlayer.executable
 
-    def __init__(self, name, url, format=''):
-        if RadioChannel.is_valid_name(name):
-            self._name = name
-        else:
-            raise Exception('No name specified!')
-        if RadioChannel.is_valid_url(url):
-            self._url = url
-        else:
-            raise Exception('Invalid url "{0}"'.format(url))
+class AudioBackend:
 
-    def is_valid_name(name):
-        return name != None
+    """Default implementation for all audio backends. State changes reported by
+    the player are queued as events and delivered by poll() on the caller's thread"""
 
-    def is_valid_url(url):
-        r = None
-        try:
-            r = urllib.parse.urlparse(url)
-        except:
-            pass
+    class Event(enum.Enum):
+        started = 0
+        stopped = 1
+        paused = 2
+        resumed = 3
+        volume_changed = 4
+        mute_changed = 5
+        buffering = 6
+        error = 7
+
+    def __init__(self, softvol_gain, initial_volume, device=None, pcm_tap=False, cache=None):
+        self._softvol_gain = softvol_gain
+        self._volume = initial_volume
+        self._device = device
+        self._is_muted = False
+        self._is_paused = False
+        self._url = None
+        self._event_listener = None
+        self._pending_events = list()
+
+    def __del__(self):
+        pass
+
+    def create(name, softvol_gain, initial_volume, device=None, pcm_tap=False, cache=None):
+        """device is the output of the backend: -ao for mplayer (alsa:device=hw=1.0), --audio-device for mpv (alsa/hw:1,0).
+        pcm_tap asks for a copy of the played samples, see get_pcm_tap(). cache is the stream cache
+        (size in KB, prefill percent, prefill seconds) from StreamCachePolicy, None for the player's default"""
+        backends = {'mplayer': MPlayerBackend, 'mpv': MpvBackend, 'null': NullBackend}
+        if not name in backends:
+            raise Exception('Unknown audio backend "{0}"'.format(name))
+        Metrics.player_spawns.inc_label(name)
+        return backends[name](softvol_gain, initial_volume, device, pcm_tap, cache)
+
+    def set_event_listener(self, listener):
+        self._event_listener = listener
+
+    def emit(self, event, value=None):
+        self._pending_events.append((event, value))
+
+    def poll(self):
+        """Delivers the pending events, to be called from the main loop"""
+        while self._pending_events:
+            (event, value) = self._pending_events.pop(0)
+            if self._event_listener:
+                self._event_listener(event, value)
+
+    def has_pending_events(self):
+        return len(self._pending_events) > 0
+
+    def get_selectables(self):
+        """File descriptors which become readable when poll() has something to do.
+        Without any, the player has to be polled on every loop"""
+        return []
+
+    def play(self, url):
+        self._url = url
+        self._is_paused = False
+
+    def play_stream(self, url):
+        """Plays a url known to be a stream, not a playlist"""
+        self.play(url)
+
+    def stop(self):
+        self._url = None
+
+    def pause(self):
+        self._is_paused = not self._is_paused
+
+    def set_volume(self, value):
+        self._volume = value
+
+    def set_mute(self, flag):
+        self._is_muted = flag
+
+    def get_url(self):
+        return self._url
+
+    def get_volume(self):
+        return self._volume
+
+    def is_muted(self):
+        return self._is_muted
+
+    def is_paused(self):
+        return self._is_paused
+
+    def is_alive(self):
+        return True
+
+    def get_property(self, name):
+        return None
+
+    def get_pcm_tap(self):
+        """PcmTap on the played samples, None if the backend has none"""
+        return None
+
+class MPlayerBackend(AudioBackend):
+
+    """Audio backend on top of the MPlayer slave mode. The stdin pipe gives no
+    feedback, thus the state is the one requested by the last commands. Only the
+    start of the playback is known, from the "Starting playback..." of the output"""
+
+    def __init__(self, softvol_gain, initial_volume, device=None, pcm_tap=False, cache=None):
+        super().__init__(softvol_gain, initial_volume, device)
+        self._pcm_tap = PcmTap(PcmTap.get_temp_path()) if pcm_tap else None
+        self._mplayer = MPlayer(softvol_gain, initial_volume, device, self._pcm_tap and self._pcm_tap.file_path, cache)
+        self._exit_fd = System.open_process_fd(self._mplayer._process.pid)
+        self._was_alive = True
+
+    def play(self, url):
+        # A fresh idle player gets the list appended as it always did, a busy one gets it replaced
+        self._mplayer.loadlist(url, self._url is None)
+        super().play(url)
+
+    def play_stream(self, url):
+        self._mplayer.loadfile(url, False)
+        AudioBackend.play(self, url)
+
+    def stop(self):
+        self._mplayer.stop()
+        if self._exit_fd is not None:
+            os.close(self._exit_fd)
+            self._exit_fd = None
+        if self._pcm_tap:
+            self._pcm_tap.close()
+        super().stop()
+
+    def pause(self):
+        self._mplayer.pause()
+        super().pause()
+        self.emit(AudioBackend.Event.paused if self._is_paused else AudioBackend.Event.resumed)
+
+    def set_volume(self, value):
+        self._mplayer.volume(value, True)
+        super().set_volume(value)
+
+    def set_mute(self, flag):
+        self._mplayer.mute(flag)
+        super().set_mute(flag)
+
+    def is_alive(self):
+        return self._mplayer._process.poll() is None
+
+    def get_selectables(self):
+        return [fd for fd in (self._mplayer.get_output_fd(), self._exit_fd) if fd is not None]
+
+    def get_pcm_tap(self):
+        return self._pcm_tap
+
+    def poll(self):
+        for line in self._mplayer.read_lines():
+            if line.startswith(b'Starting playback') and self._url:
+                self.emit(AudioBackend.Event.started, self._url)
+        if self._was_alive and self._url and not self.is_alive():
+            self._was_alive = False
+            self.emit(AudioBackend.Event.error, 'mplayer exited with code {0}'.format(self._mplayer._process.returncode))
+        super().poll()
+
+class MpvBackend(AudioBackend):
+
+    """Audio backend driving mpv through its JSON IPC socket. Commands carry a
+    request id, state changes come from observed properties, nothing blocks: the
+    socket is connected by poll() once mpv has created it, the commands sent
+    meanwhile are queued"""
+
+    OBSERVED_PROPERTIES = ('pause', 'volume', 'mute', 'paused-for-cache', 'audio-bitrate', 'media-title')
+
+    executable = None
+
+    def __init__(self, softvol_gain, initial_volume, device=None, pcm_tap=False, cache=None):
+        super().__init__(softvol_gain, initial_volume, device)
+        if pcm_tap:
+            logging.warning('no pcm tap with the mpv backend')
+        self._socket_path = os.path.join(tempfile.gettempdir(), 'radio-mpv-{0:d}-{1:x}.sock'.format(os.getpid(), id(self)))
+        args = [MpvBackend.find_executable(), '--idle=yes', '--no-video', '--no-terminal', '--no-config', '--input-ipc-server={0}'.format(self._socket_path), '--volume-max={0:d}'.format(softvol_gain), '--volume={0:g}'.format(self.to_mpv_volume(initial_volume))]
+        if device:
+            args.append('--audio-device={0}'.format(device))
+        if cache:
+            args += ['--cache=yes', '--demuxer-max-bytes={0:d}KiB'.format(cache[0]), '--cache-pause-initial=yes', '--cache-pause-wait={0:g}'.format(cache[2])]
+        logging.info('starting mpv process with line: "{0}"'.format(' '.join(args)))
+        self._process = ProcessSupervisor.get_default().spawn(args, 'mpv', stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._socket = None
+        self._connect_deadline = time.monotonic() + MPV_IPC_CONNECT_TIMEOUT
+        self._outbox = list() # Commands sent before the socket is connected
+        self._exit_fd = System.open_process_fd(self._process.pid)
+        self._buffer = b''
+        self._request_id = 0
+        self._pending_requests = dict()
+        self._properties = dict()
+        for (i, name) in enumerate(MpvBackend.OBSERVED_PROPERTIES):
+            self.command(['observe_property', i + 1, name])
+        logging.info('mpv process successfully started')
+
+    def connect(self):
+        """One connection attempt, returns True once connected. Gives up with an
+        error event when mpv exits or does not create its socket in time"""
+        if self._socket is not None:
+            return True
+        if self._connect_deadline is None:
+            return False # Gave up
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.setblocking(False)
+        try:
+            s.connect(self._socket_path)
+        except (FileNotFoundError, ConnectionRefusedError, BlockingIOError):
+            s.close()
+            if time.monotonic() > self._connect_deadline or self._process.poll() is not None:
+                self._connect_deadline = None
+                ProcessSupervisor.get_default().terminate(self._process)
+                self.emit(AudioBackend.Event.error, 'could not connect to mpv on "{0}"'.format(self._socket_path))
+            return False
+        self._socket = s
+        logging.debug('connected to mpv on "{0}"'.format(self._socket_path))
+        (outbox, self._outbox) = (self._outbox, list())
+        for message in outbox:
+            self.send(message)
+        return True
+
+    def find_executable():
+        if MpvBackend.executable is None:
+            MpvBackend.executable = shutil.which('mpv') or MPV_EXECUTABLE
+            logging.info('using mpv executable {0}'.format(MpvBackend.executable))
+        return MpvBackend.executable
+
+    def to_mpv_volume(self, value):
+        return value * self._softvol_gain / 100
+
+    def from_mpv_volume(self, value):
+        return round(value * 100 / self._softvol_gain)
+
+    def command(self, args, callback=None):
+        """Sends a command without waiting, callback(error, data) is invoked by poll()"""
+        self._request_id += 1
+        if callback:
+            self._pending_requests[self._request_id] = callback
+        logging.debug('mpv command {0:d}: {1}'.format(self._request_id, args))
+        message = (json.dumps({'command': args, 'request_id': self._request_id}) + '\n').encode('utf-8')
+        if self._socket is None:
+            self._outbox.append(message)
+        else:
+            self.send(message)
+
+    def send(self, message):
+        try:
+            self._socket.sendall(message)
+        except OSError as err:
+            self.emit(AudioBackend.Event.error, 'mpv ipc: {0}'.format(err))
+
+    def play(self, url):
+        self.command(['loadfile', url, 'replace'])
+        super().play(url)
+
+    def stop(self):
+        if self._socket is not None:
+            self._socket.close()
+        ProcessSupervisor.get_default().terminate(self._process)
+        if self._exit_fd is not None:
+            os.close(self._exit_fd)
+            self._exit_fd = None
+        try:
+            os.unlink(self._socket_path)
+        except OSError:
+            pass
+        super().stop()
+
+    def pause(self):
+        self.command(['set_property', 'pause', not self._is_paused])
+        super().pause()
+
+    def set_volume(self, value):
+        self.command(['set_property', 'volume', self.to_mpv_volume(value)])
+        super().set_volume(value)
+
+    def set_mute(self, flag):
+        self.command(['set_property', 'mute', flag])
+        super().set_mute(flag)
+
+    def is_alive(self):
+        return self._process.poll() is None
+
+    def get_selectables(self):
+        if self._socket is None:
+            return [] # Polled on every loop until connected
+        return [self._socket.fileno()] + ([] if self._exit_fd is None else [self._exit_fd])
+
+    def get_property(self, name):
+        return self._properties.get(name)
+
+    def poll(self):
+        if not self.connect():
+            super().poll()
+            return
+        try:
+            while True:
+                data = self._socket.recv(65536)
+                if not data:
+                    if self._url:
+                        self.emit(AudioBackend.Event.error, 'mpv closed the ipc socket')
+                        self._url = None
+                    break
+                self._buffer += data
+        except BlockingIOError:
+            pass
+        except OSError as err:
+            if self._url:
+                self.emit(AudioBackend.Event.error, 'mpv ipc: {0}'.format(err))
+                self._url = None
+        *lines, self._buffer = self._buffer.split(b'\n')
+        for line in lines:
+            if line:
+                try:
+                    self.dispatch(json.loads(line.decode('utf-8')))
+                except ValueError as err:
+                    logging.warning('malformed mpv message: {0}'.format(err))
+        super().poll()
+
+    def dispatch(self, message):
+        event = message.get('event')
+        if event is None:
+            callback = self._pending_requests.pop(message.get('request_id'), None)
+            if message.get('error') != 'success':
+                logging.warning('mpv request {0} failed: {1}'.format(message.get('request_id'), message.get('error')))
+            if callback:
+                callback(message.get('error'), message.get('data'))
+        elif event == 'property-change':
+            self.on_property_change(message.get('name'), message.get('data'))
+        elif event == 'playback-restart':
+            self.emit(AudioBackend.Event.started, self._url)
+        elif event == 'end-file':
+            if message.get('reason') == 'error':
+                self.emit(AudioBackend.Event.error, message.get('file_error', 'unknown error'))
+            else:
+                self.emit(AudioBackend.Event.stopped, message.get('reason'))
+
+    def on_property_change(self, name, value):
+        self._properties[name] = value
+        if value is None:
+            return
+        if name == 'pause':
+            self._is_paused = value
+            self.emit(AudioBackend.Event.paused if value else AudioBackend.Event.resumed)
+        elif name == 'volume':
+            self._volume = self.from_mpv_volume(value)
+            self.emit(AudioBackend.Event.volume_changed, self._volume)
+        elif name == 'mute':
+            self._is_muted = value
+            self.emit(AudioBackend.Event.mute_changed, value)
+        elif name == 'paused-for-cache':
+            self.emit(AudioBackend.Event.buffering, value)
+
+class NullBackend(AudioBackend):
+
+    """Audio backend which plays nothing, for tests and benchmarks. Records the received commands"""
+
+    def __init__(self, softvol_gain, initial_volume, device=None, pcm_tap=False, cache=None):
+        super().__init__(softvol_gain, initial_volume, device)
+        self.cache = cache
+        self.commands = list()
+        self._is_alive = True
+
+    def play(self, url):
+        self.commands.append(('play', url))
+        super().play(url)
+        self.emit(AudioBackend.Event.started, url)
+
+    def stop(self):
+        self.commands.append(('stop',))
+        self._is_alive = False
+        super().stop()
+
+    def pause(self):
+        self.commands.append(('pause',))
+        super().pause()
+        self.emit(AudioBackend.Event.paused if self._is_paused else AudioBackend.Event.resumed)
+
+    def set_volume(self, value):
+        self.commands.append(('volume', value))
+        super().set_volume(value)
+        self.emit(AudioBackend.Event.volume_changed, value)
+
+    def set_mute(self, flag):
+        self.commands.append(('mute', flag))
+        super().set_mute(flag)
+        self.emit(AudioBackend.Event.mute_changed, flag)
+
+    def is_alive(self):
+        return self._is_alive
+
+class PcmTap:
+
+    """Reads the samples exported by the mplayer export audio filter. The file is memory
+    mapped: a header (channels, payload bytes, write counter) followed by the last block
+    of signed 16 bit samples, one channel after the other. The samples are read in place"""
+
+    HEADER_FORMAT = '=iiQ'
+    HEADER_SIZE = 16
+    counter = itertools.count()
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._fd = None
+        self._mmap = None
+        self._counter = 0
+        self._buffer = None
+
+    def get_temp_path():
+        return os.path.join(tempfile.gettempdir(), 'radio-pcm-{0:d}-{1:d}'.format(os.getpid(), next(PcmTap.counter)))
+
+    def open(self):
+        """The player creates the file once the audio starts, False until then"""
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.file_path, os.O_RDONLY)
+            # The player truncates and grows the file on every new stream, reading past its end would be fatal
+            size = os.fstat(self._fd).st_size
+            if self._mmap is None or len(self._mmap) != size:
+                self.unmap()
+                if size <= PcmTap.HEADER_SIZE:
+                    return False
+                self._mmap = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+                if numpy is not None:
+                    self._buffer = numpy.empty((size - PcmTap.HEADER_SIZE) // 2, dtype=numpy.float32)
+        except OSError:
+            return False
+        return True
+
+    def unmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def close(self):
+        self.unmap()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        try:
+            os.unlink(self.file_path)
+        except FileNotFoundError:
+            pass
+
+    def read_header(self):
+        """(channels, sample count, counter) if a block was written since the last read, None otherwise"""
+        if not self.open():
+            return None
+        (channels, size, counter) = struct.unpack_from(PcmTap.HEADER_FORMAT, self._mmap, 0)
+        if counter == self._counter or channels <= 0 or PcmTap.HEADER_SIZE + size > len(self._mmap):
+            return None
+        self._counter = counter
+        return (channels, size // 2, counter)
+
+    def read_levels(self, analyzer=None):
+        """(rms, peak) of the last written block, between 0 and 1. None if nothing new was written.
+        The block is also given to the SpectrumAnalyzer if any"""
+        header = self.read_header()
+        if header is None:
+            return None
+        (channels, count, _) = header
+        if count == 0:
+            return (0.0, 0.0)
+        if numpy is not None:
+            samples = numpy.frombuffer(self._mmap, dtype=numpy.int16, count=count, offset=PcmTap.HEADER_SIZE)
+            if analyzer is not None:
+                analyzer.feed(samples.reshape(channels, -1))
+            levels = self._buffer[:count]
+            numpy.multiply(samples, 1/32768, out=levels, casting='unsafe')
+            del samples # The mapping can't be closed while a view is alive
+            return ((float(numpy.dot(levels, levels)) / count) ** 0.5, float(max(levels.max(), -levels.min())))
+        with memoryview(self._mmap) as view, view[PcmTap.HEADER_SIZE:PcmTap.HEADER_SIZE + 2*count] as data, data.cast('h') as samples:
+            square = sum(sample * sample for sample in samples)
+            peak = max(max(samples), -min(samples))
+        return ((square / count) ** 0.5 / 32768, peak / 32768)
+
+class DeadAirDetector:
+
+    """Watches the levels of a PcmTap over a sliding window. Dead air is a window RMS below
+    the threshold, or no samples at all, lasting for the silence duration. The tap is read
+    at most every PCM_TAP_POLL_INTERVAL, only the block written last is analysed"""
+
+    def __init__(self, tap, threshold_db=DEAD_AIR_THRESHOLD, duration=DEAD_AIR_DURATION, window=DEAD_AIR_WINDOW, analyzer=None):
+        self._tap = tap
+        self._analyzer = analyzer
+        self._threshold = 10 ** (threshold_db / 20)
+        self._duration = duration
+        self._window = window
+        self._levels = collections.deque()
+        self._silence_start = None
+        self._last_poll = None
+        self.is_dead_air = False
+        self.rms = 0.0
+        self.peak = 0.0
+        self.level = 0.0 # RMS of the last block
+        self.version = 0 # Blocks read so far
+
+    def reset(self):
+        """Forgets the silence so far, e.g. after a pause"""
+        self._levels.clear()
+        self._silence_start = None
+        self._last_poll = None
+        self.is_dead_air = False
+
+    def update(self, now):
+        """Returns True when dead air starts or ends"""
+        if self._last_poll is not None and now - self._last_poll < PCM_TAP_POLL_INTERVAL:
+            return False
+        self._last_poll = now
+        levels = self._tap.read_levels(self._analyzer)
+        if levels:
+            self._levels.append((now, levels[0] * levels[0], levels[1]))
+            self.level = levels[0]
+            self.version += 1
+        while self._levels and self._levels[0][0] <= now - self._window:
+            self._levels.popleft()
+        if self._levels:
+            self.rms = (sum(level[1] for level in self._levels) / len(self._levels)) ** 0.5
+            self.peak = max(level[2] for level in self._levels)
+        else:
+            self.rms = self.peak = self.level = 0.0
+        if self.rms >= self._threshold:
+            self._silence_start = None
+        elif self._silence_start is None:
+            self._silence_start = now
+        is_dead_air = self._silence_start is not None and now - self._silence_start >= self._duration
+        if is_dead_air != self.is_dead_air:
+            self.is_dead_air = is_dead_air
+            return True
+        return False
+
+class SpectrumAnalyzer:
+
+    """Coarse spectrum of the blocks read from a PcmTap, needs numpy. Blocks are mixed down
+    into the rows of a preallocated ring and transformed all at once by get_bands(), which
+    runs at the display refresh rate rather than at the audio one. Bands are log spaced,
+    their levels scaled from -METER_RANGE_DB to 0 dBFS into 0..1"""
+
+    def __init__(self, bands=SPECTRUM_BANDS, blocks=SPECTRUM_BLOCKS, block_size=PCM_TAP_SAMPLES):
+        self._block_size = block_size
+        self._ring = numpy.zeros((blocks, block_size), dtype=numpy.float32)
+        self._window = numpy.hanning(block_size).astype(numpy.float32)
+        self._windowed = numpy.empty_like(self._ring)
+        self._magnitudes = numpy.empty((blocks, block_size // 2 + 1), dtype=numpy.float32)
+        self._average = numpy.empty(block_size // 2 + 1, dtype=numpy.float32)
+        # Band i spans the FFT bins [edges[i], edges[i+1]), the DC bin is left out
+        self._edges = numpy.unique(numpy.geomspace(2, block_size // 2 + 1, bands + 1).astype(numpy.intp))[:-1]
+        self._bands = numpy.zeros(len(self._edges), dtype=numpy.float32)
+        self._row = 0
+        self._version = 0
+        self._bands_version = 0
+
+    def feed(self, block):
+        """block is a (channels, samples) int16 array, only looked at during the call"""
+        if block.shape[1] != self._block_size:
+            return
+        row = self._ring[self._row]
+        numpy.sum(block, axis=0, dtype=numpy.float32, out=row)
+        row *= 1 / (32768 * block.shape[0])
+        self._row = (self._row + 1) % len(self._ring)
+        self._version += 1
+
+    def get_bands(self):
+        """Band levels between 0 and 1, valid until the next call"""
+        if self._bands_version != self._version:
+            self._bands_version = self._version
+            numpy.multiply(self._ring, self._window, out=self._windowed)
+            # rfft has no output argument, its result is the only allocation and happens once per refresh
+            numpy.abs(numpy.fft.rfft(self._windowed, axis=1), out=self._magnitudes, casting='same_kind')
+            numpy.mean(self._magnitudes, axis=0, out=self._average)
+            bands = self._bands
+            numpy.maximum.reduceat(self._average, self._edges, out=bands)
+            # A full scale sine peaks at block_size/4 through the Hann window
+            bands *= 4 / self._block_size
+            numpy.maximum(bands, 1e-9, out=bands)
+            numpy.log10(bands, out=bands)
+            bands *= 20 / METER_RANGE_DB
+            bands += 1
+            numpy.clip(bands, 0, 1, out=bands)
+        return self._bands
+
+class StreamCachePolicy:
+
+    """Player cache of a channel from the statistics of its past streams, kept in the
+    catalog cache: listening seconds, underruns and reconnects, decayed with the listening
+    time, and the observed bitrate. Unstable streams get a larger cache filled further
+    before playing. No stream gets less than mplayer's default cache, and the prefill
+    only goes below the default after STREAM_CALM_SECONDS of listening without incidents,
+    halving again every STREAM_CALM_HALVING: bursty links often stay quiet for hours, an
+    incident brings the default back at once"""
+
+    def merge_stats(entry, seconds=0, underruns=0, reconnects=0, bitrate=None):
+        """Catalog cache values of entry updated with a stream of seconds"""
+        weight = 0.5 ** (seconds / STREAM_STATS_HALF_LIFE)
+        result = dict()
+        result['play_seconds'] = round(entry.get('play_seconds', 0) * weight + seconds, 1)
+        result['underruns'] = round(entry.get('underruns', 0) * weight + underruns, 3)
+        result['reconnects'] = round(entry.get('reconnects', 0) * weight + reconnects, 3)
+        result['calm_seconds'] = 0 if underruns or reconnects else round(entry.get('calm_seconds', 0) + seconds, 1)
+        if bitrate:
+            result['observed_bitrate'] = round(bitrate)
+        return result
+
+    def get_instability(entry):
+        """0 for a stream without incidents, 1 from STREAM_UNSTABLE_EVENTS per hour"""
+        events = entry.get('underruns', 0) + entry.get('reconnects', 0)
+        return min(1, 3600 * events / entry['play_seconds'] / STREAM_UNSTABLE_EVENTS)
+
+    def get_settings(entry):
+        """(size in KB, prefill percent, prefill seconds), None until the channel was listened to for STREAM_STATS_MIN_SECONDS"""
+        if entry.get('play_seconds', 0) < STREAM_STATS_MIN_SECONDS:
+            return None
+        instability = StreamCachePolicy.get_instability(entry)
+        bitrate = entry.get('observed_bitrate') or entry.get('bitrate') or STREAM_DEFAULT_BITRATE
+        cache_seconds = STREAM_CACHE_MIN_SECONDS + instability * (STREAM_CACHE_MAX_SECONDS - STREAM_CACHE_MIN_SECONDS)
+        prefill_seconds = STREAM_PREFILL_MIN_SECONDS + instability * (STREAM_PREFILL_MAX_SECONDS - STREAM_PREFILL_MIN_SECONDS)
+        size = max(STREAM_CACHE_DEFAULT[0], math.ceil(bitrate / 8 * cache_seconds))
+        calm_seconds = entry.get('calm_seconds', 0)
+        halvings = 0 if calm_seconds < STREAM_CALM_SECONDS else 1 + (calm_seconds - STREAM_CALM_SECONDS) // STREAM_CALM_HALVING
+        default_prefill = STREAM_CACHE_DEFAULT[0] * STREAM_CACHE_DEFAULT[1] / 100 * 0.5 ** halvings # KB
+        prefill_seconds = max(prefill_seconds, 8 * default_prefill / bitrate)
+        prefill = min(99, max(1, round(100 * prefill_seconds * bitrate / 8 / size)))
+        return (size, prefill, prefill_seconds)
+
+class RadioChannel:
+
+    """Radio channel data (immutable)"""
+
+    __slots__ = ('_name', '_url')
+
+    def __init__(self, name, url, format=''):
+        if RadioChannel.is_valid_name(name):
+            object.__setattr__(self, '_name', name)
+        else:
+            raise Exception('No name specified!')
+        if RadioChannel.is_valid_url(url):
+            object.__setattr__(self, '_url', url)
+        else:
+            raise Exception('Invalid url "{0}"'.format(url))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('RadioChannel is immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError('RadioChannel is immutable')
+
+    def __eq__(self, other):
+        return isinstance(other, RadioChannel) and self._name == other._name and self._url == other._url
+
+    def __hash__(self):
+        return hash((self._name, self._url))
+
+    def __repr__(self):
+        return 'RadioChannel({0!r}, {1!r})'.format(self._name, self._url)
+
+    def from_trusted(name, url):
+        """Builds a channel from already validated data, skipping the url parsing"""
+        channel = object.__new__(RadioChannel)
+        object.__setattr__(channel, '_name', name)
+        object.__setattr__(channel, '_url', url)
+        return channel
+
+    def is_valid_name(name):
+        return name != None
+
+    def is_valid_url(url):
+        r = None
+        try:
+            r = urllib.parse.urlparse(url)
+        except:
+            pass
         return r != None and r.scheme != '' and r.netloc != '' and r.path != ''
 
+class CatalogImporter:
+
+    """Streams station lists (M3U, PLS, CSV, JSON or name|url) into the channels file
+
+    Entries are validated and written in chunks. Duplicates are detected by the hash of
+    the normalized url, only the hashes of the catalog urls and names are kept in memory."""
+
+    class Format(enum.Enum):
+        channels = 0
+        m3u = 1
+        pls = 2
+        csv = 3
+        json = 4
+
+    def __init__(self, channels_file, chunk_size=IMPORT_CHUNK_SIZE):
+        self._channels_file = channels_file
+        self._chunk_size = chunk_size
+        self._url_hashes = set()
+        self._name_hashes = set()
+        self._needs_newline = False
+        self._progress_listener = None
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.imported_names = None
+
+    def set_progress_listener(self, listener):
+        """listener(bytes_read, total_bytes, imported_channels) is called after each chunk"""
+        self._progress_listener = listener
+
+    def index_catalog(self):
+        try:
+            with open(self._channels_file, 'r', encoding='utf-8') as f:
+                line = ''
+                for line in f:
+                    tokens = line.strip().split('|')
+                    if len(tokens) > 1 and not tokens[0].startswith('#'):
+                        self._name_hashes.add(CatalogImporter.hash_key(tokens[0]))
+                        self._url_hashes.add(CatalogImporter.hash_key(CatalogImporter.normalize_url(tokens[1]) or tokens[1]))
+                self._needs_newline = line != '' and not line.endswith('\n')
+        except OSError as err:
+            logging.info('importing into a new catalog: {0}'.format(err))
+
+    def import_files(self, file_paths, collect_names=False):
+        if collect_names:
+            self.imported_names = list()
+        total_bytes = sum(os.path.getsize(file_path) for file_path in file_paths)
+        done_bytes = 0
+        with open(self._channels_file, 'a', encoding='utf-8') as out:
+            if self._needs_newline:
+                out.write('\n')
+            for file_path in file_paths:
+                file_format = CatalogImporter.guess_format(file_path)
+                logging.info('importing {0} as {1}'.format(file_path, file_format.name))
+                with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+                    entries = getattr(CatalogImporter, 'parse_{0}'.format(file_format.name))(f)
+                    chunk = list()
+                    for entry in entries:
+                        chunk.append(entry)
+                        if len(chunk) >= self._chunk_size:
+                            self.write_chunk(chunk, out)
+                            chunk = list()
+                            self.notify_progress(done_bytes + f.buffer.tell(), total_bytes)
+                    self.write_chunk(chunk, out)
+                done_bytes += os.path.getsize(file_path)
+                self.notify_progress(done_bytes, total_bytes)
+        logging.info('imported {0:d} channel(s), skipped {1:d} duplicate(s) and {2:d} invalid entries'.format(self.imported, self.duplicates, self.invalid))
+
+    def notify_progress(self, done_bytes, total_bytes):
+        if self._progress_listener:
+            self._progress_listener(done_bytes, total_bytes, self.imported)
+
+    def write_chunk(self, chunk, out):
+        lines = list()
+        for (name, url) in chunk:
+            url = CatalogImporter.normalize_url(url)
+            if url is None:
+                self.invalid += 1
+                continue
+            url_hash = CatalogImporter.hash_key(url)
+            if url_hash in self._url_hashes:
+                self.duplicates += 1
+                continue
+            self._url_hashes.add(url_hash)
+            name = self.get_unique_name(CatalogImporter.clean_name(name) or CatalogImporter.clean_name(url))
+            lines.append('{0}|{1}\n'.format(name, url))
+            if self.imported_names is not None:
+                self.imported_names.append(name)
+        out.writelines(lines)
+        self.imported += len(lines)
+
+    def get_unique_name(self, name):
+        unique_name = name
+        name_hash = CatalogImporter.hash_key(unique_name)
+        counter = 1
+        while name_hash in self._name_hashes:
+            counter += 1
+            unique_name = '{0} ({1:d})'.format(name, counter)
+            name_hash = CatalogImporter.hash_key(unique_name)
+        self._name_hashes.add(name_hash)
+        return unique_name
+
+    def clean_name(name):
+        # '|' separates the fields of the channels file
+        return ' '.join(str(name or '').replace('|', ' ').split())
+
+    def normalize_url(url):
+        """Lower case scheme and host, no default port nor fragment. None if the url is not valid"""
+        try:
+            r = urllib.parse.urlsplit(str(url).strip())
+            netloc = r.netloc.lower()
+            if (r.scheme.lower(), r.port) in (('http', 80), ('https', 443)):
+                netloc = netloc.rpartition(':')[0]
+        except ValueError:
+            return None
+        if r.scheme == '' or netloc == '':
+            return None
+        return urllib.parse.urlunsplit((r.scheme.lower(), netloc, r.path or '/', r.query, ''))
+
+    def hash_key(text):
+        return int.from_bytes(hashlib.blake2b(text.encode('utf-8', errors='replace'), digest_size=8).digest(), 'little')
+
+    def guess_format(file_path):
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in ('.m3u', '.m3u8'):
+            return CatalogImporter.Format.m3u
+        elif extension == '.pls':
+            return CatalogImporter.Format.pls
+        elif extension == '.csv':
+            return CatalogImporter.Format.csv
+        elif extension == '.json':
+            return CatalogImporter.Format.json
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            start = f.read(IMPORT_READ_SIZE).lstrip()
+        if start.startswith('#EXTM3U'):
+            return CatalogImporter.Format.m3u
+        elif start.lower().startswith('[playlist]'):
+            return CatalogImporter.Format.pls
+        elif start.startswith('[') or start.startswith('{'):
+            return CatalogImporter.Format.json
+        elif '|' in start.partition('\n')[0]:
+            return CatalogImporter.Format.channels
+        return CatalogImporter.Format.csv
+
+    def parse_channels(f):
+        for line in f:
+            tokens = line.strip().split('|')
+            if len(tokens) > 1 and not tokens[0].startswith('#'):
+                yield (tokens[0], tokens[1])
+
+    def parse_m3u(f):
+        name = None
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                name = line.partition(',')[2]
+            elif line and not line.startswith('#'):
+                yield (name, line)
+                name = None
+
+    def parse_pls(f):
+        # Keys of an entry (FileN, TitleN...) are usually grouped, an entry is complete when the next one starts
+        entries = dict()
+        for line in f:
+            (key, _, value) = line.strip().partition('=')
+            for field in ('file', 'title'):
+                if key.lower().startswith(field) and key[len(field):].isdigit():
+                    index = int(key[len(field):])
+                    entries.setdefault(index, dict())[field] = value
+                    for complete in [i for i in entries if i < index and 'file' in entries[i]]:
+                        entry = entries.pop(complete)
+                        yield (entry.get('title'), entry['file'])
+        for index in sorted(entries):
+            if 'file' in entries[index]:
+                yield (entries[index].get('title'), entries[index]['file'])
+
+    def parse_csv(f):
+        reader = csv.reader(f)
+        first_row = next(reader, [])
+        header = [column.strip().lower() for column in first_row]
+        name_column = next((header.index(c) for c in ('name', 'title', 'station') if c in header), None)
+        url_column = next((header.index(c) for c in ('url_resolved', 'url', 'stream', 'uri') if c in header), None)
+        if url_column is None:
+            # No header, rows are name,url
+            (name_column, url_column) = (0, 1)
+            if len(first_row) > 1:
+                yield (first_row[0], first_row[1])
+        for row in reader:
+            if len(row) > url_column:
+                yield (row[name_column] if name_column is not None and len(row) > name_column else None, row[url_column])
+
+    def parse_json(f):
+        # Incremental decoding of a top level array, at most one entry and one read are buffered
+        decoder = json.JSONDecoder()
+        buffer = ''
+        while True:
+            data = f.read(IMPORT_READ_SIZE)
+            buffer += data
+            position = 0
+            while True:
+                while position < len(buffer) and buffer[position] in ' \t\r\n,[':
+                    position += 1
+                if position >= len(buffer) or buffer[position] == ']':
+                    break
+                try:
+                    (value, position) = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    break # Incomplete entry, needs more data
+                if isinstance(value, dict):
+                    yield (value.get('name') or value.get('title'), value.get('url_resolved') or value.get('url') or value.get('stream') or '')
+            buffer = buffer[position:]
+            if len(buffer) > IMPORT_MAX_ENTRY_SIZE:
+                raise Exception('Invalid JSON entry: {0}...'.format(buffer[:80]))
+            if not data:
+                if buffer.strip() not in ('', ']'):
+                    raise Exception('Truncated JSON entry: {0}...'.format(buffer[:80]))
+                return
+
+class ColumnarChannelStore:
+
+    """Compact channel store: the names and urls of all the channels, utf-8 encoded in
+    one buffer, located by 64 bit offsets and found through an open addressing hash
+    index. No object is kept per channel, names are decoded when read. Offers the
+    same lookup API as the dict of RadioChannel used by CoreRadio"""
+
+    class Names(collections.abc.Sequence):
+
+        """Read only view of the channel names, in order of insertion"""
+
+        def __init__(self, store):
+            self._store = store
+
+        def __len__(self):
+            return len(self._store)
+
+        def __getitem__(self, index):
+            if isinstance(index, slice):
+                return [self._store.get_name(i) for i in range(*index.indices(len(self._store)))]
+            if index < 0:
+                index += len(self._store)
+            if not 0 <= index < len(self._store):
+                raise IndexError('channel index out of range')
+            return self._store.get_name(index)
+
+        def __contains__(self, name):
+            return name in self._store
+
+        def index(self, name, *args):
+            position = self._store.find(name) if isinstance(name, str) else -1
+            if position < 0:
+                raise ValueError('{0!r} is not in the channels'.format(name))
+            return position
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self._name_starts)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and self.find(name) >= 0
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __getitem__(self, name):
+        position = self.find(name)
+        if position < 0:
+            raise KeyError(name)
+        return RadioChannel.from_trusted(name, self.get_url_at(position))
+
+    def __setitem__(self, name, channel):
+        key = name.encode('utf-8')
+        key_hash = hash(key)
+        (position, slot) = self.probe(key, key_hash)
+        if position < 0:
+            position = len(self._name_starts)
+            self._index[slot] = position
+            self._hashes.append(key_hash)
+            self._name_starts.append(0)
+            self._url_starts.append(0)
+            self._url_ends.append(0)
+        # The name ends where the url starts, both are appended again on change and the
+        # old bytes are left unreferenced in the buffer
+        self._name_starts[position] = len(self._data)
+        self._data += key
+        self._url_starts[position] = len(self._data)
+        self._data += channel._url.encode('utf-8')
+        self._url_ends[position] = len(self._data)
+        if 3 * len(self._name_starts) > 2 * len(self._index):
+            self.rebuild_index(2 * len(self._index))
+
+    def probe(self, key, key_hash):
+        """Returns (position of the channel or -1, index slot of the key)"""
+        mask = len(self._index) - 1
+        slot = key_hash & mask
+        while True:
+            position = self._index[slot]
+            if position < 0:
+                return (-1, slot)
+            if self._hashes[position] == key_hash and self._data[self._name_starts[position]:self._url_starts[position]] == key:
+                return (position, slot)
+            slot = (slot + 1) & mask
+
+    def rebuild_index(self, size):
+        self._index = array.array('q', [-1]) * size
+        mask = size - 1
+        for (position, key_hash) in enumerate(self._hashes):
+            slot = key_hash & mask
+            while self._index[slot] >= 0:
+                slot = (slot + 1) & mask
+            self._index[slot] = position
+
+    def find(self, name):
+        """Position of the channel in order of insertion, or -1"""
+        key = name.encode('utf-8')
+        return self.probe(key, hash(key))[0]
+
+    def get_name(self, position):
+        return self._data[self._name_starts[position]:self._url_starts[position]].decode('utf-8')
+
+    def get_url_at(self, position):
+        return self._data[self._url_starts[position]:self._url_ends[position]].decode('utf-8')
+
+    def get_url(self, name):
+        position = self.find(name)
+        if position < 0:
+            raise KeyError(name)
+        return self.get_url_at(position)
+
+    def keys(self):
+        """Channel names in order of insertion (a view, not a copy!)"""
+        return self._names
+
+    def clear(self):
+        self._data = bytearray()
+        self._hashes = array.array('q')
+        self._name_starts = array.array('q')
+        self._url_starts = array.array('q')
+        self._url_ends = array.array('q')
+        self._index = array.array('q', [-1]) * 8
+        self._names = ColumnarChannelStore.Names(self)
+
+class StationScanner:
+
+    """Concurrent health checker for radio channel urls"""
+
+    class Status(enum.Enum):
+        alive = 0
+        dead = 1
+
+    CONTENT_TYPE_CODECS = {
+        'audio/mpeg': 'mp3',
+        'audio/mp3': 'mp3',
+        'audio/aac': 'aac',
+        'audio/aacp': 'aac+',
+        'audio/ogg': 'ogg',
+        'application/ogg': 'ogg',
+        'audio/opus': 'opus',
+        'audio/flac': 'flac',
+        'audio/x-mpegurl': 'm3u',
+        'audio/mpegurl': 'm3u',
+        'application/vnd.apple.mpegurl': 'm3u',
+        'audio/x-scpls': 'pls',
+        'video/x-ms-asf': 'asx',
+    }
+
+    def __init__(self, max_concurrency=SCAN_MAX_CONCURRENCY, max_per_host=SCAN_MAX_PER_HOST, timeout=SCAN_TIMEOUT, read_bytes=SCAN_READ_BYTES):
+        self._max_concurrency = max_concurrency
+        self._max_per_host = max_per_host
+        self._timeout = timeout
+        self._read_bytes = read_bytes
+        self._progress_listener = None
+
+    def set_progress_listener(self, listener):
+        self._progress_listener = listener
+
+    def scan(self, urls):
+        """Checks all the given urls, returns a dict url -> health record"""
+        return asyncio.run(self.scan_async(urls))
+
+    async def scan_async(self, urls):
+        urls = list(dict.fromkeys(urls))
+        logging.info('scanning {0:d} url(s)'.format(len(urls)))
+        self._slots = asyncio.Semaphore(self._max_concurrency)
+        self._host_slots = dict()
+        results = dict()
+        start_time = time.monotonic()
+        tasks = [asyncio.ensure_future(self.check_url(url)) for url in urls]
+        for future in asyncio.as_completed(tasks):
+            (url, health) = await future
+            results[url] = health
+            if self._progress_listener:
+                self._progress_listener(len(results), len(urls))
+        dead_count = sum(1 for h in results.values() if h['status'] == StationScanner.Status.dead.name)
+        logging.info('scanned {0:d} url(s) in {1:.1f} seconds, {2:d} dead'.format(len(urls), time.monotonic() - start_time, dead_count))
+        return results
+
+    async def check_url(self, url):
+        health = dict(status=StationScanner.Status.dead.name, code=None, error=None, latency=None, codec=None, bitrate=None, checked=round(time.time()))
+        start_time = time.monotonic()
+        try:
+            location = url
+            for redirect in range(SCAN_MAX_REDIRECTS + 1):
+                r = urllib.parse.urlsplit(location)
+                # Host slot first: a check queued behind a busy host must not hold a global slot
+                async with self.get_host_slot(r.netloc), self._slots:
+                    (code, headers, body) = await asyncio.wait_for(self.fetch_head(r), self._timeout)
+                if 300 <= code < 400 and 'location' in headers:
+                    location = urllib.parse.urljoin(location, headers['location'])
+                    continue
+                break
+            health['latency'] = round(time.monotonic() - start_time, 3)
+            health['code'] = code
+            health['codec'] = StationScanner.guess_codec(headers, body)
+            health['bitrate'] = StationScanner.guess_bitrate(headers)
+            if not 200 <= code < 300:
+                health['error'] = 'http status {0:d}'.format(code)
+            elif len(body) == 0:
+                health['error'] = 'empty stream'
+            else:
+                health['status'] = StationScanner.Status.alive.name
+        except asyncio.TimeoutError:
+            health['error'] = 'timeout'
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as err:
+            health['error'] = '{0}: {1}'.format(type(err).__name__, err)
+        return (url, health)
+
+    def get_host_slot(self, host):
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self._max_per_host)
+        return self._host_slots[host]
+
+    async def fetch_head(self, r):
+        """Reads the response headers plus the first few KB of the body"""
+        if r.scheme not in ('http', 'https') or not r.hostname:
+            raise ValueError('unsupported url "{0}"'.format(r.geturl()))
+        port = r.port or (443 if r.scheme == 'https' else 80)
+        (reader, writer) = await asyncio.open_connection(r.hostname, port, ssl=(r.scheme == 'https'))
+        try:
+            path = r.path or '/'
+            if r.query:
+                path = '{0}?{1}'.format(path, r.query)
+            request = 'GET {0} HTTP/1.0\r\nHost: {1}\r\nUser-Agent: radio.py\r\nIcy-MetaData: 0\r\nConnection: close\r\n\r\n'.format(path, r.netloc)
+            writer.write(request.encode('ascii'))
+            await writer.drain()
+            status_line = (await reader.readline()).decode('latin-1').split(None, 2)
+            if len(status_line) < 2 or not status_line[1].isdigit():
+                raise ValueError('malformed status line')
+            headers = dict()
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                (key, _, value) = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = b''
+            while len(body) < self._read_bytes:
+                chunk = await reader.read(self._read_bytes - len(body))
+                if not chunk:
+                    break
+                body += chunk
+            return (int(status_line[1]), headers, body)
+        finally:
+            writer.close()
+
+    def guess_codec(headers, body):
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type in StationScanner.CONTENT_TYPE_CODECS:
+            return StationScanner.CONTENT_TYPE_CODECS[content_type]
+        if body.startswith(b'ID3') or (len(body) > 1 and body[0] == 0xFF and body[1] & 0xE0 == 0xE0 and body[1] & 0x06 != 0):
+            return 'mp3'
+        elif len(body) > 1 and body[0] == 0xFF and body[1] & 0xF6 == 0xF0:
+            return 'aac'
+        elif body.startswith(b'OggS'):
+            return 'ogg'
+        elif body.lstrip().lower().startswith(b'[playlist]'):
+            return 'pls'
+        elif body.lstrip().startswith(b'#EXTM3U'):
+            return 'm3u'
+        return None
+
+    def guess_bitrate(headers):
+        bitrate = headers.get('icy-br', '').split(',')[0].strip()
+        return int(bitrate) if bitrate.isdigit() else None
+
+class RadioModel:
+
+    """Observable radio state, updated by ClockRadio/CoreRadio on change and read
+    by the GUI once per value per frame. Updates may come from any thread, the
+    subscribers are notified by dispatch() on the main loop thread"""
+
+    __slots__ = ('radio_volume', 'radio_max_volume', 'playing_channel', 'is_radio_playing', 'dead_air', 'alarm_on', 'alarm_time', 'alarm_volume', 'alarm_max_volume', 'alarm_channel', 'alarm_state', 'channels', 'channel_list', 'catalog_loaded', 'import_progress', 'version', '_listeners', '_changed_keys', '_lock')
+
+    def __init__(self):
+        self.radio_volume = 0
+        self.radio_max_volume = 1
+        self.playing_channel = 0
+        self.is_radio_playing = False
+        self.dead_air = False
+        self.alarm_on = False
+        self.alarm_time = ALARM_TIME
+        self.alarm_volume = 0
+        self.alarm_max_volume = 1
+        self.alarm_channel = None
+        self.alarm_state = None
+        self.channels = list()
+        self.channel_list = None
+        self.catalog_loaded = False
+        self.import_progress = None
+        self.version = 0
+        self._listeners = list()
+        self._changed_keys = set()
+        self._lock = threading.Lock()
+
+    def update(self, **values):
+        changed = [key for (key, value) in values.items() if getattr(self, key) != value]
+        if changed:
+            for key in changed:
+                setattr(self, key, values[key])
+            with self._lock:
+                self._changed_keys.update(changed)
+                self.version += 1
+
+    def subscribe(self, listener):
+        """listener(changed_keys) is called by dispatch() after every change"""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    def dispatch(self):
+        if self._changed_keys:
+            with self._lock:
+                changed = self._changed_keys
+                self._changed_keys = set()
+            for listener in list(self._listeners):
+                listener(changed)
+
 class CoreRadio:
     
     """Implements core radio functions"""
+
+    spare_player = None # (player, url, cache) spawned ahead of time, adopted by the next play with the same cache
+    spare_player_thread = None
     
-    def __init__(self, prefs):
+    def __init__(self, prefs, model=None, history=None):
         self._prefs = prefs
-        self._channels_dict = dict()
+        self._model = model or RadioModel()
+        self._history = history
+        self._channels_dict = ColumnarChannelStore() if self._prefs['CoreRadio.ColumnarStore'] else dict()
         self._playing_channel = None
-        self._is_paused = False
+        self._last_played_channel = self._prefs['CoreRadio.LastPlayedChannel']
         self._volume = self._prefs['CoreRadio.StartVolume']
         logging.info('initial volume set to {0:d}'.format(self._volume))    
-        self._mplayer = None
+        self._player = None
+        self._fade = 1 # Factor of the volume sent to the player, for fade outs
+        self._dead_air = None
+        self._dead_air_listener = None
+        self._spectrum = None
+        self._stream_start_time = None
+        self._catalog_cache = None
+        self._session = None # Statistics of the playing stream, for StreamCachePolicy
+        self._model.update(radio_max_volume=self.get_max_volume())
+        self.publish_state()
 
     def load_radio_list(self, list_file_path):
         logging.info('loading channels from file "{0}"'.format(list_file_path))
-        self._channels_dict.clear()
-        channel_list = list() # preserves channel's order of appearance in the file
+        # Filled aside and swapped, the catalog can be reloaded while another thread plays
+        channels_dict = ColumnarChannelStore() if self._prefs['CoreRadio.ColumnarStore'] else dict()
         with open(list_file_path, 'r') as f:
             line_counter = 0
             for line in f:
@@ -221,17 +2646,20 @@ class CoreRadio:
                     if len(tokens) > 1:
                         try:
                             channel = RadioChannel(tokens[0], tokens[1])
-                            if channel._name in self._channels_dict:
-                                logging.warning('overwriting channel "{0}"!', channel._name)
-                            self._channels_dict[channel._name] = channel
-                            channel_list.append(channel._name)
+                            if channel._name in channels_dict:
+                                logging.warning('overwriting channel "{0}"!'.format(channel._name))
+                            channels_dict[channel._name] = channel
                         except Exception as e:
                             logging.warning('skipping invalid line: {0:d}.\n{1}'.format(line_counter, e.args))
                     else:
                         logging.warning('skipping invalid line: {0:d}.\nNot enough arguments.'.format(line_counter))
-        logging.info('found {0:d} channel(s):'.format(len(channel_list)))
-        for channel_name in channel_list:
-            logging.info('  {0}'.format(channel_name))
+        self._channels_dict = channels_dict
+        # Both stores preserve channel's order of appearance in the file
+        if isinstance(channels_dict, ColumnarChannelStore):
+            channel_list = channels_dict.keys()
+        else:
+            channel_list = list(channels_dict)
+        logging.info('found {0:d} channel(s)'.format(len(channel_list)))
         return channel_list
 
     def play(self, channel_name, volume=None):
@@ -241,56 +2669,293 @@ class CoreRadio:
             if volume != None:
                 self._volume = volume
                 logging.debug('changed volume to {0:d}'.format(self._volume))
-            self._mplayer = MPlayer(self._prefs['CoreRadio.SoftvolGain'], self._volume)
             self._playing_channel = self._channels_dict[channel_name]
-            self._mplayer.loadlist(self._playing_channel._url, True)
+            self.start_player(self._playing_channel)
         else:
             logging.error('can\'t play unknown channel "{0}"!'.format(channel_name)) 
+        self.publish_state()
         return
 
+    def resume_last_channel(self):
+        """Plays the channel that was playing last, even if the catalog is not loaded yet"""
+        if self._last_played_channel:
+            (channel_name, url) = self._last_played_channel
+            logging.info('resuming channel {0}'.format(channel_name))
+            self.stop()
+            try:
+                self._playing_channel = RadioChannel(channel_name, url)
+            except Exception as e:
+                logging.warning('can\'t resume channel "{0}": {1}'.format(channel_name, e.args))
+                return
+            self.start_player(self._playing_channel)
+            self.publish_state()
+
+    def start_player(self, channel):
+        cache = self.get_cache_settings(channel._url)
+        spare = CoreRadio.take_spare_player()
+        if spare and self._catalog_cache is not None and spare[2] != cache:
+            # The players take their cache on the command line, it cannot be changed afterwards.
+            # Before the catalog cache is loaded (fast start), the spare's saved settings are the best known
+            logging.info('not using the spare player, its cache {0} is not {1}'.format(spare[2], cache))
+            spare[0].stop()
+            spare = None
+        if spare:
+            (self._player, spare_url, _) = spare
+            self._player.set_volume(self.get_faded_volume())
+        else:
+            self._player = AudioBackend.create(self._prefs['CoreRadio.Backend'], self._prefs['CoreRadio.SoftvolGain'], self.get_faded_volume(), pcm_tap=self._prefs['CoreRadio.PcmTap'], cache=cache)
+            spare_url = None
+        self._player.set_event_listener(self.on_player_event)
+        tap = self._player.get_pcm_tap()
+        if tap:
+            analyzer = SpectrumAnalyzer() if numpy is not None else None
+            self._dead_air = DeadAirDetector(tap, self._prefs['CoreRadio.DeadAirThreshold'], self._prefs['CoreRadio.DeadAirDuration'], analyzer=analyzer)
+            self._spectrum = analyzer
+        if spare_url != channel._url:
+            self._player.play(channel._url)
+        self._last_played_channel = [channel._name, channel._url]
+        self._stream_start_time = time.monotonic()
+        self._session = dict(url=channel._url, underruns=0, reconnects=0, started=False, tap_version=self._dead_air and self._dead_air.version, tap_time=None, stalled=False)
+        if self._history:
+            self._history.record(ListeningHistory.Event.play, self._volume, channel._name)
+
+    def update(self):
+        if self._player:
+            self._player.poll()
+        if self._dead_air and self._player and not self._player.is_paused():
+            if self._dead_air.update(time.monotonic()):
+                self.on_dead_air(self._dead_air.is_dead_air)
+            self.detect_underrun(time.monotonic())
+
+    def detect_underrun(self, now):
+        """The pcm tap stops getting blocks while the player waits for its cache to refill"""
+        session = self._session
+        if session is None:
+            return
+        if self._dead_air.version != session['tap_version']:
+            session['tap_version'] = self._dead_air.version
+            session['tap_time'] = now
+            session['stalled'] = False
+        elif session['tap_time'] is not None and not session['stalled'] and now - session['tap_time'] >= STREAM_UNDERRUN_GAP:
+            session['stalled'] = True
+            self.on_underrun()
+
+    def on_underrun(self):
+        self._session['underruns'] += 1
+        Metrics.stream_underruns.inc()
+        logging.info('cache underrun on channel {0}'.format(self.get_playing_channel()))
+
+    def set_catalog_cache(self, catalog_cache):
+        """Where the stream statistics of the channels are kept"""
+        self._catalog_cache = catalog_cache
+
+    def get_cache_settings(self, url):
+        if self._catalog_cache is None:
+            return None
+        return StreamCachePolicy.get_settings(self._catalog_cache.get(url))
+
+    def record_stream_stats(self, url, seconds=0, underruns=0, reconnects=0, bitrate=None):
+        if self._catalog_cache is not None:
+            self._catalog_cache.update(url, StreamCachePolicy.merge_stats(self._catalog_cache.get(url), seconds, underruns, reconnects, bitrate))
+
+    def is_player_starting(self):
+        """Playing, not started yet"""
+        return self._session is not None and not self._session['started'] and time.monotonic() - self._stream_start_time < PLAYER_START_TIMEOUT
+
+    def end_stream_session(self):
+        """Adds the statistics of the playing stream to the catalog cache"""
+        session = self._session
+        self._session = None
+        if session is None:
+            return
+        bitrate = self._player and self._player.get_property('audio-bitrate') # bits/s, mpv only
+        self.record_stream_stats(session['url'], time.monotonic() - self._stream_start_time, session['underruns'], session['reconnects'], bitrate and bitrate / 1000)
+
+    def on_dead_air(self, is_dead_air):
+        if is_dead_air:
+            Metrics.dead_air.inc()
+            logging.warning('dead air on channel {0}'.format(self.get_playing_channel()))
+        else:
+            logging.info('audio is back on channel {0}'.format(self.get_playing_channel()))
+        self.publish_state()
+        if self._dead_air_listener:
+            self._dead_air_listener(is_dead_air)
+
+    def set_dead_air_listener(self, listener):
+        """listener(is_dead_air) is called when the playing channel goes silent and when it recovers"""
+        self._dead_air_listener = listener
+
+    def is_dead_air(self):
+        return self._dead_air is not None and self._dead_air.is_dead_air
+
+    def get_audio_levels(self):
+        """(rms, peak) of the playing channel over the last DEAD_AIR_WINDOW, None without a pcm tap"""
+        if self._dead_air is None:
+            return None
+        return (self._dead_air.rms, self._dead_air.peak)
+
+    def get_audio_meter(self):
+        """(version, rms of the last block, peak over DEAD_AIR_WINDOW, spectrum bands or None without numpy),
+        None without a pcm tap. The version changes with every block read from the tap"""
+        if self._dead_air is None:
+            return None
+        bands = self._spectrum.get_bands() if self._spectrum is not None else None
+        return (self._dead_air.version, self._dead_air.level, self._dead_air.peak, bands)
+
+    def on_player_event(self, event, value):
+        logging.debug('player event {0}: {1}'.format(event.name, value))
+        if event == AudioBackend.Event.started:
+            CoreRadio.notify_audio_started()
+            if self._session:
+                self._session['started'] = True
+        elif event == AudioBackend.Event.buffering:
+            if value and self._session and self._session['started']:
+                self.on_underrun()
+        elif event == AudioBackend.Event.error:
+            logging.warning('player error: {0}'.format(value))
+            if self._session:
+                self._session['reconnects'] += 1
+
+    def publish_state(self):
+        self._model.update(radio_volume=self._volume, playing_channel=self.get_playing_channel(), is_radio_playing=bool(self.is_playing()), dead_air=self.is_dead_air())
+
+    def prespawn_player(prefs, resume, cache=None):
+        """Spawns a player in background so that the next play does not pay for it.
+        If resume is set, the player also starts connecting to the last played channel,
+        with the cache settings saved for it. Otherwise it gets cache, the settings of
+        the channel expected to play next. A play with other settings does not use it"""
+        load_lazy_modules()
+        CoreRadio.spare_player_thread = threading.Thread(target=CoreRadio.spawn_spare_player, args=(prefs, resume, cache), name='player-prespawn', daemon=True)
+        CoreRadio.spare_player_thread.start()
+
+    def spawn_spare_player(prefs, resume, cache):
+        try:
+            url = None
+            if resume and prefs['CoreRadio.LastPlayedChannel']:
+                url = prefs['CoreRadio.LastPlayedChannel'][1]
+                cache = prefs['CoreRadio.LastPlayedCache'] and tuple(prefs['CoreRadio.LastPlayedCache'])
+            player = AudioBackend.create(prefs['CoreRadio.Backend'], prefs['CoreRadio.SoftvolGain'], prefs['CoreRadio.StartVolume'], pcm_tap=prefs['CoreRadio.PcmTap'], cache=cache)
+            if url:
+                player.play(url)
+            CoreRadio.spare_player = (player, url, cache)
+        except Exception:
+            logging.exception('could not prespawn the player')
+
+    def take_spare_player():
+        if CoreRadio.spare_player_thread:
+            CoreRadio.spare_player_thread.join()
+            CoreRadio.spare_player_thread = None
+        spare = CoreRadio.spare_player
+        CoreRadio.spare_player = None
+        return spare
+
+    def release_spare_player():
+        """Stops the prespawned player, if any, so that it lets go of the audio device"""
+        spare = CoreRadio.take_spare_player()
+        if spare:
+            spare[0].stop()
+
+    def notify_audio_started():
+        if StartupProfiler.mark('first_audio'):
+            logging.info('time to audio: {0:.3f} s from process start'.format(time.monotonic() - StartupProfiler.get_process_start()))
+            StartupProfiler.report()
+
     def stop(self):
+        if self._history and self._playing_channel:
+            self._history.record(ListeningHistory.Event.stop)
+        self.end_stream_session()
         self._playing_channel = None
-        if self._mplayer:
-            self._mplayer.stop()
-        self._mplayer = None
+        self._dead_air = None
+        self._spectrum = None
+        if self._player:
+            self._player.stop()
+        self._player = None
+        self.publish_state()
         return
     
     def pause(self):
-        if self._mplayer:
-            self._is_paused = not self._is_paused
-            self._mplayer.pause()
+        if self._player:
+            self._player.pause()
+            if self._session:
+                self._session['tap_time'] = None # Not an underrun
+            if self._dead_air:
+                self._dead_air.reset()
+                self.publish_state()
         else:
             logging.info('won\'t pause, player is already stopped')
 
+    def is_paused(self):
+        return self._player is not None and self._player.is_paused()
+
+    def set_mute(self, flag):
+        if self._player:
+            self._player.set_mute(flag)
+
+    def is_muted(self):
+        return self._player is not None and self._player.is_muted()
+
     def get_volume(self):
         return self._volume
         
     def get_max_volume(self):
         return self._prefs['CoreRadio.VolumeMax']
+
+    def get_faded_volume(self):
+        return round(self._volume * self._fade)
+
+    def set_fade(self, factor):
+        """Scales the volume sent to the player by factor, the radio volume is left as set.
+        The player only gets the changes of the rounded volume"""
+        previous = self.get_faded_volume()
+        self._fade = factor
+        if self._player and self.get_faded_volume() != previous:
+            self._player.set_volume(self.get_faded_volume())
         
-    def increase_volume(self):
-        self._volume = min(self._volume + self._prefs['CoreRadio.VolumeDelta'], self._prefs['CoreRadio.VolumeMax'])
+    def increase_volume(self, steps=1):
+        self._volume = min(self._volume + steps*self._prefs['CoreRadio.VolumeDelta'], self._prefs['CoreRadio.VolumeMax'])
         logging.info('changed volume to {0:d}'.format(self._volume))
-        if self._mplayer:
-            self._mplayer.volume(self._volume, True)
+        if self._player:
+            self._player.set_volume(self.get_faded_volume())
+        if self._history:
+            self._history.record(ListeningHistory.Event.volume, self._volume)
+        self.publish_state()
 
-    def decrease_volume(self):
-        self._volume = max(self._volume - self._prefs['CoreRadio.VolumeDelta'], self._prefs['CoreRadio.VolumeMin'])
+    def decrease_volume(self, steps=1):
+        self._volume = max(self._volume - steps*self._prefs['CoreRadio.VolumeDelta'], self._prefs['CoreRadio.VolumeMin'])
         logging.info('changed volume to {0:d}'.format(self._volume))
-        if self._mplayer:
-            self._mplayer.volume(self._volume, True)
+        if self._player:
+            self._player.set_volume(self.get_faded_volume())
+        if self._history:
+            self._history.record(ListeningHistory.Event.volume, self._volume)
+        self.publish_state()
 
     def get_playing_channel(self):
         if self.is_playing():
             return self._playing_channel._name
         else:
             return 0
+
+    def get_stream_uptime(self):
+        """Seconds since the stream of the playing channel started, None when stopped"""
+        if not self.is_playing():
+            return None
+        return time.monotonic() - self._stream_start_time
+
+    def has_channel(self, channel_name):
+        return channel_name in self._channels_dict
+
+    def get_channel_url(self, channel_name):
+        if isinstance(self._channels_dict, ColumnarChannelStore):
+            return self._channels_dict.get_url(channel_name)
+        return self._channels_dict[channel_name]._url
     
     def is_playing(self):
-        return self._playing_channel and self._mplayer
+        return self._playing_channel and self._player
 
     def sync_preferences(self):
         self._prefs['CoreRadio.StartVolume'] = self._volume
+        self._prefs['CoreRadio.LastPlayedChannel'] = self._last_played_channel
+        self._prefs['CoreRadio.LastPlayedCache'] = self._last_played_channel and self.get_cache_settings(self._last_played_channel[1]) # For the spare player of the next start
 
     def get_default_preferences():
         result = dict()
@@ -299,6 +2964,328 @@ class CoreRadio:
         result['CoreRadio.VolumeMin'] = VOLUME_MIN
         result['CoreRadio.VolumeDelta'] = VOLUME_DELTA
         result['CoreRadio.SoftvolGain'] = SOFTVOL_GAIN
+        result['CoreRadio.ColumnarStore'] = False
+        result['CoreRadio.LastPlayedChannel'] = None
+        result['CoreRadio.LastPlayedCache'] = None
+        result['CoreRadio.Backend'] = AUDIO_BACKEND
+        result['CoreRadio.PcmTap'] = False
+        result['CoreRadio.DeadAirThreshold'] = DEAD_AIR_THRESHOLD
+        result['CoreRadio.DeadAirDuration'] = DEAD_AIR_DURATION
+        return result
+
+class StreamResolver:
+
+    """Resolves playlist urls (m3u, pls) into the stream url they point to, shared by all
+    the outputs of a PlaybackManager: a playlist is fetched once per RESOLVER_CACHE_TTL
+    however many outputs play it. Fetches run on a single worker thread, the callbacks
+    are invoked by update() on the caller's thread"""
+
+    PLAYLIST_PARSERS = {'.m3u': CatalogImporter.parse_m3u, '.pls': CatalogImporter.parse_pls}
+
+    def __init__(self, ttl=RESOLVER_CACHE_TTL, timeout=RESOLVER_TIMEOUT):
+        self._ttl = ttl
+        self._timeout = timeout
+        self._cache = dict() # Playlist url -> (stream url, expiry time)
+        self._waiting = dict() # Playlist url -> callbacks
+        self._requests = queue.Queue()
+        self._resolved = list() # (playlist url, stream url) fetched by the worker
+        self._lock = threading.Lock()
+        self._worker = None
+        self.fetches = 0
+        self.hits = 0
+
+    def get_parser(url):
+        extension = os.path.splitext(urllib.parse.urlsplit(url).path)[1].lower()
+        return StreamResolver.PLAYLIST_PARSERS.get(extension)
+
+    def resolve(self, url, callback):
+        """callback(stream url) is invoked with None if url is not a playlist or could not be resolved"""
+        if StreamResolver.get_parser(url) is None:
+            callback(None)
+            return
+        entry = self._cache.get(url)
+        if entry and entry[1] > time.monotonic():
+            self.hits += 1
+            callback(entry[0])
+        elif url in self._waiting:
+            self.hits += 1
+            self._waiting[url].append(callback)
+        else:
+            self._waiting[url] = [callback]
+            self._requests.put(url)
+            if self._worker is None:
+                load_lazy_modules()
+                self._worker = threading.Thread(target=self.work, name='stream-resolver', daemon=True)
+                self._worker.start()
+
+    def work(self):
+        while True:
+            url = self._requests.get()
+            stream_url = self.fetch(url)
+            with self._lock:
+                self._resolved.append((url, stream_url))
+
+    def fetch(self, url):
+        self.fetches += 1
+        try:
+            with urllib.request.urlopen(url, timeout=self._timeout) as response:
+                lines = response.read(RESOLVER_READ_BYTES).decode('utf-8', errors='replace').splitlines()
+            for (name, stream_url) in StreamResolver.get_parser(url)(lines):
+                if CatalogImporter.normalize_url(stream_url):
+                    logging.debug('resolved playlist {0} to {1}'.format(url, stream_url))
+                    return stream_url.strip()
+            logging.warning('no stream in playlist {0}'.format(url))
+        except (OSError, ValueError) as err:
+            logging.warning('could not resolve playlist {0}: {1}'.format(url, err))
+        return None
+
+    def update(self):
+        if not self._resolved:
+            return
+        with self._lock:
+            (resolved, self._resolved) = (self._resolved, list())
+        for (url, stream_url) in resolved:
+            if stream_url:
+                self._cache[url] = (stream_url, time.monotonic() + self._ttl)
+            for callback in self._waiting.pop(url, ()):
+                callback(stream_url)
+
+class PlaybackManager:
+
+    """Drives several audio outputs (sound cards, a null sink...) from one process, each
+    one with its own channel, volume and alarm binding. The players are supervised from
+    the caller's loop: a selector watches their ipc sockets and process exits, there is
+    no thread per player. A player that fails is restarted with an increasing delay,
+    which starts over once the restarted player has played for a while"""
+
+    class Output:
+
+        """An audio output and the player feeding it"""
+
+        def __init__(self, name, device=None, backend=AUDIO_BACKEND, channel=None, volume=START_VOLUME, alarm=False, alarm_channel=None, alarm_volume=None):
+            self.name = name
+            self.device = device
+            self.backend = backend
+            self.channel = channel
+            self.volume = volume
+            self.alarm = alarm # Plays when the alarm fires
+            self.alarm_channel = alarm_channel # None for the alarm channel of the clock radio
+            self.alarm_volume = alarm_volume
+            self.current = None # (channel name, volume) being played
+            self.playing_alarm = False
+            self.player = None
+            self.fds = list()
+            self.restarts = 0
+            self.restart_time = None
+            self.recovery_time = None # When the restarted player will have played long enough
+            self.start_time = None # Of the player, until it starts playing
+
+        def to_dict(self):
+            return dict(name=self.name, device=self.device, backend=self.backend, channel=self.channel, volume=self.volume, alarm=self.alarm, alarm_channel=self.alarm_channel, alarm_volume=self.alarm_volume)
+
+    def __init__(self, prefs, core_radio, resolver=None):
+        self._prefs = prefs
+        self._core_radio = core_radio # Shared catalog
+        self._resolver = resolver or StreamResolver()
+        self._selector = selectors.DefaultSelector()
+        self._outputs = dict()
+        for values in self._prefs['PlaybackManager.Outputs']:
+            self.add_output(**values)
+
+    def add_output(self, name, **settings):
+        if name in self._outputs:
+            raise Exception('Output "{0}" already exists'.format(name))
+        self._outputs[name] = PlaybackManager.Output(name, **settings)
+        logging.info('added output {0}'.format(name))
+        return self._outputs[name]
+
+    def remove_output(self, name):
+        self.stop(name)
+        del self._outputs[name]
+
+    def get_output(self, name):
+        return self._outputs[name]
+
+    def get_outputs(self):
+        return list(self._outputs.values())
+
+    def get_resolver(self):
+        return self._resolver
+
+    def play(self, name, channel_name=None, volume=None):
+        """Plays channel_name, or the last channel of the output if None"""
+        output = self._outputs[name]
+        output.channel = channel_name or output.channel
+        if volume is not None:
+            output.volume = volume
+        output.playing_alarm = False
+        self.start(output, output.channel, output.volume)
+
+    def start(self, output, channel_name, volume):
+        self.stop_player(output)
+        output.restarts = 0
+        output.restart_time = None
+        output.recovery_time = None
+        if not self._core_radio.has_channel(channel_name):
+            logging.error('can\'t play unknown channel "{0}" on output {1}!'.format(channel_name, output.name))
+            output.current = None
+            return
+        output.current = (channel_name, volume)
+        self.start_player(output)
+
+    def start_player(self, output):
+        (channel_name, volume) = output.current
+        url = self._core_radio.get_channel_url(channel_name)
+        output.restart_time = None
+        try:
+            player = AudioBackend.create(output.backend, self._prefs['CoreRadio.SoftvolGain'], volume, output.device, cache=self._core_radio.get_cache_settings(url))
+        except Exception as e:
+            self.on_player_failed(output, 'could not start the player: {0}'.format(e))
+            return
+        logging.info('output {0} playing channel {1}'.format(output.name, channel_name))
+        player.set_event_listener(lambda event, value: self.on_player_event(output, event, value))
+        output.player = player
+        output.start_time = time.monotonic()
+        self.update_selectables(output)
+        self._resolver.resolve(url, lambda stream_url: self.on_resolved(output, player, url, stream_url))
+
+    def on_resolved(self, output, player, url, stream_url):
+        if output.player is not player:
+            return # Stopped or restarted meanwhile
+        if stream_url:
+            player.play_stream(stream_url)
+        else:
+            player.play(url)
+
+    def update_selectables(self, output):
+        """Watches the file descriptors of the player, they may change while it starts"""
+        fds = output.player.get_selectables() if output.player else list()
+        if fds == output.fds:
+            return
+        for fd in output.fds:
+            self._selector.unregister(fd)
+        output.fds = fds
+        for fd in output.fds:
+            self._selector.register(fd, selectors.EVENT_READ, output)
+
+    def stop(self, name):
+        output = self._outputs[name]
+        output.current = None
+        output.playing_alarm = False
+        output.restart_time = None
+        output.recovery_time = None
+        self.stop_player(output)
+
+    def stop_player(self, output):
+        for fd in output.fds:
+            self._selector.unregister(fd)
+        output.fds = list()
+        output.start_time = None
+        if output.player:
+            output.player.stop()
+            output.player = None
+
+    def stop_all(self):
+        for name in self._outputs:
+            self.stop(name)
+
+    def is_playing(self, name):
+        return self._outputs[name].current is not None
+
+    def is_any_playing(self):
+        return any(output.current is not None for output in self._outputs.values())
+
+    def is_player_starting(self):
+        now = time.monotonic()
+        return any(output.start_time is not None and now - output.start_time < PLAYER_START_TIMEOUT for output in self._outputs.values())
+
+    def set_volume(self, name, value):
+        output = self._outputs[name]
+        output.volume = max(min(value, self._prefs['CoreRadio.VolumeMax']), self._prefs['CoreRadio.VolumeMin'])
+        if output.current:
+            output.current = (output.current[0], output.volume)
+        if output.player:
+            output.player.set_volume(output.volume)
+
+    def fire_alarm(self, channel_name, volume):
+        """Plays the alarm on every output bound to it"""
+        for output in self._outputs.values():
+            if output.alarm:
+                self.start(output, output.alarm_channel or channel_name, volume if output.alarm_volume is None else output.alarm_volume)
+                output.playing_alarm = True
+
+    def stop_alarm(self):
+        for output in self._outputs.values():
+            if output.playing_alarm:
+                self.stop(output.name)
+
+    def update(self, timeout=0):
+        """Delivers the events of the players and restarts the failed ones, to be called from the main loop"""
+        self._resolver.update()
+        ready = set(key.data for (key, events) in self._selector.select(timeout)) if self._selector.get_map() else set()
+        now = time.monotonic()
+        for output in list(self._outputs.values()):
+            player = output.player
+            if player and (output in ready or player.has_pending_events() or not output.fds):
+                player.poll()
+                if output.player is player and not player.is_alive():
+                    self.on_player_failed(output, 'player exited')
+                elif output.player is player:
+                    self.update_selectables(output)
+            elif output.restart_time is not None and now >= output.restart_time:
+                if not self._core_radio.has_channel(output.current[0]):
+                    self.on_player_failed(output, 'channel removed')
+                    continue
+                Metrics.stream_reconnects.inc_label(output.name)
+                self.start_player(output)
+            if output.recovery_time is not None and now >= output.recovery_time and output.player:
+                logging.info('output {0} recovered after {1:d} restart(s)'.format(output.name, output.restarts))
+                output.restarts = 0
+                output.recovery_time = None
+
+    def on_player_event(self, output, event, value):
+        logging.debug('output {0} player event {1}: {2}'.format(output.name, event.name, value))
+        if event == AudioBackend.Event.error:
+            self.on_player_failed(output, value)
+        elif event == AudioBackend.Event.started:
+            output.start_time = None
+            if output.restarts > 0:
+                output.recovery_time = time.monotonic() + PLAYBACK_RECOVERY_TIME
+
+    def on_player_failed(self, output, reason):
+        logging.warning('output {0} failed: {1}'.format(output.name, reason))
+        self.stop_player(output)
+        output.recovery_time = None
+        if output.current is None:
+            return
+        if not self._core_radio.has_channel(output.current[0]):
+            # Removed from the list meanwhile, there is nothing to restart
+            logging.error('not restarting output {0}, channel "{1}" is gone'.format(output.name, output.current[0]))
+            output.current = None
+            output.playing_alarm = False
+            output.restart_time = None
+            return
+        self._core_radio.record_stream_stats(self._core_radio.get_channel_url(output.current[0]), reconnects=1)
+        if output.restarts < PLAYBACK_MAX_RESTARTS:
+            delay = PLAYBACK_RESTART_DELAY * 2 ** output.restarts
+            output.restarts += 1
+            output.restart_time = time.monotonic() + delay
+            logging.info('restarting output {0} in {1:g} s'.format(output.name, delay))
+        else:
+            logging.error('giving up output {0} after {1:d} restarts'.format(output.name, output.restarts))
+            output.current = None
+            output.playing_alarm = False
+
+    def close(self):
+        self.stop_all()
+        self._selector.close()
+
+    def sync_preferences(self):
+        self._prefs['PlaybackManager.Outputs'] = [output.to_dict() for output in self._outputs.values()]
+
+    def get_default_preferences():
+        result = dict()
+        result['PlaybackManager.Outputs'] = list()
         return result
 
 class ClockRadio:
@@ -311,38 +3298,99 @@ class ClockRadio:
         ringing = 2
         snooze = 3
         
-    def __init__(self, prefs):
+    def __init__(self, prefs, deferred_loading=False, model=None, clock=None, system=System):
         self._alarm_state = ClockRadio.AlarmState.waiting
         self._prefs = prefs
+        self._model = model or RadioModel()
+        self._clock = clock or Clock()
+        self._system = system
+        self._supervisor = ProcessSupervisor.get_default()
+        self._status_page = None
+        self._metrics_exporter = None
+        if self._prefs['Metrics.Port'] is not None or self._prefs['Metrics.TextfilePath']:
+            self._metrics_exporter = MetricsExporter(self._prefs['Metrics.Port'], self._prefs['Metrics.TextfilePath'])
         self._alarm_on = self._prefs['ClockRadio.AlarmOn']
         self._alarm_time = self._prefs['ClockRadio.AlarmTime']
         self._alarm_channel = self._prefs['ClockRadio.AlarmChannel']
         self._alarm_volume = self._prefs['ClockRadio.AlarmVolume']
-        self._alarm_date = datetime.datetime.now()
         self._alarm_date = self.get_next_alarm_date()
-        self._core_radio = CoreRadio(self._prefs)
-        self._channel_names = self._core_radio.load_radio_list(self._prefs['ClockRadio.ChannelsFile'])
-        if not (self._alarm_channel in self._channel_names):
-            if len(self._channel_names) > 0:
-                self._alarm_channel = self._channel_names[0]
-            else:
-                self._alarm_channel = None
+        self._missed_alarms = 0
+        self._history = ListeningHistory(self._prefs['ClockRadio.HistoryFile'], self._prefs['ClockRadio.HistoryMaxSize'])
+        self._core_radio = CoreRadio(self._prefs, self._model, self._history)
+        self._core_radio.set_dead_air_listener(self.on_dead_air)
+        Metrics.stream_uptime.function = self.get_stream_uptimes
+        self._playback = PlaybackManager(self._prefs, self._core_radio)
+        self._channel_names = list()
+        # Named lists are ordered channel names, shown as views over the catalog
+        self._channel_lists = dict((name, list(channels)) for name, channels in self._prefs['ClockRadio.ChannelLists'].items())
+        self._active_channel_list = self._prefs['ClockRadio.ActiveChannelList']
+        if not self._active_channel_list in self._channel_lists:
+            self._active_channel_list = None
+        self._catalog_cache = None
+        self._catalog_loaded = threading.Event()
         self._fire_event_listener = None
         self._ringing_timeout_event_listener = None
         self._snooze_timeout_event_listener = None
+        self._sleep_event_listener = None
+        self._sleep_duration = None
+        self._sleep_deadline = None
         self._ringing_start_time = -1
         self._snooze_start_time = -1
         self._snooze_counter = 0
-        self.update_wake_up_time()
+        self._alarm_tried_channels = set()
+        self._late_fire_until = None # Alarm window extended after a late resume
+        self._model.update(alarm_max_volume=self.get_alarm_max_volume())
+        self.publish_alarm()
+        if not deferred_loading:
+            self.load_catalog()
+            self.update_wake_up_time()
 
     def __del__(self):
         pass
+
+    def load_catalog(self):
+        channel_names = self._core_radio.load_radio_list(self._prefs['ClockRadio.ChannelsFile'])
+        self._catalog_cache = CatalogCache(self._prefs['ClockRadio.CatalogCacheFile'])
+        self._core_radio.set_catalog_cache(self._catalog_cache)
+        if not (self._alarm_channel in channel_names):
+            if len(channel_names) > 0:
+                self._alarm_channel = channel_names[0]
+            else:
+                self._alarm_channel = None
+        self._channel_names = channel_names
+        self._catalog_loaded.set()
+        self.publish_alarm()
+        self._model.update(channels=self.get_channel_list_view(), channel_list=self._active_channel_list, catalog_loaded=True)
+        StartupProfiler.mark('catalog')
+
+    def publish_alarm(self):
+        self._model.update(alarm_on=self._alarm_on, alarm_time=tuple(self._alarm_time), alarm_volume=self._alarm_volume, alarm_channel=self._alarm_channel, alarm_state=self._alarm_state)
+
+    def is_catalog_loaded(self):
+        return self._catalog_loaded.is_set()
+
+    def start_deferred_loading(self):
+        """Loads the catalog, finds mplayer and arms the wake up time in background"""
+        load_lazy_modules()
+        threading.Thread(target=self.load_deferred, name='deferred-loading', daemon=True).start()
+
+    def load_deferred(self):
+        try:
+            self.load_catalog()
+            if self._prefs['CoreRadio.Backend'] == 'mplayer':
+                MPlayer.find_executable()
+            elif self._prefs['CoreRadio.Backend'] == 'mpv':
+                MpvBackend.find_executable()
+            self.update_wake_up_time()
+        except Exception:
+            logging.exception('deferred loading failed')
      
     def is_alarm_on(self):
         return self._alarm_on
 
     def set_alarm_on(self, flag):
         self._alarm_on = flag
+        self.publish_alarm()
         self.update_wake_up_time()
         
     def get_alarm_time(self):
@@ -356,30 +3404,47 @@ class ClockRadio:
         
     def get_alarm_channel(self):
         return self._alarm_channel
+
+    def get_alarm_cache_settings(self):
+        """Stream cache settings of the alarm channel, None for the player's default"""
+        if self._alarm_channel is None or not self._core_radio.has_channel(self._alarm_channel):
+            return None
+        return self._core_radio.get_cache_settings(self._core_radio.get_channel_url(self._alarm_channel))
     
     def set_alarm_time(self, time):
         self._alarm_time = time
         logging.info('alarm time is {0:d}:{1:02d}'.format(self._alarm_time[0], self._alarm_time[1]))
         self._alarm_date = self.get_next_alarm_date()
         self._alarm_time_changed = True
+        self._late_fire_until = None
+        self.publish_alarm()
         self.update_wake_up_time()
     
-    def increase_alarm_volume(self):
-        self._alarm_volume = min(self._alarm_volume + self._prefs['ClockRadio.VolumeDelta'], self._prefs['ClockRadio.VolumeMax'])
+    def increase_alarm_volume(self, steps=1):
+        self._alarm_volume = min(self._alarm_volume + steps*self._prefs['ClockRadio.VolumeDelta'], self._prefs['ClockRadio.VolumeMax'])
         logging.info('changed alarm volume to {0:d}'.format(self._alarm_volume))
+        self.publish_alarm()
 
-    def decrease_alarm_volume(self):
-        self._alarm_volume = max(self._alarm_volume - self._prefs['ClockRadio.VolumeDelta'], self._prefs['ClockRadio.VolumeMin'])
+    def decrease_alarm_volume(self, steps=1):
+        self._alarm_volume = max(self._alarm_volume - steps*self._prefs['ClockRadio.VolumeDelta'], self._prefs['ClockRadio.VolumeMin'])
         logging.info('changed alarm volume to {0:d}'.format(self._alarm_volume))
+        self.publish_alarm()
         
     def set_alarm_channel(self, channel):
         self._alarm_channel = channel
+        self.publish_alarm()
 
     def get_alarm_date(self):
         return self._alarm_date
         
     def get_alarm_datetime(self):
-        return datetime.datetime.combine(self._alarm_date, datetime.time(hour=self._alarm_time[0], minute=self._alarm_time[1]))
+        return self._clock.resolve(datetime.datetime.combine(self._alarm_date, datetime.time(hour=self._alarm_time[0], minute=self._alarm_time[1])))
+
+    def get_alarm_state(self):
+        return self._alarm_state
+
+    def get_missed_alarms(self):
+        return self._missed_alarms
     
     def toggle_alarm(self):
         if self._alarm_channel:
@@ -388,21 +3453,207 @@ class ClockRadio:
             self.set_alarm_on(False)
     
     def get_next_alarm_date(self):
-        now = datetime.datetime.now()
-        alarm_end = datetime.datetime.combine(now.date(), datetime.time(hour=self._alarm_time[0], minute=self._alarm_time[1])) + datetime.timedelta(minutes=1)
+        now = self._clock.now()
+        alarm_end = self._clock.resolve(datetime.datetime.combine(now.date(), datetime.time(hour=self._alarm_time[0], minute=self._alarm_time[1]))) + datetime.timedelta(seconds=ALARM_WINDOW)
         if now < alarm_end:
             return now.date()
         else:
             return now.date() + datetime.timedelta(days=1)
             
     def is_ready_to_ring(self):
-        now = datetime.datetime.now()
-        now_date = now.date()
-        now_time = now.time()
-        return now_date == self._alarm_date and [now_time.hour, now_time.minute] == self._alarm_time
+        alarm = self.get_alarm_datetime()
+        return alarm <= self._clock.now() < self.get_alarm_window_end(alarm)
+
+    def is_alarm_missed(self):
+        """The main loop did not run during the alarm window (suspended, wall clock moved...)"""
+        return self._clock.now() >= self.get_alarm_window_end(self.get_alarm_datetime())
+
+    def get_alarm_window_end(self, alarm):
+        end = alarm + datetime.timedelta(seconds=ALARM_WINDOW)
+        if self._late_fire_until is not None:
+            end = max(end, self._late_fire_until)
+        return end
+
+    def get_suspend_duration(self):
+        """Whole seconds from now to the resume, a margin before the next alarm"""
+        return int(self._clock.seconds_until(self.get_alarm_datetime()) - self._prefs['ClockRadio.SuspendMargin'])
+
+    def is_player_starting(self):
+        """A player was started and did not play yet"""
+        return self._core_radio.is_player_starting() or self._playback.is_player_starting()
+
+    def can_suspend(self):
+        """Nothing to do until the next alarm: waiting for it, nothing playing nor importing"""
+        return (self._alarm_on and self._alarm_state == ClockRadio.AlarmState.waiting
+            and not self._core_radio.is_playing() and not self._playback.is_any_playing()
+            and self._model.import_progress is None and self.get_suspend_duration() >= SUSPEND_MIN_DURATION)
+
+    def suspend_until_alarm(self):
+        """Suspends to RAM until shortly before the next alarm, returns once resumed.
+        The caller saves the preferences beforehand"""
+        seconds = self.get_suspend_duration()
+        alarm = self.get_alarm_datetime()
+        logging.info('suspending for {0:d} seconds, alarm at {1}'.format(seconds, alarm))
+        Metrics.suspends.inc()
+        if not self._system.suspend(seconds):
+            logging.warning('suspend failed')
+        self.on_resume(alarm)
+
+    def on_resume(self, alarm):
+        late = -self._clock.seconds_until(alarm)
+        logging.info('resumed {0:.1f} seconds {1} the alarm'.format(abs(late), 'after' if late > 0 else 'before'))
+        if late >= 0:
+            # The resume took longer than the margin, rings anyway instead of counting a missed alarm
+            self._late_fire_until = alarm + datetime.timedelta(seconds=SUSPEND_LATE_FIRE)
+        self.update_wake_up_time() # The resume used up the RTC wake up time
         
     def get_available_channels(self):
         return self._channel_names
+
+    def get_history(self):
+        return self._history
+
+    def get_playback_manager(self):
+        return self._playback
+
+    def get_process_supervisor(self):
+        return self._supervisor
+
+    def set_status_page(self, status_page):
+        """Publishes the state to status_page from now on, on every change of the model"""
+        self._status_page = status_page
+        self._model.subscribe(self.on_model_changed)
+        self.publish_status()
+
+    def on_model_changed(self, changed):
+        self.publish_status()
+
+    def publish_status(self):
+        if self._status_page is None:
+            return
+        model = self._model
+        flags = StatusPage.RUNNING
+        flags |= StatusPage.PLAYING if model.is_radio_playing else 0
+        flags |= StatusPage.ALARM_ON if self._alarm_on else 0
+        flags |= StatusPage.DEAD_AIR if model.dead_air else 0
+        next_alarm = self.get_alarm_datetime().timestamp() if self._alarm_on else 0
+        self._status_page.publish(flags, self._alarm_state.value, model.radio_volume, model.radio_max_volume, self._alarm_volume, next_alarm, model.playing_channel or '', self._alarm_channel or '')
+
+    def get_stream_uptimes(self):
+        """channel -> seconds since its stream started, for the playing channel"""
+        uptime = self._core_radio.get_stream_uptime()
+        return dict() if uptime is None else {self._core_radio.get_playing_channel(): uptime}
+
+    def close(self):
+        if self._core_radio.get_playing_channel():
+            self._history.record(ListeningHistory.Event.stop) # As CoreRadio.stop() does
+        self._core_radio.end_stream_session()
+        self._playback.close()
+        self.save_catalog_cache()
+        self._history.close()
+        self._supervisor.close()
+        if self._metrics_exporter:
+            self._metrics_exporter.close()
+        if self._status_page:
+            self._model.unsubscribe(self.on_model_changed)
+            self._status_page.close()
+            self._status_page = None
+
+    def get_channel_list_names(self):
+        """The catalog (None) followed by the named lists"""
+        return [None] + sorted(self._channel_lists)
+
+    def get_channel_list_view(self, list_name=None):
+        """Channels of the list that are in the catalog, in the list's order"""
+        list_name = list_name or self._active_channel_list
+        if list_name is None or not self.is_catalog_loaded():
+            return self._channel_names
+        return [name for name in self._channel_lists.get(list_name, ()) if self._core_radio.has_channel(name)]
+
+    def set_channel_list(self, list_name, channel_names):
+        self._channel_lists[list_name] = list(channel_names)
+        self.publish_channel_list(list_name)
+
+    def set_active_channel_list(self, list_name):
+        if list_name is not None and not list_name in self._channel_lists:
+            raise Exception('Unknown channel list: {0}'.format(list_name))
+        self._active_channel_list = list_name
+        logging.info('active channel list: {0}'.format(list_name or 'catalog'))
+        self.publish_channel_list()
+
+    def next_channel_list(self):
+        names = self.get_channel_list_names()
+        self.set_active_channel_list(names[(names.index(self._active_channel_list) + 1) % len(names)])
+
+    def publish_channel_list(self, list_name=None):
+        if list_name is None or list_name == self._active_channel_list:
+            self._model.update(channels=self.get_channel_list_view(), channel_list=self._active_channel_list)
+
+    def is_favourite(self, channel):
+        return channel in self._channel_lists.get(FAVOURITES_LIST, ())
+
+    def toggle_favourite(self, channel):
+        favourites = self._channel_lists.setdefault(FAVOURITES_LIST, list())
+        if channel in favourites:
+            favourites.remove(channel)
+        else:
+            favourites.append(channel)
+        self.publish_channel_list(FAVOURITES_LIST)
+
+    def move_channel(self, channel, offset, view=None):
+        """Moves a channel of the active list by offset positions of the view, the list as
+        shown (get_channel_list_view() by default): the entries it hides are skipped.
+        The catalog keeps the channels file order"""
+        if self._active_channel_list is None:
+            return False
+        channels = self._channel_lists[self._active_channel_list]
+        view = self.get_channel_list_view() if view is None else view
+        index = view.index(channel)
+        target = view[max(0, min(index + offset, len(view) - 1))]
+        if target != channel:
+            channels.remove(channel)
+            # Before the target when moving up, after it when moving down
+            channels.insert(channels.index(target) + (1 if offset > 0 else 0), channel)
+            self.publish_channel_list()
+        return True
+
+    def get_dead_channels(self):
+        if not self.is_catalog_loaded():
+            return set()
+        return set(name for name in self._channel_names if self._catalog_cache.is_dead(self._core_radio.get_channel_url(name)))
+
+    def import_catalog(self, file_paths, list_name=None, progress_listener=None):
+        """Appends the stations of the files to the channels file and reloads the catalog.
+        If list_name is set, the imported channels are also added to that named list"""
+        importer = CatalogImporter(self._prefs['ClockRadio.ChannelsFile'])
+        importer.set_progress_listener(progress_listener)
+        importer.index_catalog()
+        importer.import_files(file_paths, collect_names=list_name is not None)
+        self.load_catalog()
+        if list_name:
+            self.set_channel_list(list_name, self._channel_lists.get(list_name, list()) + importer.imported_names)
+        return importer
+
+    def start_import(self, file_paths, list_name=None):
+        """Imports in background, the progress is published to the model"""
+        load_lazy_modules()
+        threading.Thread(target=self.import_in_background, args=(file_paths, list_name), name='catalog-import', daemon=True).start()
+
+    def import_in_background(self, file_paths, list_name):
+        self._model.update(import_progress=0.0)
+        try:
+            self.import_catalog(file_paths, list_name, lambda done, total, imported: self._model.update(import_progress=done/max(total, 1)))
+        except Exception:
+            logging.exception('catalog import failed')
+        finally:
+            self._model.update(import_progress=None)
+
+    def scan_channels(self, scanner=None):
+        scanner = scanner or StationScanner()
+        urls = [self._core_radio.get_channel_url(name) for name in self._channel_names]
+        for (url, health) in scanner.scan(urls).items():
+            self._catalog_cache.update(url, health)
+        self._catalog_cache.save()
     
     def is_radio_playing(self):
         return self._core_radio.is_playing()
@@ -416,18 +3667,24 @@ class ClockRadio:
     
     def play_radio(self, channel_name):
         self._core_radio.play(channel_name)
+
+    def resume_radio(self):
+        self._core_radio.resume_last_channel()
         
     def get_radio_volume(self):
         return self._core_radio.get_volume()
+
+    def get_audio_meter(self):
+        return self._core_radio.get_audio_meter()
         
     def get_radio_max_volume(self):
         return self._core_radio.get_max_volume()
         
-    def increase_radio_volume(self):
-        self._core_radio.increase_volume()
+    def increase_radio_volume(self, steps=1):
+        self._core_radio.increase_volume(steps)
     
-    def decrease_radio_volume(self):
-        self._core_radio.decrease_volume()
+    def decrease_radio_volume(self, steps=1):
+        self._core_radio.decrease_volume(steps)
     
     def set_fire_event_listener(self, listener):
         self._fire_event_listener = listener
@@ -437,17 +3694,59 @@ class ClockRadio:
     
     def set_snooze_timeout_event_listener(self, listener):
         self._snooze_timeout_event_listener = listener
+
+    def set_sleep_event_listener(self, listener):
+        """Called once the sleep timer stopped the radio"""
+        self._sleep_event_listener = listener
+
+    def set_sleep_timer(self, seconds):
+        """Stops the radio after seconds, fading it out over the last ClockRadio.SleepFadeDuration. None cancels"""
+        self._sleep_duration = seconds
+        self._sleep_deadline = None if seconds is None else self._clock.monotonic() + seconds
+        self._core_radio.set_fade(1)
+        logging.info('sleep timer {0}'.format('off' if seconds is None else 'set to {0:d} s'.format(seconds)))
+
+    def next_sleep_timer(self):
+        """Cycles through SLEEP_TIMER_DURATIONS and off"""
+        if self._sleep_duration in SLEEP_TIMER_DURATIONS:
+            index = SLEEP_TIMER_DURATIONS.index(self._sleep_duration) + 1
+        else:
+            index = 0
+        self.set_sleep_timer(SLEEP_TIMER_DURATIONS[index] if index < len(SLEEP_TIMER_DURATIONS) else None)
+
+    def get_sleep_countdown(self):
+        if self._sleep_deadline is None:
+            return None
+        return max(0, self._sleep_deadline - self._clock.monotonic())
+
+    def update_sleep_timer(self):
+        if self._sleep_deadline is None:
+            return
+        if self._alarm_state != ClockRadio.AlarmState.waiting or not self._core_radio.is_playing():
+            self.set_sleep_timer(None) # Stopped by hand or taken over by the alarm
+            return
+        countdown = self.get_sleep_countdown()
+        if countdown > 0:
+            self._core_radio.set_fade(min(1, countdown / self._prefs['ClockRadio.SleepFadeDuration']))
+            return
+        logging.info('sleep timer expired, stopping the radio')
+        self._core_radio.set_fade(0) # The player may take a while to stop, its last sound is at the end of the fade
+        self._core_radio.stop()
+        self.set_sleep_timer(None)
+        CoreRadio.release_spare_player()
+        if self._sleep_event_listener:
+            self._sleep_event_listener()
         
     def get_ringing_countdown(self):
         if self._alarm_state == ClockRadio.AlarmState.ringing:
-            ringing_time = time.clock() - self._ringing_start_time
+            ringing_time = self._clock.monotonic() - self._ringing_start_time
             return self._prefs['ClockRadio.RingingDuration'] - ringing_time
         else:
             return 0
     
     def get_snooze_countdown(self):
         if self._alarm_state == ClockRadio.AlarmState.snooze:
-            snooze_time = time.clock() - self._snooze_start_time
+            snooze_time = self._clock.monotonic() - self._snooze_start_time
             return self._prefs['ClockRadio.SnoozeDuration'] - snooze_time
         else:
             return 0
@@ -458,6 +3757,7 @@ class ClockRadio:
     def snooze(self):
         if self._alarm_state == ClockRadio.AlarmState.ringing:
             self._core_radio.stop()
+            self._playback.stop_alarm()
             self._snooze_counter += 1
             if self._snooze_counter <= self._prefs['ClockRadio.MaxSnoozes']:
                 self.do_transition(ClockRadio.AlarmState.snooze)
@@ -469,6 +3769,28 @@ class ClockRadio:
         else:
             raise Exception('Cannot snooze while in state {0}'.format(self._alarm_state))
     
+    def on_dead_air(self, is_dead_air):
+        if is_dead_air and self._alarm_state == ClockRadio.AlarmState.ringing:
+            self.fail_over_alarm()
+
+    def get_alarm_fallback_channels(self):
+        """The configured fallback channels, then the most played ones"""
+        channel_names = list(self._prefs['ClockRadio.AlarmFallbackChannels'])
+        channel_names += self._history.get_most_played(ALARM_FALLBACK_MOST_PLAYED)
+        return [name for name in channel_names if self._core_radio.has_channel(name)]
+
+    def fail_over_alarm(self):
+        """Moves a silent alarm to the next fallback channel not tried yet since it started ringing"""
+        self._alarm_tried_channels.add(self._core_radio.get_playing_channel())
+        for channel_name in self.get_alarm_fallback_channels():
+            if not channel_name in self._alarm_tried_channels:
+                logging.warning('dead air on the alarm, falling back to channel {0}'.format(channel_name))
+                self._alarm_tried_channels.add(channel_name)
+                self._core_radio.play(channel_name, self._alarm_volume)
+                return True
+        logging.error('dead air on the alarm and no fallback channel left')
+        return False
+
     def exit_alarm(self):
         if self._alarm_state == ClockRadio.AlarmState.ringing:
             self.do_transition(ClockRadio.AlarmState.waiting)
@@ -479,42 +3801,59 @@ class ClockRadio:
             
     def update_wake_up_time(self):
         if self._alarm_on:
-            alarm_datetime = datetime.datetime.combine(self._alarm_date, datetime.time(hour=self._alarm_time[0], minute=self._alarm_time[1], second=0))
+            alarm_datetime = self.get_alarm_datetime()
             logging.info('wake up time set to: {0}'.format(alarm_datetime))
-            # Must provide a value greater than 0, otherwise the wake up time will be disabled
-            alarm_after_seconds = max(1, round((alarm_datetime - datetime.datetime.now()).total_seconds()))
+            # Must provide a value greater than 0, otherwise the wake up time will be disabled.
+            # Counted on the absolute time, wall clock differences are off by an hour across DST changes
+            alarm_after_seconds = max(1, round(self._clock.seconds_until(alarm_datetime)))
             logging.debug('wake up in {0:d} seconds'.format(alarm_after_seconds))
-            System.set_wake_time_after_seconds(alarm_after_seconds)
+            self._system.set_wake_time_after_seconds(alarm_after_seconds)
         else:
             logging.info('wake up time disabled')
-            System.set_wake_time_after_seconds(0)
+            self._system.set_wake_time_after_seconds(0)
+        self.publish_status()
         
     def set_alarm_tomorrow(self):
-        self._alarm_date = datetime.datetime.now().date() + datetime.timedelta(days=1)
+        self._alarm_date = self._clock.now().date() + datetime.timedelta(days=1)
         
     # To be used in any wrapper main loop
     def update(self, dont_fire_alarm=False):
+        self._supervisor.update()
+        self._core_radio.update()
+        self._playback.update()
+        self.update_sleep_timer()
         if self._alarm_state == ClockRadio.AlarmState.waiting:
             if self.is_ready_to_ring():
                 self.do_transition(ClockRadio.AlarmState.ready_to_ring)
+            elif self.is_alarm_missed():
+                if self._alarm_on:
+                    self._missed_alarms += 1
+                    logging.warning('missed the alarm of {0}'.format(self.get_alarm_datetime()))
+                self._late_fire_until = None
+                self._alarm_date = self.get_next_alarm_date()
+                self.update_wake_up_time()
         elif self._alarm_state == ClockRadio.AlarmState.ready_to_ring:
             if not self.is_ready_to_ring():
                 self.do_transition(ClockRadio.AlarmState.waiting)
             elif self._alarm_on and not (self._core_radio.is_playing() or dont_fire_alarm):
                 logging.debug('firing alarm!')
+                Metrics.alarm_fire_latency.observe(max(0, (self._clock.now() - self.get_alarm_datetime()).total_seconds()))
                 self._core_radio.play(self._alarm_channel, self._alarm_volume)
+                self._playback.fire_alarm(self._alarm_channel, self._alarm_volume)
                 if self._fire_event_listener:
                     self._fire_event_listener()
                 self.do_transition(ClockRadio.AlarmState.ringing)
         elif self._alarm_state == ClockRadio.AlarmState.ringing:
             if self.get_ringing_countdown() <= 0:
                 self._core_radio.stop()
+                self._playback.stop_alarm()
                 if self._ringing_timeout_event_listener:
                     self._ringing_timeout_event_listener()
                 self.do_transition(ClockRadio.AlarmState.waiting)
         elif self._alarm_state == ClockRadio.AlarmState.snooze:
             if self.get_snooze_countdown() <= 0:
                 self._core_radio.play(self._alarm_channel, self._alarm_volume)
+                self._playback.fire_alarm(self._alarm_channel, self._alarm_volume)
                 if self._snooze_timeout_event_listener:
                     self._snooze_timeout_event_listener()
                 self.do_transition(ClockRadio.AlarmState.ringing)
@@ -524,43 +3863,64 @@ class ClockRadio:
         if self._alarm_state == ClockRadio.AlarmState.waiting and next_state == ClockRadio.AlarmState.ready_to_ring:
             pass
         elif self._alarm_state == ClockRadio.AlarmState.ready_to_ring and next_state == ClockRadio.AlarmState.waiting:
+            self._late_fire_until = None
             if not self._alarm_time_changed:
                 self.set_alarm_tomorrow()
             self.update_wake_up_time()
         elif self._alarm_state == ClockRadio.AlarmState.ready_to_ring and next_state == ClockRadio.AlarmState.ringing:
+           self._late_fire_until = None
            if not self._alarm_time_changed:
                 self.set_alarm_tomorrow()
            self.update_wake_up_time()
-           self._ringing_start_time = time.clock()
+           self._ringing_start_time = self._clock.monotonic()
            self._snooze_start_time = -1
+           self._snooze_counter = 0 # Snoozes left to a new alarm
+           self._alarm_tried_channels = set()
         elif self._alarm_state == ClockRadio.AlarmState.ringing and next_state == ClockRadio.AlarmState.waiting:
             self._ringing_start_time = -1
             self._snooze_start_time = -1
         elif self._alarm_state == ClockRadio.AlarmState.ringing and next_state == ClockRadio.AlarmState.snooze:
-            self._snooze_start_time = time.clock()
+            self._snooze_start_time = self._clock.monotonic()
             self._ringing_start_time = -1
         elif self._alarm_state == ClockRadio.AlarmState.snooze and next_state == ClockRadio.AlarmState.waiting:
             self._ringing_start_time = -1
             self._snooze_start_time = -1
         elif self._alarm_state == ClockRadio.AlarmState.snooze and next_state == ClockRadio.AlarmState.ringing:
-           self._ringing_start_time = time.clock()
+           self._ringing_start_time = self._clock.monotonic()
            self._snooze_start_time = -1
+           self._alarm_tried_channels = set()
         else:
             raise Exception('Unknown transition: {0} -> {1}'.format(self._alarm_state, next_state))
+        self._history.record(ListeningHistory.Event.alarm, next_state.value, self._alarm_channel or '')
         self._alarm_state = next_state
+        self.publish_alarm()
         
     def sync_preferences(self):
         self._prefs['ClockRadio.AlarmOn'] = self._alarm_on
         self._prefs['ClockRadio.AlarmTime'] = self._alarm_time
         self._prefs['ClockRadio.AlarmChannel'] = self._alarm_channel
         self._prefs['ClockRadio.AlarmVolume'] = self._alarm_volume
+        self._prefs['ClockRadio.ChannelLists'] = dict((name, list(channels)) for name, channels in self._channel_lists.items())
+        self._prefs['ClockRadio.ActiveChannelList'] = self._active_channel_list
         self._core_radio.sync_preferences()
+        self._playback.sync_preferences()
+        self.save_catalog_cache()
+
+    def save_catalog_cache(self):
+        """Only written when changed, the stream statistics of a stopped channel"""
+        if self._catalog_cache is not None and self._catalog_cache.is_modified():
+            self._catalog_cache.save()
         
     def get_default_preferences():
         result = dict()
         result['ClockRadio.AlarmOn'] = ALARM_ON
         result['ClockRadio.AlarmTime'] = ALARM_TIME
         result['ClockRadio.ChannelsFile'] = CHANNELS_FILE
+        result['ClockRadio.CatalogCacheFile'] = CATALOG_CACHE_FILE
+        result['ClockRadio.HistoryFile'] = HISTORY_FILE
+        result['ClockRadio.HistoryMaxSize'] = HISTORY_MAX_SIZE
+        result['ClockRadio.ChannelLists'] = dict()
+        result['ClockRadio.ActiveChannelList'] = None
         result['ClockRadio.AlarmChannel'] = ALARM_CHANNEL
         result['ClockRadio.AlarmVolume'] = START_VOLUME
         result['ClockRadio.VolumeMax'] = VOLUME_MAX
@@ -569,7 +3929,13 @@ class ClockRadio:
         result['ClockRadio.RingingDuration'] = ALARM_RINGING_DURATION
         result['ClockRadio.MaxSnoozes'] = MAX_SNOOZES
         result['ClockRadio.SnoozeDuration'] = SNOOZE_DURATION
+        result['ClockRadio.AlarmFallbackChannels'] = list()
+        result['ClockRadio.SuspendMargin'] = SUSPEND_MARGIN
+        result['ClockRadio.SleepFadeDuration'] = SLEEP_FADE_DURATION
         result.update(CoreRadio.get_default_preferences())
+        result.update(PlaybackManager.get_default_preferences())
+        result.update(MetricsExporter.get_default_preferences())
+        result.update(StatusPage.get_default_preferences())
         return result
 
 class CursesWrapper:
@@ -594,6 +3960,8 @@ class CursesWrapper:
         decrease_volume = [curses.KEY_LEFT]
         play_radio = [ord('P'), ord('p')]
         stop_radio = [ord('S'), ord('s')]
+        suspend = [ord('S'), ord('s')]
+        sleep_timer = [ord('Z'), ord('z')]
         enable_alarm = [ord('E'), ord('e')]
         disable_alarm = [ord('D'), ord('d')]
         set_alarm_time = [ord('T'), ord('t')]
@@ -607,31 +3975,242 @@ class CursesWrapper:
         next_digit = [curses.KEY_RIGHT]
         previous_digit = [curses.KEY_LEFT]
         exit_alarm = [curses.ascii.ESC]
-        
-    main_frame = None
-    radio_frame = None
-    alarm_frame = None
-    exit_dialog = None
-    alarm_dialog = None
+        switch_channel_list = [ord('L'), ord('l')]
+        toggle_favourite = [ord('F'), ord('f')]
+        move_channel_up = [curses.KEY_SR, ord('<')]
+        move_channel_down = [curses.KEY_SF, ord('>')]
+
+    Command = enum.Enum('Command', [name for name in vars(KeyMappings) if not name.startswith('_')])
+
+    # Repeats of these commands are merged into a single command with a count
+    REPEATABLE_COMMANDS = frozenset((Command.change_channel_up, Command.change_channel_down, Command.increase_volume, Command.decrease_volume, Command.increase_time, Command.decrease_time, Command.move_channel_up, Command.move_channel_down))
+
+    class RenderScheduler:
+
+        """Decides how long the GUI loop sleeps and when it redraws. Frames follow input at
+        a high rate for a little while, otherwise the screen is redrawn on wall clock second
+        boundaries. On battery both are throttled. CPU time, wakeups and frames are
+        accounted for each mode"""
+
+        class Mode(enum.Enum):
+            active = 0
+            idle = 1
+            battery = 2
+            low_battery = 3
+            asleep = 4
+
+        # Mode -> (minimum time between two frames, period of the redraws without changes)
+        SETTINGS = {Mode.active: (RENDER_ACTIVE_INTERVAL, 1), Mode.idle: (RENDER_IDLE_INTERVAL, 1), Mode.battery: (RENDER_BATTERY_INTERVAL, 1), Mode.low_battery: (RENDER_LOW_BATTERY_INTERVAL, RENDER_LOW_BATTERY_TICK), Mode.asleep: (RENDER_LOW_BATTERY_INTERVAL, RENDER_LOW_BATTERY_TICK)}
+
+        def __init__(self):
+            self._mode = CursesWrapper.RenderScheduler.Mode.idle
+            self._power = (System.BatteryState.unknown, -1)
+            self._last_input_time = time.monotonic() - RENDER_ACTIVE_DURATION
+            self._asleep = False
+            self._last_frame_time = -1
+            self._next_tick = 0
+            self._animation_interval = None
+            self._next_animation = 0
+            self._stats = dict((mode, [0, 0, 0, 0]) for mode in CursesWrapper.RenderScheduler.Mode) # Seconds, wakeups, frames, cpu seconds
+            self._mark = (time.monotonic(), time.process_time())
+            self._last_report = self._mark[0]
+
+        def set_power_state(self, status, charge):
+            self._power = (status, charge)
+
+        def notify_input(self):
+            self._last_input_time = time.monotonic()
+            self._asleep = False
+
+        def set_asleep(self, flag):
+            """Lowest refresh until the next key, after the sleep timer"""
+            self._asleep = flag
+
+        def is_asleep(self):
+            return self._asleep
+
+        def get_idle_time(self):
+            """Seconds since the last key"""
+            return time.monotonic() - self._last_input_time
+
+        def get_mode(self):
+            return self._mode
+
+        def get_tick(self):
+            return CursesWrapper.RenderScheduler.SETTINGS[self._mode][1]
+
+        def set_animation(self, interval):
+            """Wakes the loop every interval seconds for animated widgets, None to stop.
+            Never faster than the frames of the mode, and not at all on low battery"""
+            self._animation_interval = interval
+
+        def get_animation_interval(self):
+            if self._animation_interval is None or self._mode in (CursesWrapper.RenderScheduler.Mode.low_battery, CursesWrapper.RenderScheduler.Mode.asleep):
+                return None
+            return max(self._animation_interval, CursesWrapper.RenderScheduler.SETTINGS[self._mode][0])
+
+        def update_mode(self, now):
+            (status, charge) = self._power
+            if self._asleep:
+                mode = CursesWrapper.RenderScheduler.Mode.asleep
+            elif status == System.BatteryState.discharging:
+                mode = CursesWrapper.RenderScheduler.Mode.low_battery if charge <= BATTERY_LOW_CHARGE else CursesWrapper.RenderScheduler.Mode.battery
+            elif now - self._last_input_time < RENDER_ACTIVE_DURATION:
+                mode = CursesWrapper.RenderScheduler.Mode.active
+            else:
+                mode = CursesWrapper.RenderScheduler.Mode.idle
+            if mode != self._mode:
+                logging.debug('render mode {0}'.format(mode.name))
+                self.account(now)
+                self._mode = mode
+                self._next_tick = min(self._next_tick, self.get_next_tick())
+
+        def get_next_tick(self):
+            tick = self.get_tick()
+            return (int(time.time() / tick) + 1) * tick
+
+        def get_timeout(self, needs_redraw, busy):
+            """Milliseconds the loop may wait for input"""
+            now = time.monotonic()
+            self.update_mode(now)
+            if busy:
+                return 0
+            frame_wait = self._last_frame_time + CursesWrapper.RenderScheduler.SETTINGS[self._mode][0] - now
+            if needs_redraw:
+                wait = frame_wait
+            else:
+                # A tick right after a frame waits for the frame interval, as is_frame_due() does
+                wait = max(self._next_tick - time.time(), frame_wait)
+                animation_interval = self.get_animation_interval()
+                if animation_interval is not None:
+                    # Animation wakeups have their own schedule, they only give a frame when the widget changed
+                    if now >= self._next_animation:
+                        self._next_animation = now + animation_interval
+                    wait = min(wait, self._next_animation - now)
+            return max(0, min(int(wait * 1000) + 1, int(RENDER_MAX_SLEEP * 1000)))
+
+        def is_frame_due(self, needs_redraw):
+            if time.monotonic() - self._last_frame_time < CursesWrapper.RenderScheduler.SETTINGS[self._mode][0]:
+                return False
+            return needs_redraw or time.time() >= self._next_tick
+
+        def notify_frame(self):
+            self._last_frame_time = time.monotonic()
+            self._next_tick = self.get_next_tick()
+            self._stats[self._mode][2] += 1
+
+        def notify_wakeup(self):
+            now = time.monotonic()
+            self._stats[self._mode][1] += 1
+            self.account(now)
+            if now - self._last_report >= RENDER_STATS_INTERVAL:
+                self._last_report = now
+                self.report()
+
+        def account(self, now):
+            cpu = time.process_time()
+            stats = self._stats[self._mode]
+            stats[0] += now - self._mark[0]
+            stats[3] += cpu - self._mark[1]
+            self._mark = (now, cpu)
+
+        def get_stats(self):
+            """Mode -> (seconds, wakeups per minute, frames per minute, cpu share) of the modes used so far"""
+            return dict((mode, (seconds, 60 * wakeups / seconds, 60 * frames / seconds, cpu / seconds)) for (mode, (seconds, wakeups, frames, cpu)) in self._stats.items() if seconds > 0)
+
+        def report(self):
+            for (mode, (seconds, wakeups, frames, cpu)) in self.get_stats().items():
+                logging.info('render mode {0}: {1:.0f} s, {2:.1f} wakeups/min, {3:.1f} frames/min, cpu {4:.2%}'.format(mode.name, seconds, wakeups, frames, cpu))
+
+    class KeyMap:
 
-    def __init__(self, prefs):
+        """Compiled keycode to command table of a GUI state"""
+
+        def __init__(self, command_names, overrides=None):
+            self._commands = dict()
+            overrides = overrides or dict()
+            for name in command_names:
+                keys = overrides.get(name, getattr(CursesWrapper.KeyMappings, name))
+                for key in keys:
+                    self._commands[CursesWrapper.KeyMap.to_keycode(key)] = CursesWrapper.Command[name]
+
+        def lookup(self, ch):
+            return self._commands.get(ch)
+
+        def to_keycode(key):
+            if isinstance(key, int):
+                return key
+            elif key == 'ESC':
+                return curses.ascii.ESC
+            elif key.startswith('KEY_'):
+                return getattr(curses, key)
+            elif len(key) == 1:
+                return ord(key)
+            raise Exception('Invalid key binding: {0}'.format(key))
+
+    class LazyState:
+
+        """GUI state class attribute, the state is constructed on first access"""
+
+        def __init__(self, state_class_name):
+            self._state_class_name = state_class_name
+            self._state = None
+
+        def __get__(self, obj, owner):
+            if self._state is None:
+                self._state = getattr(owner, self._state_class_name)(owner.instance)
+            return self._state
+
+    instance = None
+    main_frame = LazyState('MainFrameState')
+    radio_frame = LazyState('RadioFrameState')
+    alarm_frame = LazyState('AlarmFrameState')
+    exit_dialog = LazyState('ExitDialogState')
+    alarm_dialog = LazyState('AlarmDialogState')
+    snooze_dialog = LazyState('SnoozeDialogState')
+    insert_alarm_time_dialog = LazyState('InsertAlarmTimeDialogState')
+
+    def __init__(self, prefs, fast_start=False, auto_resume=False, import_files=None, import_list=None):
+        CursesWrapper.instance = self
         self._prefs = prefs
-        self._current_channel = self._prefs['CursesWrapper.CurrentChannel']
+        self._fast_start = fast_start
+        self._auto_resume = auto_resume
+        self._import_files = import_files
+        self._import_list = import_list
+        if self._auto_resume:
+            # Spawning and connecting overlaps with curses initialization and catalog loading
+            CoreRadio.prespawn_player(self._prefs, resume=True)
+        self._current_channel = None
         self._current_window = None
         self._current_panel = None
         self._screen_size = (0, 0)
-        CursesWrapper.main_frame = CursesWrapper.MainFrameState(self)
-        CursesWrapper.radio_frame = CursesWrapper.RadioFrameState(self)
-        CursesWrapper.alarm_frame = CursesWrapper.AlarmFrameState(self)
-        CursesWrapper.exit_dialog = CursesWrapper.ExitDialogState(self)
-        CursesWrapper.alarm_dialog = CursesWrapper.AlarmDialogState(self)
-        CursesWrapper.snooze_dialog = CursesWrapper.SnoozeDialogState(self)
-        CursesWrapper.insert_alarm_time_dialog = CursesWrapper.InsertAlarmTimeDialogState(self)
-        
-        self._clock_radio = ClockRadio(self._prefs)
+        self._model = RadioModel()
+        self._model.subscribe(self.on_model_changed)
+        self._needs_redraw = True
+        self._save_deadline = None
+        self._last_key = -1
+        self._last_key_time = 0
+        self._key_repeats = 0
+        self._pending_keys = list()
+        self._resize_pending = False
+        self._screen_too_small = False
+        self._repeat_count = 1
+        self._scheduler = CursesWrapper.RenderScheduler()
+        self._clock_radio = None
+        if not self._fast_start:
+            self.init_clock_radio()
         self._states_stack = list()
         os.environ['ESCDELAY'] = '25' # Reduces the delay after pressing ESC in curses
         curses.wrapper(CursesWrapper.main_loop, self)
+
+    def init_clock_radio(self):
+        self._current_channel = self._prefs['CursesWrapper.CurrentChannel']
+        self._clock_radio = ClockRadio(self._prefs, deferred_loading=self._fast_start, model=self._model)
+        if self._prefs['StatusPage.File']:
+            try:
+                self._clock_radio.set_status_page(StatusPage(self._prefs['StatusPage.File']))
+            except OSError:
+                logging.exception('could not publish the status')
     
     def __del__(self):
         pass
@@ -642,21 +4221,47 @@ class CursesWrapper:
         self._current_panel = curses.panel.new_panel(window)
         curses.panel.update_panels()
         curses.curs_set(0)
-        window.nodelay(1)
+        if self._clock_radio is None:
+            self.init_clock_radio() # Fast start: preferences were loading while curses was initializing
+        if self._auto_resume:
+            self._clock_radio.resume_radio()
         self.push_state(CursesWrapper.main_frame)
         self.push_state(CursesWrapper.radio_frame)
-        last_draw_time = -CURSES_UPDATE_TIME
+        self.draw()
+        self._scheduler.notify_frame()
+        StartupProfiler.mark('first_frame')
+        StartupProfiler.report()
+        if self._fast_start:
+            self._clock_radio.start_deferred_loading()
+        if self._import_files:
+            self._clock_radio.start_import(self._import_files, self._import_list)
         while len(self._states_stack) > 0:
             self.clear_input()
-            self.consume_input(window)
+            # Sleeps in getch until a key, the next frame or the next tick
+            self.consume_input(window, self.get_input_timeout())
+            self._scheduler.notify_wakeup()
+            Metrics.loop_iterations.inc()
             self.update()
-            if time.clock() - last_draw_time > CURSES_UPDATE_TIME:
+            self.suspend_when_idle()
+            if self._scheduler.is_frame_due(self._needs_redraw):
+                frame_start = time.perf_counter()
                 self.draw()
-                last_draw_time = time.clock()
+                Metrics.frame_seconds.observe(time.perf_counter() - frame_start)
+                self._scheduler.notify_frame()
+        self._scheduler.report()
+        self.flush_preferences()
+        self._clock_radio.close()
         window.clear()
         window.noutrefresh()
         curses.doupdate()
 
+    def get_input_timeout(self):
+        timeout = self._scheduler.get_timeout(self._needs_redraw, len(self._pending_keys) > 0)
+        if self._clock_radio.is_player_starting():
+            # getch does not wake up on the player events, the first audio would wait for the next tick
+            timeout = min(timeout, int(RENDER_PLAYER_START_SLEEP * 1000))
+        return timeout
+
     def get_screen_size(self):
         return self._screen_size
         
@@ -674,12 +4279,14 @@ class CursesWrapper:
 
     def push_state(self, state):
         logging.debug('push_state({0})'.format(type(state).__name__))
+        self._needs_redraw = True
         self._states_stack.append(state)
         logging.debug('{0}.on_enter()'.format(type(state).__name__))
         self.top_state().on_enter()
 
     def pop_state(self, state):
        logging.debug('pop_state({0})'.format(type(state).__name__))
+       self._needs_redraw = True
        while True:
         s = self._states_stack.pop()
         logging.debug('{0}.on_exit()'.format(type(s).__name__))
@@ -688,30 +4295,151 @@ class CursesWrapper:
             break
 
     def draw(self):
-        for s in self._states_stack:
-            s.draw()
+        self._needs_redraw = False
+        if self._screen_too_small:
+            self._current_panel.window().erase()
+            self._current_panel.window().addstr(0, 0, 'Terminal too small'[:self._screen_size[1]-1])
+            self._current_panel.window().noutrefresh()
+        else:
+            for s in self._states_stack:
+                s.draw()
         curses.doupdate()
 
+    def resize(self, window):
+        """Applies the new terminal size to the existing windows, bottom state first"""
+        self._screen_size = window.getmaxyx()
+        logging.info('terminal resized to {0}x{1}'.format(self._screen_size[1], self._screen_size[0]))
+        CursesWrapper.SubWinState.padding_formats.clear()
+        window.erase()
+        window.noutrefresh()
+        self._needs_redraw = True
+        self._screen_too_small = self._screen_size[0] < SCREEN_MIN_ROWS or self._screen_size[1] < SCREEN_MIN_COLS
+        if not self._screen_too_small:
+            # Windows are released top down (children first) and rebuilt bottom up from the cached layouts
+            self.set_current_window(window)
+            for s in reversed(self._states_stack):
+                s.release_windows()
+            for s in self._states_stack:
+                s.on_resize()
+            curses.panel.update_panels()
+
+    def request_redraw(self):
+        self._needs_redraw = True
+
+    def suspend(self):
+        """Suspends to RAM until shortly before the next alarm, False if there is something to do"""
+        if not self._clock_radio.can_suspend():
+            return False
+        self.save_preferences()
+        self._clock_radio.suspend_until_alarm()
+        # The console may have been reset while suspended, repaint all of it
+        self._current_panel.window().clearok(True)
+        self._current_panel.window().noutrefresh()
+        self._needs_redraw = True
+        if self._prefs['CoreRadio.Backend'] != 'null' and CoreRadio.spare_player is None:
+            CoreRadio.prespawn_player(self._prefs, resume=False, cache=self._clock_radio.get_alarm_cache_settings()) # Ready for the alarm
+        return True
+
+    def suspend_when_idle(self):
+        idle_time = self._prefs['CursesWrapper.SuspendIdleTime']
+        if idle_time is not None and self._scheduler.get_idle_time() >= idle_time and not isinstance(self.top_state(), CursesWrapper.DialogFrameState):
+            if self.suspend():
+                self._scheduler.notify_input() # Idle time counted again from the resume
+
+    def set_power_state(self, status, charge):
+        self._scheduler.set_power_state(status, charge)
+        Metrics.battery_charge.set(charge)
+
+    def get_render_tick(self):
+        return self._scheduler.get_tick()
+
+    def set_asleep(self, flag):
+        self._scheduler.set_asleep(flag)
+
+    def is_asleep(self):
+        return self._scheduler.is_asleep()
+
+    def request_animation(self, interval):
+        self._scheduler.set_animation(interval)
+
+    def on_model_changed(self, changed):
+        self._needs_redraw = True
+        if 'import_progress' in changed and self._model.import_progress is None:
+            self.request_save() # Named list of the imported channels
+        for s in list(self._states_stack):
+            s.on_model_changed(changed)
+
     def clear_input(self):
         for s in reversed(self._states_stack):
             s.clear_input()
 
-    def consume_input(self, window):
-        ch = window.getch()
-        if ch != -1:
-            logging.debug('typed character {0:d}'.format(ch))
+    def consume_input(self, window, timeout=0):
+        self.drain_input(window, timeout)
+        if self._resize_pending:
+            self._resize_pending = False
+            self.resize(window)
+        if self._screen_too_small:
+            self._pending_keys.clear()
+        elif len(self._pending_keys) > 0:
+            (ch, count) = self._pending_keys.pop(0)
+            logging.debug('typed character {0:d} (x{1:d})'.format(ch, count))
+            self._needs_redraw = True
+            self._scheduler.notify_input()
+            self._repeat_count = count
+            self.track_key_repeat(ch, count)
             for s in reversed(self._states_stack):
                 if s.consume_input(ch):
                     logging.debug('{0}.consume_input({1:d})'.format(type(s).__name__, ch))
                     return
             curses.beep()
 
+    def drain_input(self, window, timeout=0):
+        # Waits up to timeout ms for the first key, then reads every pending key so a burst of repeats is handled in one update
+        window.timeout(timeout)
+        ch = window.getch()
+        window.timeout(0)
+        # Repeatable commands leave the state as it is, so the top state tells which keys
+        # to merge only up to the first other key: that one may change the state
+        state = self.top_state()
+        coalescing = all(state.is_repeatable(key) for (key, count) in self._pending_keys)
+        while ch != -1:
+            if ch == curses.KEY_RESIZE:
+                self._resize_pending = True
+            elif coalescing and len(self._pending_keys) > 0 and self._pending_keys[-1][0] == ch and state.is_repeatable(ch):
+                self._pending_keys[-1] = (ch, self._pending_keys[-1][1]+1)
+            else:
+                self._pending_keys.append((ch, 1))
+                coalescing = coalescing and state.is_repeatable(ch)
+            ch = window.getch()
+
+    def track_key_repeat(self, ch, count=1):
+        now = time.monotonic()
+        if ch == self._last_key and now - self._last_key_time <= KEY_REPEAT_INTERVAL:
+            self._key_repeats += count
+        else:
+            self._key_repeats = count - 1
+        self._last_key = ch
+        self._last_key_time = now
+
+    def get_repeat_count(self):
+        return self._repeat_count
+
+    def get_repeat_steps(self, max_acceleration=KEY_REPEAT_MAX_STEPS):
+        # Held keys move 1, 2, 4... steps at a time. The acceleration applies once to a burst of
+        # coalesced repeats, each of the other repeats moves a single step
+        acceleration = min(2 ** (self._key_repeats // KEY_REPEAT_ACCELERATION_STEP), max_acceleration)
+        return self._repeat_count - 1 + acceleration
+
     def update_clock_radio_state(self):
         dont_fire_alarm = self.top_state() != CursesWrapper.radio_frame
         self._clock_radio.update(dont_fire_alarm=dont_fire_alarm)
         
     def update(self):
         self.update_clock_radio_state()
+        self._model.dispatch()
+        self._scheduler.set_animation(None) # Requested again by the states still animating
+        if self._save_deadline is not None and time.monotonic() >= self._save_deadline:
+            self.save_preferences()
         actions_stack = list()
         for s in reversed(self._states_stack):
             actions_stack.insert(0, (s.update()))
@@ -738,9 +4466,27 @@ class CursesWrapper:
         self._prefs['CursesWrapper.CurrentChannel'] = self._current_channel
         self._clock_radio.sync_preferences()
 
+    def save_preferences(self):
+        self._save_deadline = None
+        self.sync_preferences()
+        self._prefs.save()
+
+    def request_save(self):
+        # Coalesces the saves of repeated keys into one write
+        if self._save_deadline is None:
+            self._save_deadline = time.monotonic() + PREFERENCES_SAVE_DELAY
+
+    def flush_preferences(self):
+        if self._save_deadline is not None:
+            self.save_preferences()
+
     def get_default_preferences():
         result = dict()
         result['CursesWrapper.CurrentChannel'] = None
+        result['CursesWrapper.DeadChannels'] = DEAD_CHANNELS_MARK
+        result['CursesWrapper.KeyBindings'] = dict()
+        result['CursesWrapper.ChannelOrder'] = CHANNEL_ORDER_CATALOG
+        result['CursesWrapper.SuspendIdleTime'] = None # Seconds without a key before suspending until the alarm
         result.update(ClockRadio.get_default_preferences())
         return result
 
@@ -748,9 +4494,13 @@ class CursesWrapper:
 
         """Default implementation for all GUI states"""
 
+        COMMANDS = ()
+
         def __init__(self, fsm):
             self._fsm = fsm
             self._ch = -1
+            self._command = None
+            self._keymap = CursesWrapper.KeyMap(self.COMMANDS, fsm._prefs['CursesWrapper.KeyBindings'])
 
         def __del__(self):
             pass
@@ -766,14 +4516,55 @@ class CursesWrapper:
 
         def clear_input(self):
             self._ch = -1
+            self._command = None
             
         def consume_input(self, ch):
-            self._ch = -1
-            return False
+            self._command = self._keymap.lookup(ch)
+            self._ch = ch if self._command is not None else -1
+            return self._command is not None
+
+        def is_repeatable(self, ch):
+            return self._keymap.lookup(ch) in CursesWrapper.REPEATABLE_COMMANDS
+
+        def get_repeat_count(self):
+            return self._fsm.get_repeat_count()
+
+        def get_repeat_steps(self, max_acceleration=KEY_REPEAT_MAX_STEPS):
+            return self._fsm.get_repeat_steps(max_acceleration)
 
         def update(self):
             return (CursesWrapper.Action.no_op, None)
 
+        def on_model_changed(self, changed):
+            pass
+
+        def release_windows(self):
+            pass
+
+        def on_resize(self):
+            pass
+
+        def get_model(self):
+            return self._fsm._model
+
+        def request_redraw(self):
+            self._fsm.request_redraw()
+
+        def set_power_state(self, status, charge):
+            self._fsm.set_power_state(status, charge)
+
+        def get_render_tick(self):
+            return self._fsm.get_render_tick()
+
+        def set_asleep(self, flag):
+            self._fsm.set_asleep(flag)
+
+        def is_asleep(self):
+            return self._fsm.is_asleep()
+
+        def request_animation(self, interval):
+            self._fsm.request_animation(interval)
+
         def get_screen_size(self):
             return self._fsm.get_screen_size()
             
@@ -790,43 +4581,55 @@ class CursesWrapper:
             return self._fsm.bottom_state()
         
         def is_alarm_on(self):
-            return self._fsm._clock_radio.is_alarm_on()
+            return self._fsm._model.alarm_on
 
         def toggle_alarm(self):
             return self._fsm._clock_radio.toggle_alarm()
             
         def get_alarm_time(self):
-            return self._fsm._clock_radio.get_alarm_time()
+            return self._fsm._model.alarm_time
 
         def get_alarm_volume(self):
-            return self._fsm._clock_radio.get_alarm_volume()
+            return self._fsm._model.alarm_volume
 
         def get_alarm_max_volume(self):
-            return self._fsm._clock_radio.get_alarm_max_volume()
+            return self._fsm._model.alarm_max_volume
             
         def get_alarm_channel(self):
-            return self._fsm._clock_radio.get_alarm_channel()
+            return self._fsm._model.alarm_channel
 
         def set_alarm_time(self, time):
             self._fsm._clock_radio.set_alarm_time(time)
 
-        def increase_alarm_volume(self):
-            self._fsm._clock_radio.increase_alarm_volume()
+        def increase_alarm_volume(self, steps=1):
+            self._fsm._clock_radio.increase_alarm_volume(steps)
         
-        def decrease_alarm_volume(self):
-            self._fsm._clock_radio.decrease_alarm_volume()
+        def decrease_alarm_volume(self, steps=1):
+            self._fsm._clock_radio.decrease_alarm_volume(steps)
             
         def set_alarm_channel(self, channel):
             self._fsm._clock_radio.set_alarm_channel(channel)
             
         def get_radio_channels(self):
-            return self._fsm._clock_radio.get_available_channels()
+            channels = self._fsm._model.channels
+            if self._fsm._prefs['CursesWrapper.DeadChannels'] == DEAD_CHANNELS_HIDE:
+                dead_channels = self.get_dead_channels()
+                channels = [c for c in channels if not c in dead_channels]
+            if self._fsm._prefs['CursesWrapper.ChannelOrder'] == CHANNEL_ORDER_MOST_PLAYED and self._fsm._model.channel_list is None:
+                ranking = self._fsm._clock_radio.get_history().get_ranking()
+                channels = sorted(channels, key=lambda c: -ranking.get(c, 0))
+            return channels
+
+        def get_dead_channels(self):
+            if self._fsm._prefs['CursesWrapper.DeadChannels'] == DEAD_CHANNELS_SHOW:
+                return set()
+            return self._fsm._clock_radio.get_dead_channels()
         
         def get_playing_channel(self):
-            return self._fsm._clock_radio.get_playing_channel()
+            return self._fsm._model.playing_channel
 
         def is_radio_playing(self):
-            return self._fsm._clock_radio.is_radio_playing()
+            return self._fsm._model.is_radio_playing
         
         def stop_radio(self):
             self._fsm._clock_radio.stop_radio()
@@ -835,17 +4638,29 @@ class CursesWrapper:
             self._fsm._clock_radio.play_radio(self.get_current_channel())
             
         def get_radio_volume(self):
-            return self._fsm._clock_radio.get_radio_volume()
+            return self._fsm._model.radio_volume
+
+        def get_audio_meter(self):
+            return self._fsm._clock_radio.get_audio_meter()
         
         def get_radio_max_volume(self):
-            return self._fsm._clock_radio.get_radio_max_volume()
+            return self._fsm._model.radio_max_volume
            
-        def increase_radio_volume(self):
-            self._fsm._clock_radio.increase_radio_volume()
+        def increase_radio_volume(self, steps=1):
+            self._fsm._clock_radio.increase_radio_volume(steps)
         
-        def decrease_radio_volume(self):
-            self._fsm._clock_radio.decrease_radio_volume()
+        def decrease_radio_volume(self, steps=1):
+            self._fsm._clock_radio.decrease_radio_volume(steps)
             
+        def next_channel_list(self):
+            self._fsm._clock_radio.next_channel_list()
+
+        def toggle_favourite(self, channel):
+            self._fsm._clock_radio.toggle_favourite(channel)
+
+        def move_channel(self, channel, offset, view=None):
+            return self._fsm._clock_radio.move_channel(channel, offset, view)
+
         def set_current_channel(self, channel):
             self._fsm._current_channel = channel
         
@@ -875,29 +4690,69 @@ class CursesWrapper:
 
         def set_snooze_timeout_event_listener(self, listener):
             self._fsm._clock_radio.set_snooze_timeout_event_listener(listener)
+
+        def set_sleep_event_listener(self, listener):
+            self._fsm._clock_radio.set_sleep_event_listener(listener)
+
+        def next_sleep_timer(self):
+            self._fsm._clock_radio.next_sleep_timer()
+
+        def get_sleep_countdown(self):
+            return self._fsm._clock_radio.get_sleep_countdown()
                
         def save_preferences(self):
-            self._fsm.sync_preferences()
-            self._fsm._prefs.save()
+            self._fsm.save_preferences()
+
+        def request_save(self):
+            self._fsm.request_save()
         
     class SubWinState(BaseState):
     
         """ Common behaviour for sub windows"""
         
+        # Padding formats by (alignment, width), only the current width is kept after a resize
+        padding_formats = dict()
+
         def __init__(self, fsm):
             super().__init__(fsm)
+            self._layouts = dict()
             
         def __del__(self):
             super().__del__()
 
         def on_enter(self):
             super().on_enter()
-            self._parent_window = self.get_current_window()
-            (prows, pcols) = self._parent_window.getmaxyx()
             self._sub_windows = list()
-            self._child_window = self.create_sub_windows(prows, pcols)
+            self.create_windows()
+
+        def create_windows(self):
+            self._parent_window = self.get_current_window()
+            self._child_window = None
+            for (name, geometry) in self.get_layout(self._parent_window.getmaxyx()):
+                window = self._parent_window.derwin(*geometry)
+                setattr(self, name, window)
+                if name != '_child_window':
+                    self.add_sub_window(window)
+                    window.border()
+                    window.noutrefresh()
             self.set_current_window(self._child_window)
 
+        def get_layout(self, parent_size):
+            """(attribute name, (rows, cols, y, x)) of each sub window, '_child_window' hosts the next state"""
+            if not parent_size in self._layouts:
+                self._layouts[parent_size] = self.compute_layout(*parent_size)
+            return self._layouts[parent_size]
+
+        def release_windows(self):
+            for (name, geometry) in self.get_layout(self._parent_window.getmaxyx()):
+                setattr(self, name, None)
+            self._sub_windows.clear()
+            self._parent_window = None
+
+        def on_resize(self):
+            # Derived windows can't be moved on screen, they are derived again from the resized parent
+            self.create_windows()
+
         def on_exit(self):
             for w in self._sub_windows:
                 w.clear()
@@ -911,34 +4766,43 @@ class CursesWrapper:
         def add_sub_window(self, window):
             self._sub_windows.append(window)
             
+        def get_padding_format(alignment, width):
+            padding_format = CursesWrapper.SubWinState.padding_formats.get((alignment, width))
+            if padding_format is None:
+                padding_format = '{{0:{0}}}'.format('{0}{1:d}'.format(alignment, width))
+                CursesWrapper.SubWinState.padding_formats[(alignment, width)] = padding_format
+            return padding_format
+
         def get_center_padded_string(width, string):
-            center_padding_format = '{{0:{0}}}'.format('^{0:d}'.format(width))
-            return center_padding_format.format(string)
+            return CursesWrapper.SubWinState.get_padding_format('^', width).format(string)
             
         def get_left_padded_string(width, string):
-            center_padding_format = '{{0:{0}}}'.format('<{0:d}'.format(width))
-            return center_padding_format.format(string)
+            return CursesWrapper.SubWinState.get_padding_format('<', width).format(string)
             
         def get_right_padded_string(width, string):
-            center_padding_format = '{{0:{0}}}'.format('>{0:d}'.format(width))
-            return center_padding_format.format(string)
+            return CursesWrapper.SubWinState.get_padding_format('>', width).format(string)
             
-        def draw_list_scroll(window, lst, selected_index, marked_element, height, width, highlight_attr, marker):
+        def draw_list_scroll(window, lst, selected_index, marked_element, height, width, highlight_attr, marker, flagged_elements=(), flag=BALLOT_X_CH, empty_message='...'):
             (start_y, start_x) = window.getyx()
             central_row = int(height*0.5)
             for row in range(0, height):
                 window.move(start_y+row, start_x)
                 index = selected_index + row - central_row
-                if index < 0 or index >= len(lst):
+                if len(lst) == 0 and row == central_row:
+                    window.addstr(CursesWrapper.SubWinState.get_center_padded_string(width, empty_message))
+                elif index < 0 or index >= len(lst):
                     window.addstr(CursesWrapper.SubWinState.get_center_padded_string(width, '...'))
                 else:
                     attr = curses.A_REVERSE if row == central_row else 0
                     string = lst[index]
                     if marked_element == lst[index]:
                         string = '{0} {1}'.format(marker, string)
+                    elif lst[index] in flagged_elements:
+                        string = '{0} {1}'.format(flag, string)
+                        attr |= curses.A_DIM
                     window.addstr(CursesWrapper.SubWinState.get_center_padded_string(width, string), attr)
             window.move(start_y, start_x+width-1)
-            CursesWrapper.SubWinState.draw_vertical_bar(window, height, float(selected_index)/len(lst), highlight_attr)
+            CursesWrapper.SubWinState.draw_vertical_bar(window, height, float(selected_index)/len(lst) if len(lst) > 0 else 0, highlight_attr)
             
         def draw_horizontal_bar(window, length, percent, arrow_attr):
             window.addstr(LEFT_ARROW_CH, arrow_attr)
@@ -969,6 +4833,8 @@ class CursesWrapper:
 
         """Common GUI elements and logic"""
 
+        COMMANDS = ('quit_app', 'radio_tab', 'alarm_tab', 'switch_channel_list')
+
         def __init__(self, fsm):
             super().__init__(fsm)
             
@@ -978,37 +4844,43 @@ class CursesWrapper:
         def on_enter(self):
             super().on_enter()
             self._alarm_fired = False
+            self._sleep_timer_expired = False
             self.set_fire_event_listener(self.on_alarm_fired)
+            self.set_sleep_event_listener(self.on_sleep_timer_expired)
             self._battery_update_timer = -BATTERY_UPDATE_TIME
-            self.current_battery_charge = -1
-            self.current_battery_status = System.BatteryState.unknown
+            self._current_battery_charge = -1
+            self._current_battery_status = System.BatteryState.unknown
+            self._clock_key = None
+            self._clock_text = ''
 
         def on_exit(self):
             self.set_fire_event_listener(None)
+            self.set_sleep_event_listener(None)
             super().on_exit()
 
-        def create_sub_windows(self, parent_rows, parent_cols):
-            self._top_win = self._parent_window.derwin(3, parent_cols, 0, 0)
-            self.add_sub_window(self._top_win)
-            self._top_win.border()
-            self._top_win.noutrefresh()
-            self._bottom_win = self._parent_window.derwin(3, parent_cols, parent_rows-3, 0)
-            self.add_sub_window(self._bottom_win)
-            self._bottom_win.border()
-            self._bottom_win.noutrefresh()
-            return self._parent_window.derwin(parent_rows-6, parent_cols, 3, 0)
-        
-        def consume_input(self, ch):
-            if ch in itertools.chain(CursesWrapper.KeyMappings.quit_app, CursesWrapper.KeyMappings.radio_tab, CursesWrapper.KeyMappings.alarm_tab):
-                self._ch = ch
-                return True
-            return super().consume_input(ch)
+        def compute_layout(self, parent_rows, parent_cols):
+            return (('_top_win', (3, parent_cols, 0, 0)), ('_bottom_win', (3, parent_cols, parent_rows-3, 0)), ('_child_window', (parent_rows-6, parent_cols, 3, 0)))
 
+        CLOCK_FORMAT = '{0:%H:%M:%S - %d %b %Y}'
+
+        CLOCK_FORMAT_MINUTES = '{0:%H:%M - %d %b %Y}   '
+
+        def get_clock_text(self):
+            # Formatted once per tick of the render scheduler, not on every frame
+            tick = self.get_render_tick()
+            key = (tick, int(time.time() // tick))
+            if key != self._clock_key:
+                self._clock_key = key
+                self._clock_text = (self.CLOCK_FORMAT if tick < 60 else self.CLOCK_FORMAT_MINUTES).format(datetime.datetime.now())
+            return self._clock_text
+        
         def draw(self):
+            model = self.get_model()
+            top_state = self.top_state()
             self._top_win.move(1,2)
-            attr = curses.A_BOLD if self.top_state() == CursesWrapper.alarm_frame else curses.A_REVERSE if self.top_state() == CursesWrapper.radio_frame else 0
+            attr = curses.A_BOLD if top_state == CursesWrapper.alarm_frame else curses.A_REVERSE if top_state == CursesWrapper.radio_frame else 0
             self._top_win.addstr('R', attr)
-            attr = curses.A_REVERSE if self.top_state() == CursesWrapper.radio_frame else 0
+            attr = curses.A_REVERSE if top_state == CursesWrapper.radio_frame else 0
             self._top_win.addstr('adio', attr)
             self._top_win.addstr(' | ')
             #attr = curses.A_BOLD if self.top_state() == CursesWrapper.radio_frame else curses.A_REVERSE if self.top_state() == CursesWrapper.alarm_frame else 0
@@ -1018,13 +4890,15 @@ class CursesWrapper:
             #self._top_win.addstr(' | ')
             width = self._top_win.getmaxyx()[1]-20
             playing_string = ''
-            if (self.is_radio_playing()):
-                playing_string = 'Playing channel: {0}'.format(self.get_playing_channel())
+            if model.is_radio_playing:
+                playing_string = 'Playing channel: {0}{1}'.format(model.playing_channel, ' (dead air)' if model.dead_air else '')
             self._top_win.addstr(CursesWrapper.SubWinState.get_left_padded_string(width, playing_string))
             self._top_win.noutrefresh()
             
             self._bottom_win.move(1,1)
-            self._bottom_win.addstr('{0:%H:%M:%S - %d %b %Y} | Alarm is {1}'.format(datetime.datetime.now(), 'On ' if self.is_alarm_on() else 'Off'))
+            self._bottom_win.addstr('{0} | Alarm is {1}'.format(self.get_clock_text(), 'On ' if model.alarm_on else 'Off'))
+            if model.import_progress is not None:
+                self._bottom_win.addstr(' | Importing {0:4.0%}'.format(model.import_progress))
             self._bottom_win.move(1, self._bottom_win.getmaxyx()[1]-18)
             self._bottom_win.addstr('| Battery ')
             attr = curses.A_REVERSE if self._current_battery_charge <= BATTERY_LOW_CHARGE else 0
@@ -1033,70 +4907,82 @@ class CursesWrapper:
             self._bottom_win.noutrefresh()
             
         def update(self):
-            if time.clock() - self._battery_update_timer >= BATTERY_UPDATE_TIME:
-                self._current_battery_charge = System.get_battery_charge()
-                self._current_battery_status = System.get_battery_status()
-                self._battery_update_timer = time.clock()
+            if self._sleep_timer_expired:
+                self._sleep_timer_expired = False
+                self.set_asleep(True)
+            # Not polled while asleep, a key or the alarm brings the polling back
+            if not self.is_asleep() and time.monotonic() - self._battery_update_timer >= BATTERY_UPDATE_TIME:
+                battery = (System.get_battery_charge(), System.get_battery_status())
+                if battery != (self._current_battery_charge, self._current_battery_status):
+                    (self._current_battery_charge, self._current_battery_status) = battery
+                    self.set_power_state(self._current_battery_status, self._current_battery_charge)
+                    self.request_redraw()
+                self._battery_update_timer = time.monotonic()
             if self._alarm_fired:
                 self._alarm_fired = False
+                self.set_asleep(False)
                 self.save_preferences()
                 return (CursesWrapper.Action.push_top, CursesWrapper.alarm_dialog)
-            elif self._ch in CursesWrapper.KeyMappings.quit_app:
+            elif self._command == CursesWrapper.Command.quit_app:
                 return (CursesWrapper.Action.push_top, CursesWrapper.exit_dialog)
-            elif self._ch in CursesWrapper.KeyMappings.radio_tab:
+            elif self._command == CursesWrapper.Command.radio_tab:
                 if self.top_state() == CursesWrapper.alarm_frame:
                     return (CursesWrapper.Action.switch_top, CursesWrapper.radio_frame)
-            elif self._ch in CursesWrapper.KeyMappings.alarm_tab:
+            elif self._command == CursesWrapper.Command.alarm_tab:
                 pass
                 #if self.top_state() == CursesWrapper.radio_frame:
                     #return (CursesWrapper.Action.switch_top, CursesWrapper.alarm_frame)
+            elif self._command == CursesWrapper.Command.switch_channel_list:
+                self.next_channel_list()
+                self.request_save()
             return super().update()
         
         def on_alarm_fired(self):
             self._alarm_fired = True
+
+        def on_sleep_timer_expired(self):
+            self._sleep_timer_expired = True
             
     class RadioFrameState(SubWinState):
 
         """GUI elements and logic for the radio"""
 
+        COMMANDS = ('change_channel_up', 'change_channel_down', 'play_radio', 'stop_radio', 'increase_volume', 'decrease_volume', 'toggle_favourite', 'move_channel_up', 'move_channel_down', 'sleep_timer')
+
         def __init__(self, fsm):
             super().__init__(fsm)
+            self._meter_version = None
 
         def __del__(self):
             super().__del__()
 
         def on_enter(self):
             super().on_enter()
+            self.reload_channels()
+
+        def on_model_changed(self, changed):
+            if 'channels' in changed:
+                self.reload_channels()
+
+        def reload_channels(self):
             self._radio_channels = self.get_radio_channels()
+            self._dead_channels = self.get_dead_channels()
             try:
                 self._current_channel_index = self._radio_channels.index(self.get_current_channel())
             except ValueError:
                 self._current_channel_index = 0
             
-        def consume_input(self, ch):
-            if ch in itertools.chain(CursesWrapper.KeyMappings.change_channel_up, CursesWrapper.KeyMappings.change_channel_down, CursesWrapper.KeyMappings.play_radio, CursesWrapper.KeyMappings.stop_radio , CursesWrapper.KeyMappings.increase_volume, CursesWrapper.KeyMappings.decrease_volume):
-                self._ch = ch
-                return True
-            return super().consume_input(ch)
-            
-        def create_sub_windows(self, parent_rows, parent_cols):
-            self._center_win = self._parent_window.derwin(parent_rows-3, parent_cols, 0, 0)
-            self.add_sub_window(self._center_win)
-            self._center_win.border()
-            self._center_win.noutrefresh()
-            self._bottom_win = self._parent_window.derwin(3, parent_cols, parent_rows-3, 0)
-            self.add_sub_window(self._bottom_win)
-            self._bottom_win.border()
-            self._bottom_win.noutrefresh()
-            return None
+        def compute_layout(self, parent_rows, parent_cols):
+            return (('_center_win', (parent_rows-3, parent_cols, 0, 0)), ('_bottom_win', (3, parent_cols, parent_rows-3, 0)))
         
         def draw(self):
+            model = self.get_model()
             bold_attr = curses.A_BOLD if self.top_state() == CursesWrapper.radio_frame else 0
             self._center_win.move(1, 1)
-            CursesWrapper.SubWinState.draw_list_scroll(self._center_win, self._radio_channels, self._current_channel_index, self.get_playing_channel(), self._center_win.getmaxyx()[0]-2, self._center_win.getmaxyx()[1]-2, bold_attr, RIGHT_ARROW_CH)
+            CursesWrapper.SubWinState.draw_list_scroll(self._center_win, self._radio_channels, self._current_channel_index, model.playing_channel, self._center_win.getmaxyx()[0]-2, self._center_win.getmaxyx()[1]-2, bold_attr, RIGHT_ARROW_CH, self._dead_channels, empty_message='...' if model.catalog_loaded else 'Loading channels...')
             self._center_win.noutrefresh()
             
-            if self.is_radio_playing():
+            if model.is_radio_playing:
                 self._bottom_win.move(1, 2)
                 self._bottom_win.addstr('S', bold_attr)
                 self._bottom_win.addstr('top | ')
@@ -1104,35 +4990,85 @@ class CursesWrapper:
                 self._bottom_win.move(1, 2)
                 self._bottom_win.addstr('P', bold_attr)
                 self._bottom_win.addstr('lay | ')
+            self._bottom_win.addstr('L', bold_attr)
+            self._bottom_win.addstr('ist: {0} | '.format(model.channel_list or 'All'))
+            sleep_countdown = self.get_sleep_countdown()
+            if sleep_countdown is not None:
+                self._bottom_win.addstr('Z', bold_attr)
+                self._bottom_win.addstr('z {0:d} min | '.format(math.ceil(sleep_countdown / 60)) if sleep_countdown >= 60 else 'z {0:d} s | '.format(math.ceil(sleep_countdown)))
             self._bottom_win.addstr('Volume ')
-            CursesWrapper.SubWinState.draw_horizontal_bar(self._bottom_win, self._bottom_win.getmaxyx()[1]-self._bottom_win.getyx()[1]-1, float(self.get_radio_volume())/self.get_radio_max_volume(), bold_attr)
+            meter = self.get_audio_meter() if model.is_radio_playing else None
+            meter_width = METER_WIDTH + 3 + (len(meter[3]) + 1 if meter[3] is not None else 0) if meter else 0
+            CursesWrapper.SubWinState.draw_horizontal_bar(self._bottom_win, self._bottom_win.getmaxyx()[1]-self._bottom_win.getyx()[1]-1-meter_width, float(model.radio_volume)/model.radio_max_volume, bold_attr)
+            if meter:
+                (self._meter_version, level, peak, bands) = meter
+                self._bottom_win.addstr(' | ')
+                CursesWrapper.RadioFrameState.draw_level_meter(self._bottom_win, METER_WIDTH, level, peak)
+                if bands is not None:
+                    self._bottom_win.addstr(' ')
+                    CursesWrapper.RadioFrameState.draw_spectrum(self._bottom_win, bands)
             self._bottom_win.noutrefresh()
+
+        def to_meter_scale(level):
+            """Level between 0 and 1 to the fraction of the meter, on a METER_RANGE_DB decibel scale"""
+            if level <= 0:
+                return 0
+            return min(1, max(0, 1 + 20 * math.log10(level) / METER_RANGE_DB))
+
+        def draw_level_meter(window, length, level, peak):
+            level_cells = round(length * CursesWrapper.RadioFrameState.to_meter_scale(level))
+            peak_cell = min(length - 1, round(length * CursesWrapper.RadioFrameState.to_meter_scale(peak)))
+            for i in range(length):
+                window.addstr(BLACK_DIAMOND_CH if i == peak_cell and peak > 0 else DARK_SHADE_CH if i < level_cells else LIGHT_SHADE_CH)
+
+        def draw_spectrum(window, bands):
+            steps = len(LOWER_BLOCKS_CH) - 1
+            window.addstr(''.join(LOWER_BLOCKS_CH[round(steps * band)] for band in bands.tolist()))
             
         def update(self):
-            if self._ch in CursesWrapper.KeyMappings.change_channel_down:
-                self._current_channel_index = min(self._current_channel_index+1, len(self._radio_channels)-1)
+            meter = self.get_audio_meter() if self.is_radio_playing() else None
+            if meter:
+                # Frames follow the tap at a capped rate, whatever the rate of the audio blocks
+                self.request_animation(METER_REFRESH_INTERVAL)
+                if meter[0] != self._meter_version:
+                    self.request_redraw()
+            if len(self._radio_channels) == 0 and self._command in (CursesWrapper.Command.change_channel_down, CursesWrapper.Command.change_channel_up):
+                pass
+            elif self._command == CursesWrapper.Command.change_channel_down:
+                self._current_channel_index = min(self._current_channel_index+self.get_repeat_steps(), len(self._radio_channels)-1)
                 self.set_current_channel(self._radio_channels[self._current_channel_index])
-                self.save_preferences()
-            elif self._ch in CursesWrapper.KeyMappings.change_channel_up:
-                self._current_channel_index = max(self._current_channel_index-1, 0)
+                self.request_save()
+            elif self._command == CursesWrapper.Command.change_channel_up:
+                self._current_channel_index = max(self._current_channel_index-self.get_repeat_steps(), 0)
                 self.set_current_channel(self._radio_channels[self._current_channel_index])
-                self.save_preferences()
-            elif self._ch in CursesWrapper.KeyMappings.stop_radio and self.is_radio_playing():
+                self.request_save()
+            elif self._command == CursesWrapper.Command.stop_radio and self.is_radio_playing():
                 self.stop_radio()
-            elif self._ch in CursesWrapper.KeyMappings.play_radio and not self.is_radio_playing():
+            elif self._command == CursesWrapper.Command.play_radio and not self.is_radio_playing():
                 self.play_radio()
-            elif self._ch in CursesWrapper.KeyMappings.increase_volume:
-                self.increase_radio_volume()
-                self.save_preferences()
-            elif self._ch in CursesWrapper.KeyMappings.decrease_volume:
-                self.decrease_radio_volume()
-                self.save_preferences()
+            elif self._command == CursesWrapper.Command.sleep_timer and self.is_radio_playing():
+                self.next_sleep_timer()
+            elif self._command == CursesWrapper.Command.increase_volume:
+                self.increase_radio_volume(self.get_repeat_steps(VOLUME_REPEAT_MAX_STEPS))
+                self.request_save()
+            elif self._command == CursesWrapper.Command.decrease_volume:
+                self.decrease_radio_volume(self.get_repeat_steps(VOLUME_REPEAT_MAX_STEPS))
+                self.request_save()
+            elif self._command == CursesWrapper.Command.toggle_favourite and len(self._radio_channels) > 0:
+                self.toggle_favourite(self._radio_channels[self._current_channel_index])
+                self.request_save()
+            elif self._command in (CursesWrapper.Command.move_channel_up, CursesWrapper.Command.move_channel_down) and len(self._radio_channels) > 0:
+                offset = -self.get_repeat_count() if self._command == CursesWrapper.Command.move_channel_up else self.get_repeat_count()
+                if self.move_channel(self._radio_channels[self._current_channel_index], offset, self._radio_channels):
+                    self.request_save()
             return super().update()
 
     class AlarmFrameState(SubWinState):
 
         """GUI elements and logic for the alarm"""
 
+        COMMANDS = ('change_channel_up', 'change_channel_down', 'increase_volume', 'decrease_volume', 'enable_alarm', 'disable_alarm', 'set_alarm_time')
+
         def __init__(self, fsm):
             super().__init__(fsm)
 
@@ -1141,71 +5077,64 @@ class CursesWrapper:
 
         def on_enter(self):
             super().on_enter()
+            self.reload_channels()
+
+        def on_model_changed(self, changed):
+            if 'channels' in changed:
+                self.reload_channels()
+
+        def reload_channels(self):
             self._radio_channels = self.get_radio_channels()
+            self._dead_channels = self.get_dead_channels()
             try:
                 self._alarm_channel_index = self._radio_channels.index(self.get_alarm_channel())
             except ValueError:
                 self._alarm_channel_index = 0
         
-        def create_sub_windows(self, parent_rows, parent_cols):
-            self._top_win = self._parent_window.derwin(3, parent_cols, 0, 0)
-            self.add_sub_window(self._top_win)
-            self._top_win.border()
-            self._top_win.noutrefresh()
-            self._center_win = self._parent_window.derwin(3, 0)
-            self.add_sub_window(self._center_win)
-            self._center_win.border()
-            self._center_win.noutrefresh()
-            return None
+        def compute_layout(self, parent_rows, parent_cols):
+            return (('_top_win', (3, parent_cols, 0, 0)), ('_center_win', (parent_rows-3, parent_cols, 3, 0)))
         
-        def consume_input(self, ch):
-            if ch in itertools.chain(CursesWrapper.KeyMappings.change_channel_up, CursesWrapper.KeyMappings.change_channel_down, CursesWrapper.KeyMappings.increase_volume, CursesWrapper.KeyMappings.decrease_volume, CursesWrapper.KeyMappings.enable_alarm, CursesWrapper.KeyMappings.disable_alarm, CursesWrapper.KeyMappings.set_alarm_time):
-                self._ch = ch
-                return True
-            return super().consume_input(ch)
-
         def draw(self):
-            alarm_time = self.get_alarm_time()
+            model = self.get_model()
+            alarm_time = model.alarm_time
             bold_attr = curses.A_BOLD if self.top_state() == CursesWrapper.alarm_frame else 0
             self._top_win.move(1, 2)
             self._top_win.addstr('T', bold_attr)
             self._top_win.addstr('ime: {0:02d}:{1:02d} | '.format(alarm_time[0], alarm_time[1]))
-            if self.is_alarm_on():
+            if model.alarm_on:
                 self._top_win.addstr('D', bold_attr)
                 self._top_win.addstr('isable | Volume ')
             else:
                 self._top_win.addstr('E', bold_attr)
                 self._top_win.addstr('nable  | Volume ')
-            CursesWrapper.SubWinState.draw_horizontal_bar(self._top_win, self._top_win.getmaxyx()[1]-self._top_win.getyx()[1]-1, float(self.get_alarm_volume())/self.get_alarm_max_volume(), bold_attr)    
+            CursesWrapper.SubWinState.draw_horizontal_bar(self._top_win, self._top_win.getmaxyx()[1]-self._top_win.getyx()[1]-1, float(model.alarm_volume)/model.alarm_max_volume, bold_attr)    
             self._top_win.noutrefresh()
             self._center_win.move(1, 1)
-            CursesWrapper.SubWinState.draw_list_scroll(self._center_win, self._radio_channels, self._alarm_channel_index, self.get_alarm_channel(), self._center_win.getmaxyx()[0]-2, self._center_win.getmaxyx()[1]-2, bold_attr, BLACK_DIAMOND_CH if self.is_alarm_on() else "")
+            CursesWrapper.SubWinState.draw_list_scroll(self._center_win, self._radio_channels, self._alarm_channel_index, model.alarm_channel, self._center_win.getmaxyx()[0]-2, self._center_win.getmaxyx()[1]-2, bold_attr, BLACK_DIAMOND_CH if model.alarm_on else "", self._dead_channels, empty_message='...' if model.catalog_loaded else 'Loading channels...')
             self._center_win.noutrefresh()
             
         def update(self):
-            if (self._ch in CursesWrapper.KeyMappings.enable_alarm and not self.is_alarm_on()) or (self._ch in CursesWrapper.KeyMappings.disable_alarm and self.is_alarm_on()):
+            if len(self._radio_channels) == 0 and self._command in (CursesWrapper.Command.change_channel_down, CursesWrapper.Command.change_channel_up):
+                pass
+            elif (self._command == CursesWrapper.Command.enable_alarm and not self.is_alarm_on()) or (self._command == CursesWrapper.Command.disable_alarm and self.is_alarm_on()):
                 self.toggle_alarm()
                 logging.debug('set alarm: {0}'.format('on' if self.is_alarm_on() else 'off'))
                 self.save_preferences()
-            elif self._ch in CursesWrapper.KeyMappings.change_channel_down:
-                self._alarm_channel_index += 1
-                if self._alarm_channel_index >= len(self._radio_channels):
-                    self._alarm_channel_index = 0
+            elif self._command == CursesWrapper.Command.change_channel_down:
+                self._alarm_channel_index = (self._alarm_channel_index + self.get_repeat_steps()) % len(self._radio_channels)
                 self.set_alarm_channel(self._radio_channels[self._alarm_channel_index])
-                self.save_preferences()
-            elif self._ch in CursesWrapper.KeyMappings.change_channel_up:
-                self._alarm_channel_index -= 1
-                if self._alarm_channel_index <= -1:
-                    self._alarm_channel_index = len(self._radio_channels)-1
+                self.request_save()
+            elif self._command == CursesWrapper.Command.change_channel_up:
+                self._alarm_channel_index = (self._alarm_channel_index - self.get_repeat_steps()) % len(self._radio_channels)
                 self.set_alarm_channel(self._radio_channels[self._alarm_channel_index])
-                self.save_preferences()
-            elif self._ch in CursesWrapper.KeyMappings.increase_volume:
-                self.increase_alarm_volume()
-                self.save_preferences()
-            elif self._ch in CursesWrapper.KeyMappings.decrease_volume:
-                self.decrease_alarm_volume()
-                self.save_preferences()
-            elif self._ch in CursesWrapper.KeyMappings.set_alarm_time:
+                self.request_save()
+            elif self._command == CursesWrapper.Command.increase_volume:
+                self.increase_alarm_volume(self.get_repeat_steps(VOLUME_REPEAT_MAX_STEPS))
+                self.request_save()
+            elif self._command == CursesWrapper.Command.decrease_volume:
+                self.decrease_alarm_volume(self.get_repeat_steps(VOLUME_REPEAT_MAX_STEPS))
+                self.request_save()
+            elif self._command == CursesWrapper.Command.set_alarm_time:
                return (CursesWrapper.Action.push_top, CursesWrapper.insert_alarm_time_dialog)
             return super().update()
     
@@ -1213,6 +5142,9 @@ class CursesWrapper:
 
         """ GUI elements and logic for an overlapping dialog"""
 
+        # Dialog size -> [window, panel, screen size], panels are hidden between uses
+        dialog_pool = dict()
+
         def __init__(self, fsm):
             super().__init__(fsm)
 
@@ -1220,24 +5152,64 @@ class CursesWrapper:
             super().on_enter()
             self._background_window = self.get_current_window()
             self.set_current_window(None)
-            self._dialog_window = self.create_dialog_window(self.get_screen_size())
-            self._dialog_panel = curses.panel.new_panel(self._dialog_window)
+            (self._dialog_window, self._dialog_panel) = self.acquire_dialog(self.get_screen_size())
+            self.draw_static(self._dialog_window)
+            self._dialog_panel.show()
             self._dialog_panel.top()
             curses.panel.update_panels()
 
         def on_exit(self):
-            del self._dialog_panel
+            self._dialog_panel.hide()  # Touches the windows below it
             curses.panel.update_panels()
-            self._dialog_window.clear()
-            self._dialog_window.noutrefresh()
-            del self._dialog_window
+            self._dialog_panel = None
+            self._dialog_window = None
             self.set_current_window(self._background_window)
             self._background_window = None
             super().on_exit()
             
         def consume_input(self, ch):
+            super().consume_input(ch)
             self._ch = ch
             return True  # Dialogs always consume all input
+
+        def get_dialog_position(self, window_size):
+            (rows, cols) = self.DIALOG_SIZE
+            return (max(0, int((window_size[0]-rows+1)/2)), max(0, int((window_size[1]-cols+1)/2)))
+
+        def create_dialog_window(self, window_size):
+            return curses.newwin(*self.DIALOG_SIZE, *self.get_dialog_position(window_size))
+
+        def acquire_dialog(self, screen_size):
+            entry = CursesWrapper.DialogFrameState.dialog_pool.get(self.DIALOG_SIZE)
+            if entry is None:
+                window = self.create_dialog_window(screen_size)
+                entry = [window, curses.panel.new_panel(window), screen_size]
+                CursesWrapper.DialogFrameState.dialog_pool[self.DIALOG_SIZE] = entry
+            elif entry[2] != screen_size:
+                # The terminal may have shrunk the dialog, a new one is cheaper than fixing it
+                entry[0] = self.create_dialog_window(screen_size)
+                entry[1].replace(entry[0])
+                entry[2] = screen_size
+            return (entry[0], entry[1])
+
+        def release_windows(self):
+            self._background_window = None
+
+        def on_resize(self):
+            self._background_window = self.get_current_window()
+            self.set_current_window(None)
+            (self._dialog_window, self._dialog_panel) = self.acquire_dialog(self.get_screen_size())
+            self.draw_static(self._dialog_window)
+            self._dialog_panel.top()
+
+        def draw_static(self, window):
+            window.erase()
+            window.border()
+
+        def draw(self):
+            # Windows below may have been painted over the dialog, push all of it again
+            self._dialog_window.touchwin()
+            self._dialog_window.noutrefresh()
         
         def get_dialog_window(self):
             return self._dialog_window
@@ -1246,74 +5218,89 @@ class CursesWrapper:
 
         """ Confirm application exit """
 
+        COMMANDS = ('cancel_dialog', 'quit_to_terminal', 'poweroff', 'suspend')
+
         def __init__(self, fsm):
             super().__init__(fsm)
             
-        def create_dialog_window(self, window_size):
-            dialog_win = curses.newwin(5, 52, int((window_size[0]-4)/2), int((window_size[1]-51)/2))
-            return dialog_win
+        DIALOG_SIZE = (5, 52)
             
-        def draw(self):
-            self.get_dialog_window().border()  # Need to redraw everything
-            self.get_dialog_window().move(2, 2)
-            self.get_dialog_window().addstr('Do you want to ')
-            self.get_dialog_window().addstr('P', curses.A_BOLD)
-            self.get_dialog_window().addstr('oweroff or ')
-            self.get_dialog_window().addstr('Q', curses.A_BOLD)
-            self.get_dialog_window().addstr('uit to the terminal?')
-            self.get_dialog_window().noutrefresh()
+        def draw_static(self, window):
+            super().draw_static(window)
+            window.move(2, 2)
+            window.addstr('P', curses.A_BOLD)
+            window.addstr('oweroff, ')
+            window.addstr('S', curses.A_BOLD)
+            window.addstr('uspend or ')
+            window.addstr('Q', curses.A_BOLD)
+            window.addstr('uit to the terminal?')
             
         def update(self):
-            if self._ch in CursesWrapper.KeyMappings.cancel_dialog:
+            if self._command == CursesWrapper.Command.cancel_dialog:
                 return (CursesWrapper.Action.pop_self, None)
-            elif self._ch in CursesWrapper.KeyMappings.quit_to_terminal:
+            elif self._command == CursesWrapper.Command.quit_to_terminal:
                 return (CursesWrapper.Action.pop, self.bottom_state())
-            elif self._ch in CursesWrapper.KeyMappings.poweroff:
+            elif self._command == CursesWrapper.Command.poweroff:
                 # TODO implement save restart!
                 System.poweroff()
                 #return (CursesWrapper.Action.pop, self.bottom_state())
+            elif self._command == CursesWrapper.Command.suspend:
+                if self._fsm.suspend():
+                    return (CursesWrapper.Action.pop_self, None)
+                curses.beep() # Playing, or the alarm is off or too close
             return super().update()
 
     class AlarmDialogState(DialogFrameState):
 
         """ Alarm triggered dialog """
 
+        COMMANDS = ('exit_alarm',)
+
         def __init__(self, fsm):
             super().__init__(fsm)
             
         def on_enter(self):
             super().on_enter()
             self._ringing_timeout = False
+            self._shown_countdown = round(self.get_ringing_countdown())
             self.set_ringing_timeout_event_listener(self.on_ringing_timeout)
 
         def on_exit(self):
             self.set_ringing_timeout_event_listener(None)
+            super().on_exit()
         
-        def create_dialog_window(self, window_size):
-            dialog_win = curses.newwin(7, 52, int((window_size[0]-6)/2), int((window_size[1]-51)/2))
-            return dialog_win
+        DIALOG_SIZE = (7, 52)
+
+        COUNTDOWN_TEXT = 'Alarm will exit automatically in '
         
-        def draw(self):
-            self.get_dialog_window().border()  # Need to redraw everything
-            self.get_dialog_window().move(2, 2)
-            self.get_dialog_window().addstr('Alarm will exit automatically in {0:^4d} seconds...'.format(round(self.get_ringing_countdown())))
-            self.get_dialog_window().move(3, 2)
-            self.get_dialog_window().addstr('Press ')
+        def draw_static(self, window):
+            super().draw_static(window)
+            window.move(2, 2)
+            window.addstr('{0}{1:4s} seconds...'.format(self.COUNTDOWN_TEXT, ''))
+            window.move(3, 2)
+            window.addstr('Press ')
             if not self.next_snooze_quits():
-                self.get_dialog_window().addstr('ESC', curses.A_BOLD)
-                self.get_dialog_window().addstr(' to continue listening to the radio,')
-                self.get_dialog_window().move(4, 2)
-                self.get_dialog_window().addstr('any other key', curses.A_BOLD)
-                self.get_dialog_window().addstr(' to snooze.')
+                window.addstr('ESC', curses.A_BOLD)
+                window.addstr(' to continue listening to the radio,')
+                window.move(4, 2)
+                window.addstr('any other key', curses.A_BOLD)
+                window.addstr(' to snooze.')
             else:
-                 self.get_dialog_window().addstr('any key to quit the alarm.')
-            self.get_dialog_window().noutrefresh()
+                 window.addstr('any key to quit the alarm.')
+
+        def draw(self):
+            self.get_dialog_window().addstr(2, 2+len(self.COUNTDOWN_TEXT), '{0:^4d}'.format(self._shown_countdown))
+            super().draw()
         
         def update(self):
+            countdown = round(self.get_ringing_countdown())
+            if countdown != self._shown_countdown:
+                self._shown_countdown = countdown
+                self.request_redraw()
             if self._ringing_timeout:
                 self._ringing_timeout = False
                 return (CursesWrapper.Action.pop_self, None)
-            elif self._ch in CursesWrapper.KeyMappings.exit_alarm:
+            elif self._command == CursesWrapper.Command.exit_alarm:
                 self.exit_alarm()
                 return (CursesWrapper.Action.pop_self, None)
             elif self._ch != -1:
@@ -1329,6 +5316,8 @@ class CursesWrapper:
     class SnoozeDialogState(DialogFrameState):
     
         """ Snooze dialog """
+
+        COMMANDS = ('exit_alarm',)
         
         def __init__(self, fsm):
             super().__init__(fsm)
@@ -1336,30 +5325,39 @@ class CursesWrapper:
         def on_enter(self):
             super().on_enter()
             self._snooze_timeout = False
+            self._shown_countdown = round(self.get_snooze_countdown())
             self.set_snooze_timeout_event_listener(self.on_snooze_timeout)
 
         def on_exit(self):
             self.set_snooze_timeout_event_listener(None)
+            super().on_exit()
         
-        def create_dialog_window(self, window_size):
-            dialog_win = curses.newwin(6, 53, int((window_size[0]-6)/2), int((window_size[1]-52)/2))
-            return dialog_win
+        DIALOG_SIZE = (6, 53)
+
+        COUNTDOWN_TEXT = 'Snooze will exit automatically in '
             
+        def draw_static(self, window):
+            super().draw_static(window)
+            window.move(2, 2)
+            window.addstr('{0}{1:4s} seconds...'.format(self.COUNTDOWN_TEXT, ''))
+            window.move(3, 2)
+            window.addstr('Press ')
+            window.addstr('ESC', curses.A_BOLD)
+            window.addstr(' to quit the alarm.')
+
         def draw(self):
-            self.get_dialog_window().border()  # Need to redraw everything
-            self.get_dialog_window().move(2, 2)
-            self.get_dialog_window().addstr('Snooze will exit automatically in {0:^4d} seconds...'.format(round(self.get_snooze_countdown())))
-            self.get_dialog_window().move(3, 2)
-            self.get_dialog_window().addstr('Press ')
-            self.get_dialog_window().addstr('ESC', curses.A_BOLD)
-            self.get_dialog_window().addstr(' to quit the alarm.')
-            self.get_dialog_window().noutrefresh()
+            self.get_dialog_window().addstr(2, 2+len(self.COUNTDOWN_TEXT), '{0:^4d}'.format(self._shown_countdown))
+            super().draw()
             
         def update(self):
+            countdown = round(self.get_snooze_countdown())
+            if countdown != self._shown_countdown:
+                self._shown_countdown = countdown
+                self.request_redraw()
             if self._snooze_timeout:
                 self._snooze_timeout = False
                 return (CursesWrapper.Action.switch_self, CursesWrapper.alarm_dialog)
-            elif self._ch in CursesWrapper.KeyMappings.exit_alarm:
+            elif self._command == CursesWrapper.Command.exit_alarm:
                 self.exit_alarm()
                 return (CursesWrapper.Action.pop_self, None)
             return super().update()
@@ -1371,6 +5369,8 @@ class CursesWrapper:
 
         """ Insert alarm time """
 
+        COMMANDS = ('enter_input', 'cancel_input', 'increase_time', 'decrease_time', 'next_digit', 'previous_digit')
+
         def __init__(self, fsm):
             super().__init__(fsm)
             
@@ -1379,18 +5379,24 @@ class CursesWrapper:
             self._user_input = CursesWrapper.InsertAlarmTimeDialogState.to_input_sequence(self.get_alarm_time())
             self._user_input_index = 0
             
-        def create_dialog_window(self, window_size):
-            dialog_win = curses.newwin(7, 34, int((window_size[0]-6)/2), int((window_size[1]-33)/2))
-            return dialog_win
+        DIALOG_SIZE = (7, 34)
            
+        PROMPT_TEXT = 'Insert new alarm time: '
+
+        TIME_WIDTH = len('00:00')
+
+        def draw_static(self, window):
+            super().draw_static(window)
+            window.move(3, 2)
+            window.addstr(self.PROMPT_TEXT)
+            window.addstr(LEFT_ARROW_CH, curses.A_BOLD)
+            window.move(3, 3+len(self.PROMPT_TEXT)+self.TIME_WIDTH)
+            window.addstr(RIGHT_ARROW_CH, curses.A_BOLD)
+
         def draw(self):
-            self.get_dialog_window().border()  # Need to redraw everything
-            self.get_dialog_window().move(3, 2)
-            self.get_dialog_window().addstr('Insert new alarm time: ')
-            self.get_dialog_window().addstr(LEFT_ARROW_CH, curses.A_BOLD)
             time_str = '{0}'.format(CursesWrapper.InsertAlarmTimeDialogState.to_string(self._user_input))
             dx = self._user_input_index if self._user_input_index < 2 else self._user_input_index+1
-            cy, cx = self.get_dialog_window().getyx()
+            cy, cx = (3, 3+len(self.PROMPT_TEXT))
             for i in range(len(time_str)):
                 if i == dx:
                     self.get_dialog_window().move(cy-1, cx+i)
@@ -1406,24 +5412,24 @@ class CursesWrapper:
                     self.get_dialog_window().addstr(time_str[i])
                     self.get_dialog_window().move(cy+1, cx+i)
                     self.get_dialog_window().addstr(' ')
-            self.get_dialog_window().move(cy, cx+len(time_str))
-            self.get_dialog_window().addstr(RIGHT_ARROW_CH, curses.A_BOLD)
-            self.get_dialog_window().noutrefresh()
+            super().draw()
             
         def update(self):
-            if self._ch in CursesWrapper.KeyMappings.enter_input:
+            if self._command == CursesWrapper.Command.enter_input:
                 self.set_alarm_time(CursesWrapper.InsertAlarmTimeDialogState.to_time(self._user_input))
                 self.save_preferences()
                 return (CursesWrapper.Action.pop_self, None)
-            elif self._ch in CursesWrapper.KeyMappings.cancel_input:
+            elif self._command == CursesWrapper.Command.cancel_input:
                 return (CursesWrapper.Action.pop_self, None)
-            elif self._ch in CursesWrapper.KeyMappings.increase_time:
-                self.adjust_alarm(1)
-            elif self._ch in CursesWrapper.KeyMappings.decrease_time:
-                self.adjust_alarm(-1)
-            elif self._ch in CursesWrapper.KeyMappings.next_digit:
+            elif self._command == CursesWrapper.Command.increase_time:
+                for i in range(self.get_repeat_count()):
+                    self.adjust_alarm(1)
+            elif self._command == CursesWrapper.Command.decrease_time:
+                for i in range(self.get_repeat_count()):
+                    self.adjust_alarm(-1)
+            elif self._command == CursesWrapper.Command.next_digit:
                 self.move_focus(1)
-            elif self._ch in CursesWrapper.KeyMappings.previous_digit:
+            elif self._command == CursesWrapper.Command.previous_digit:
                 self.move_focus(-1)
             return super().update()
         
@@ -1473,11 +5479,48 @@ class CursesWrapper:
         def to_time(user_input):
             return [int(''.join(user_input[0:2])), int(''.join(user_input[2:4]))]
         
+StartupProfiler.mark('import')
+
+def parse_arguments():
+    import argparse
+    parser = argparse.ArgumentParser(description='Curses internet radio with alarm clock')
+    parser.add_argument('--fast-start', action='store_true', help='draw the first frame immediately, load the catalog in background')
+    parser.add_argument('--auto-resume', action='store_true', help='resume the last played channel, connecting while the GUI starts')
+    parser.add_argument('--scan', action='store_true', help='check the health of every channel in the catalog and exit')
+    parser.add_argument('--import', dest='import_files', nargs='+', metavar='FILE', help='import M3U, PLS, CSV, JSON or name|url station lists into the catalog, in background while the GUI runs')
+    parser.add_argument('--import-list', metavar='NAME', help='also add the imported channels to the named channel list NAME')
+    parser.add_argument('--no-gui', action='store_true', help='with --import, import in foreground and exit')
+    parser.add_argument('--status', action='store_true', help='print the state published by the running radio and exit')
+    return parser.parse_args()
+
 if __name__ == '__main__':
     try:
+        args = parse_arguments()
         logging.basicConfig(filename=LOGGING_FILE, filemode='w', format=LOGGING_FORMAT, level=LOGGING_LEVEL)
-        curses_wrapper = CursesWrapper(Preferences(CursesWrapper.get_default_preferences(), PREFERENCES_FILE))
+        if args.status:
+            prefs = Preferences(CursesWrapper.get_default_preferences(), PREFERENCES_FILE)
+            if prefs['StatusPage.File']:
+                status = StatusPageReader(prefs['StatusPage.File']).read()
+                print(json.dumps(status, indent=1) if status else 'no status published in "{0}"'.format(prefs['StatusPage.File']))
+            else:
+                print('the status is not published, StatusPage.File is not set in "{0}"'.format(PREFERENCES_FILE))
+        elif args.scan:
+            prefs = Preferences(CursesWrapper.get_default_preferences(), PREFERENCES_FILE)
+            scanner = StationScanner()
+            scanner.set_progress_listener(lambda done, total: print('\rscanned {0:d}/{1:d}'.format(done, total), end='', flush=True))
+            ClockRadio(prefs).scan_channels(scanner)
+            print()
+        elif args.import_files and args.no_gui:
+            prefs = Preferences(CursesWrapper.get_default_preferences(), PREFERENCES_FILE, snapshot_file=PREFERENCES_SNAPSHOT_FILE)
+            clock_radio = ClockRadio(prefs)
+            importer = clock_radio.import_catalog(args.import_files, args.import_list, lambda done, total, imported: print('\rimported {0:d} channels ({1:.0%})'.format(imported, done/max(total, 1)), end='', flush=True))
+            print('\nskipped {0:d} duplicate(s) and {1:d} invalid entries'.format(importer.duplicates, importer.invalid))
+            clock_radio.sync_preferences()
+            prefs.save()
+        else:
+            curses_wrapper = CursesWrapper(Preferences(CursesWrapper.get_default_preferences(), PREFERENCES_FILE, deferred=args.fast_start, snapshot_file=PREFERENCES_SNAPSHOT_FILE), fast_start=args.fast_start, auto_resume=args.auto_resume, import_files=args.import_files, import_list=args.import_list)
     except:
+        import traceback
         traceback.print_exc()
     finally:
         logging.shutdown()
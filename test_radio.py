@@ -0,0 +1,1334 @@
+import array
+import atexit
+import curses
+import curses.ascii
+import curses.panel
+import datetime
+import io
+import math
+import mmap
+import os
+import random
+import selectors
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import bench_radio
+import radio
+
+def create_preferences(work_dir, channel_names, prefs):
+    channels_file = os.path.join(work_dir, 'channels')
+    with open(channels_file, 'w') as f:
+        f.writelines('{0}|http://{0}.example.com/stream.mp3\n'.format(name) for name in channel_names)
+    prefs['CoreRadio.Backend'] = 'null'
+    prefs['ClockRadio.ChannelsFile'] = channels_file
+    prefs['ClockRadio.CatalogCacheFile'] = os.path.join(work_dir, 'catalog_cache')
+    prefs['ClockRadio.HistoryFile'] = os.path.join(work_dir, 'history')
+    return prefs
+
+def create_clock_radio(work_dir, channel_names, clock=None):
+    prefs = create_preferences(work_dir, channel_names, radio.ClockRadio.get_default_preferences())
+    return radio.ClockRadio(prefs, clock=clock, system=radio.SimulatedSystem)
+
+screen = None
+
+def get_screen():
+    """The curses screen of the GUI tests, initialized once and cleared for each test.
+    What is drawn goes to the captured output"""
+    global screen
+    if screen is None:
+        with mock.patch.dict(os.environ, TERM='xterm', LINES='24', COLUMNS='80'):
+            screen = curses.initscr()
+        screen.keypad(True)
+        if os.isatty(1):
+            atexit.register(curses.endwin) # Output not captured, gives the terminal back
+    curses.resizeterm(24, 80)
+    curses.flushinp()
+    screen.erase()
+    return screen
+
+def create_gui(work_dir, channel_names, **values):
+    """CursesWrapper on the test screen, as main_loop leaves it before its first iteration"""
+    window = get_screen()
+    prefs = radio.Preferences(create_preferences(work_dir, channel_names, radio.CursesWrapper.get_default_preferences()), os.path.join(work_dir, 'prefs'))
+    for (key, value) in values.items():
+        prefs[key] = value
+    # The states and the dialogs outlive the instance they were created for
+    for attribute in vars(radio.CursesWrapper).values():
+        if isinstance(attribute, radio.CursesWrapper.LazyState):
+            attribute._state = None
+    radio.CursesWrapper.DialogFrameState.dialog_pool.clear()
+    # Started as a fast start does, with a simulated system
+    with mock.patch('curses.wrapper'):
+        gui = radio.CursesWrapper(prefs, fast_start=True)
+    gui._fast_start = False
+    gui._current_channel = prefs['CursesWrapper.CurrentChannel']
+    gui._clock_radio = radio.ClockRadio(prefs, model=gui._model, system=radio.SimulatedSystem)
+    gui._current_window = window
+    gui._screen_size = window.getmaxyx()
+    gui._current_panel = curses.panel.new_panel(window)
+    gui.push_state(radio.CursesWrapper.main_frame)
+    gui.push_state(radio.CursesWrapper.radio_frame)
+    gui.draw()
+    return gui
+
+def type_keys(*keys):
+    for key in reversed(keys): # Pushed back on a stack
+        curses.ungetch(key)
+
+class LazyImportTest(unittest.TestCase):
+
+    def test_load_lazy_modules(self):
+        module = radio.lazy_import('colorsys')
+        if module not in radio.LAZY_MODULES:
+            self.skipTest('colorsys already imported')
+        radio.load_lazy_modules(module)
+        self.assertNotIn(module, radio.LAZY_MODULES)
+        self.assertTrue(callable(module.rgb_to_hsv))
+
+IGNORE_SIGTERM = 'import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print(flush=True); time.sleep(30)'
+
+class ProcessSupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = radio.ProcessSupervisor(kill_timeout=0.3, max_helpers=2)
+
+    def tearDown(self):
+        self.supervisor.close(timeout=0)
+
+    def update_until(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            self.supervisor.update()
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def spawn_ignoring_sigterm(self):
+        process = self.supervisor.spawn([sys.executable, '-c', IGNORE_SIGTERM], 'stubborn', stdout=subprocess.PIPE)
+        process.stdout.readline() # SIGTERM is ignored from now on
+        return process
+
+    def test_helpers_are_capped(self):
+        processes = [self.supervisor.spawn(['sleep', '0.1'], 'helper', is_helper=True) for i in range(5)]
+        self.assertEqual(sum(1 for process in processes if process is None), 3)
+        self.assertEqual((self.supervisor.get_child_count(), self.supervisor.get_queued_count()), (2, 3))
+        max_children = 0
+        def done():
+            nonlocal max_children
+            max_children = max(max_children, self.supervisor.get_child_count())
+            return self.supervisor.get_child_count() == 0 and self.supervisor.get_queued_count() == 0
+        self.update_until(done)
+        self.assertEqual(max_children, 2)
+        self.assertEqual((self.supervisor.spawned, self.supervisor.reaped), (5, 5))
+        self.assertEqual(self.supervisor.get_lifetimes()['helper'][0], 5)
+
+    def test_exited_children_are_reaped(self):
+        process = self.supervisor.spawn(['true'], 'true')
+        self.update_until(lambda: self.supervisor.get_child_count() == 0)
+        self.assertEqual(process.returncode, 0)
+        self.assertRaises(ChildProcessError, os.waitpid, process.pid, os.WNOHANG)
+
+    def test_reaped_on_sigchld(self):
+        handler = signal.getsignal(signal.SIGCHLD)
+        try:
+            self.supervisor.install_signal_handler()
+            process = self.supervisor.spawn(['sleep', '0.1'], 'sleep')
+            self.supervisor.update() # Nothing to do before the signal
+            self.assertEqual(self.supervisor.get_child_count(), 1)
+            self.update_until(lambda: self.supervisor.get_child_count() == 0)
+            self.assertEqual(process.returncode, 0)
+        finally:
+            signal.signal(signal.SIGCHLD, handler)
+
+    def test_killed_after_timeout(self):
+        process = self.spawn_ignoring_sigterm()
+        self.supervisor.terminate(process)
+        self.supervisor.update()
+        self.assertIsNone(process.poll())
+        self.assertEqual(self.supervisor.killed, 0)
+        time.sleep(0.1) # The kill timeout is not over yet
+        self.supervisor.update()
+        self.assertEqual(self.supervisor.killed, 0)
+        self.update_until(lambda: self.supervisor.get_child_count() == 0)
+        self.assertEqual((self.supervisor.killed, process.returncode), (1, -signal.SIGKILL))
+
+    def test_close(self):
+        (player, stubborn) = (self.supervisor.spawn(['sleep', '30'], 'player'), self.spawn_ignoring_sigterm())
+        helpers = [self.supervisor.spawn(['sleep', '0.5'], 'helper', is_helper=True) for i in range(3)]
+        start_time = time.monotonic()
+        self.supervisor.close(timeout=0.3)
+        self.assertLess(time.monotonic() - start_time, 2)
+        self.assertEqual((player.returncode, stubborn.returncode), (-signal.SIGTERM, -signal.SIGKILL))
+        # The helpers go on, the queued one included
+        self.assertIsNone(helpers[2])
+        self.assertEqual(self.supervisor.get_queued_count(), 0)
+        self.assertEqual(sorted(name for (pid, name, seconds) in self.supervisor.get_children()), ['helper'] * 3)
+        self.update_until(lambda: self.supervisor.get_child_count() == 0)
+
+    def test_suspend_gives_up(self):
+        spawn = self.supervisor.spawn
+        with mock.patch.object(radio.ProcessSupervisor, 'get_default', return_value=self.supervisor), \
+                mock.patch.object(self.supervisor, 'spawn', lambda args, name, **popen_args: spawn(['sleep', '30'], name, **popen_args)), \
+                mock.patch.object(radio, 'SUSPEND_TIMEOUT', 0.2):
+            start_time = time.monotonic()
+            self.assertFalse(radio.System.suspend(600))
+            self.assertLess(time.monotonic() - start_time, 1)
+        self.update_until(lambda: self.supervisor.get_child_count() == 0)
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.counter = radio.Metrics.Counter('test_total', 'Test counter')
+        self.labelled = radio.Metrics.Gauge('test_channel_seconds', 'Test gauge', 'channel')
+        self.computed = radio.Metrics.Gauge('test_computed', 'Test computed gauge', function=lambda: 2.5)
+        self.histogram = radio.Metrics.Histogram('test_seconds', 'Test histogram', (0.1, 1))
+        self.metrics = mock.patch.object(radio.Metrics, 'metrics', [self.counter, self.labelled, self.computed, self.histogram])
+        self.metrics.start()
+
+    def tearDown(self):
+        self.metrics.stop()
+
+    def test_render(self):
+        self.counter.inc()
+        self.counter.inc(2)
+        self.labelled.set_label('Radio "A"\\', 12)
+        for value in (0.05, 0.1, 0.5, 7):
+            self.histogram.observe(value)
+        self.assertEqual(radio.Metrics.render(), '\n'.join([
+            '# HELP test_total Test counter',
+            '# TYPE test_total counter',
+            'test_total 3',
+            '# HELP test_channel_seconds Test gauge',
+            '# TYPE test_channel_seconds gauge',
+            'test_channel_seconds{channel="Radio \\"A\\"\\\\"} 12',
+            '# HELP test_computed Test computed gauge',
+            '# TYPE test_computed gauge',
+            'test_computed 2.5',
+            '# HELP test_seconds Test histogram',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 2',
+            'test_seconds_bucket{le="1"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            'test_seconds_sum 7.65',
+            'test_seconds_count 4']) + '\n')
+
+    def test_failing_metric_is_skipped(self):
+        self.computed.function = lambda: 1 / 0
+        text = radio.Metrics.render()
+        self.assertNotIn('test_computed', text)
+        self.assertIn('test_seconds_count 0', text)
+
+    def test_program_metrics(self):
+        self.metrics.stop()
+        try:
+            names = [metric.name for metric in radio.Metrics.metrics]
+            self.assertEqual(len(names), len(set(names)))
+            self.assertIn('# TYPE radio_player_spawns_total counter', radio.Metrics.render())
+        finally:
+            self.metrics.start()
+
+    def test_scrape(self):
+        self.counter.inc()
+        exporter = radio.MetricsExporter(port=0)
+        try:
+            url = 'http://{0}:{1:d}'.format(radio.METRICS_HOST, exporter.get_port())
+            with urllib.request.urlopen(url + '/metrics') as response:
+                self.assertEqual(response.headers['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+                self.assertEqual(response.read().decode('utf-8'), radio.Metrics.render())
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(url + '/other')
+            self.assertEqual(context.exception.code, 404)
+        finally:
+            exporter.close()
+
+    def test_textfile(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'radio.prom')
+            exporter = radio.MetricsExporter(textfile_path=file_path, interval=60)
+            self.counter.inc()
+            exporter.close()
+            with open(file_path) as f:
+                self.assertIn('test_total 1\n', f.read())
+            self.assertEqual(os.listdir(tmp_dir), ['radio.prom'])
+
+class StatusPageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, 'status')
+        self.page = radio.StatusPage(self.file_path)
+        self.reader = radio.StatusPageReader(self.file_path)
+
+    def tearDown(self):
+        self.reader.close()
+        self.page.close()
+        self.tmp_dir.cleanup()
+
+    def publish(self, i):
+        return self.page.publish(radio.StatusPage.RUNNING, 0, i % 100, 100, 40, 0, 'Channel {0:d}'.format(i % 100), 'Alarm')
+
+    def test_publish(self):
+        self.assertIsNone(self.reader.read())
+        self.assertTrue(self.publish(7))
+        self.assertFalse(self.publish(7))
+        status = self.reader.read()
+        self.assertEqual((status['running'], status['radio_volume'], status['playing_channel'], status['alarm_channel'], status['sequence']), (True, 7, 'Channel 7', 'Alarm', 2))
+        self.page.close()
+        self.assertFalse(self.reader.read()['running'])
+        self.page = radio.StatusPage(self.file_path)
+        self.publish(8)
+        self.assertEqual(self.reader.read()['sequence'], 6)
+
+    def test_write_in_progress(self):
+        self.publish(7)
+        struct.pack_into('=Q', self.page._mmap, radio.StatusPage.SEQUENCE_OFFSET, 3)
+        self.assertIsNone(self.reader.read())
+        self.assertEqual(self.reader.retries, radio.STATUS_PAGE_READ_RETRIES)
+
+    def test_concurrent_reader_never_sees_a_torn_record(self):
+        # The writer changes the channel and the volume together, the reader must never see them apart
+        stop = threading.Event()
+        def write():
+            i = 0
+            while not stop.is_set():
+                i += 1
+                self.publish(i)
+        self.publish(0)
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            sequences = set()
+            end = time.monotonic() + 1
+            while time.monotonic() < end:
+                status = self.reader.read()
+                self.assertIsNotNone(status)
+                self.assertEqual(status['playing_channel'], 'Channel {0:d}'.format(status['radio_volume']))
+                sequences.add(status['sequence'])
+        finally:
+            stop.set()
+            writer.join()
+        self.assertGreater(len(sequences), 10)
+
+class PreferencesTest(unittest.TestCase):
+
+    def test_deferred_loading(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'prefs')
+            with open(file_path, 'w') as f:
+                f.write('{"CoreRadio.StartVolume": 42}')
+            for i in range(20):
+                prefs = radio.Preferences(radio.CoreRadio.get_default_preferences(), file_path, deferred=True)
+                values = list()
+                readers = [threading.Thread(target=lambda: values.append(prefs['CoreRadio.StartVolume'])) for j in range(8)]
+                for reader in readers:
+                    reader.start()
+                for reader in readers:
+                    reader.join()
+                self.assertEqual(values, [42] * 8)
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            (file_path, snapshot_path) = (os.path.join(tmp_dir, 'prefs'), os.path.join(tmp_dir, 'prefs.snapshot'))
+            defaults = radio.CursesWrapper.get_default_preferences()
+            prefs = radio.Preferences(defaults, file_path, snapshot_file=snapshot_path)
+            prefs['CoreRadio.StartVolume'] = 42
+            prefs['ClockRadio.AlarmVolume'] = 7
+            prefs.save()
+            prefs = radio.Preferences(defaults, file_path, snapshot_file=snapshot_path)
+            self.assertIn('CoreRadio', prefs._unread_sections)
+            self.assertEqual(prefs['CoreRadio.StartVolume'], 42)
+            self.assertNotIn('CoreRadio', prefs._unread_sections)
+            self.assertIn('ClockRadio', prefs._unread_sections)
+            prefs['CoreRadio.StartVolume'] = 43
+            prefs.save()
+            for snapshot in (snapshot_path, None):
+                prefs = radio.Preferences(defaults, file_path, snapshot_file=snapshot)
+                self.assertEqual((prefs['CoreRadio.StartVolume'], prefs['ClockRadio.AlarmVolume']), (43, 7))
+            # A stale snapshot is ignored and written again
+            with open(file_path) as f:
+                text = f.read()
+            with open(file_path, 'w') as f:
+                f.write(text.replace('43', '44') + '\n')
+            prefs = radio.Preferences(defaults, file_path, snapshot_file=snapshot_path)
+            self.assertFalse(prefs._unread_sections)
+            self.assertEqual(prefs['CoreRadio.StartVolume'], 44)
+            self.assertEqual(radio.Preferences(defaults, file_path, snapshot_file=snapshot_path)['CoreRadio.StartVolume'], 44)
+
+    def test_save_replaces_the_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'prefs')
+            prefs = radio.Preferences(radio.CoreRadio.get_default_preferences(), file_path)
+            prefs['CoreRadio.StartVolume'] = 42
+            prefs.save()
+            self.assertEqual(os.listdir(tmp_dir), ['prefs'])
+            prefs['CoreRadio.StartVolume'] = 43
+            with mock.patch('os.replace', side_effect=OSError('interrupted')):
+                with self.assertRaises(OSError):
+                    prefs.save()
+            self.assertEqual(radio.Preferences(radio.CoreRadio.get_default_preferences(), file_path)['CoreRadio.StartVolume'], 42)
+
+class ColumnarChannelStoreTest(unittest.TestCase):
+
+    def test_same_api_as_dict(self):
+        (store, channels) = (radio.ColumnarChannelStore(), dict())
+        for i in range(100):
+            name = 'Radio {0:d} \u00e9t\u00e9'.format(i)
+            for container in (store, channels):
+                container[name] = radio.RadioChannel(name, 'http://example.com/{0:d}'.format(i))
+        store['Radio 7 \u00e9t\u00e9'] = channels['Radio 7 \u00e9t\u00e9'] = radio.RadioChannel('Radio 7 \u00e9t\u00e9', 'http://example.org/7')
+        self.assertEqual(len(store), len(channels))
+        self.assertEqual(list(store), list(channels))
+        self.assertEqual(list(store.keys()), list(channels))
+        for name in channels:
+            self.assertIn(name, store)
+            self.assertEqual(store.get_url(name), channels[name]._url)
+            self.assertEqual(store[name]._name, name)
+        self.assertNotIn('Radio 100', store)
+        self.assertRaises(KeyError, store.get_url, 'Radio 100')
+
+    def test_names_view(self):
+        store = radio.ColumnarChannelStore()
+        for name in ('a', 'b', 'c'):
+            store[name] = radio.RadioChannel(name, 'http://example.com/' + name)
+        names = store.keys()
+        self.assertEqual((names[0], names[-1], names[1:], names.index('c')), ('a', 'c', ['b', 'c'], 2))
+        self.assertIn('b', names)
+        self.assertRaises(ValueError, names.index, 'd')
+        self.assertRaises(IndexError, names.__getitem__, 3)
+
+class ListeningHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, 'history')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def record(self, history, timestamp, *args):
+        with mock.patch('time.time', return_value=timestamp):
+            history.record(*args)
+
+    def reopen(self, history):
+        history.close()
+        return radio.ListeningHistory(self.file_path)
+
+    def test_restart(self):
+        history = radio.ListeningHistory(self.file_path)
+        self.record(history, 1000, radio.ListeningHistory.Event.play, 50, 'A')
+        self.record(history, 1001, radio.ListeningHistory.Event.stop)
+        with mock.patch('time.time', return_value=1004):
+            history = self.reopen(history)
+            self.assertEqual(history.get_listening_time('A'), 1)
+            self.assertEqual(history.get_play_count('A'), 1)
+
+    def test_restart_after_crash(self):
+        history = radio.ListeningHistory(self.file_path)
+        self.record(history, 1000, radio.ListeningHistory.Event.play, 50, 'A')
+        self.record(history, 1001, radio.ListeningHistory.Event.volume, 60)
+        # No stop, the session ends at the last record instead of the restart
+        with mock.patch('time.time', return_value=1004):
+            history = self.reopen(history)
+            self.assertEqual(history.get_listening_time('A'), 1)
+            self.assertEqual(history.get_session_time(), 0)
+        history.save()
+        with mock.patch('time.time', return_value=1010):
+            self.assertEqual(self.reopen(history).get_listening_time('A'), 1)
+
+    def test_saved_by_its_own_timer(self):
+        history = radio.ListeningHistory(self.file_path)
+        with mock.patch.object(history, 'save', wraps=history.save) as save:
+            self.record(history, 1000, radio.ListeningHistory.Event.play, 50, 'A')
+            with mock.patch('time.monotonic', return_value=time.monotonic() + radio.HISTORY_SAVE_INTERVAL):
+                self.record(history, 1001, radio.ListeningHistory.Event.stop)
+            self.assertEqual(save.call_count, 1)
+            self.record(history, 1002, radio.ListeningHistory.Event.play, 50, 'A')
+            self.assertEqual(save.call_count, 1)
+        self.assertEqual(radio.ListeningHistory.load_stats('{0}.stats'.format(self.file_path))['channels'], {'A': [1, 1]})
+
+    def test_not_saved_by_preferences_sync(self):
+        clock_radio = create_clock_radio(self.tmp_dir.name, ['A'])
+        try:
+            clock_radio.play_radio('A')
+            with mock.patch.object(radio.ListeningHistory, 'save') as save:
+                clock_radio.sync_preferences()
+            save.assert_not_called()
+        finally:
+            clock_radio.close()
+
+    def test_clock_radio_close(self):
+        clock_radio = create_clock_radio(self.tmp_dir.name, ['A'])
+        with mock.patch('time.time', return_value=1000):
+            clock_radio.play_radio('A')
+        with mock.patch('time.time', return_value=1002):
+            clock_radio.close()
+        with mock.patch('time.time', return_value=1010):
+            self.assertEqual(radio.ListeningHistory(self.file_path).get_listening_time('A'), 2)
+
+class RadioModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = radio.RadioModel()
+        self.notifications = list()
+        self.model.subscribe(self.notifications.append)
+
+    def test_changes_dispatched_together(self):
+        self.model.update(radio_volume=10, alarm_on=False)
+        self.model.update(radio_volume=12, playing_channel='A')
+        self.assertEqual(self.notifications, [])
+        self.assertEqual((self.model.radio_volume, self.model.version), (12, 2))
+        self.model.dispatch()
+        self.assertEqual(self.notifications, [{'radio_volume', 'playing_channel'}])
+        self.model.dispatch()
+        self.assertEqual(len(self.notifications), 1)
+
+    def test_unchanged_values_not_dispatched(self):
+        self.model.update(radio_volume=0, alarm_channel=None)
+        self.model.dispatch()
+        self.assertEqual((self.notifications, self.model.version), ([], 0))
+
+    def test_updates_from_another_thread(self):
+        updater = threading.Thread(target=lambda: [self.model.update(radio_volume=i) for i in range(1, 1001)])
+        updater.start()
+        while updater.is_alive():
+            self.model.dispatch()
+        updater.join()
+        self.model.dispatch()
+        self.assertEqual((self.model.radio_volume, self.model.version), (1000, 1000))
+        self.assertTrue(all(changed == {'radio_volume'} for changed in self.notifications))
+
+    def test_unsubscribe(self):
+        self.model.unsubscribe(self.notifications.append)
+        self.model.update(radio_volume=10)
+        self.model.dispatch()
+        self.assertEqual(self.notifications, [])
+
+    def test_published_by_the_clock_radio(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            clock_radio = create_clock_radio(tmp_dir, ['A'])
+            try:
+                model = clock_radio._model
+                model.dispatch()
+                model.subscribe(self.notifications.append)
+                clock_radio.set_alarm_on(not model.alarm_on)
+                clock_radio.play_radio('A')
+                model.dispatch()
+                self.assertLessEqual({'alarm_on', 'playing_channel', 'is_radio_playing'}, self.notifications[0])
+                self.assertEqual((model.playing_channel, model.is_radio_playing), ('A', True))
+            finally:
+                clock_radio.close()
+
+class KeyMapTest(unittest.TestCase):
+
+    def test_default_bindings(self):
+        keymap = radio.CursesWrapper.KeyMap(radio.CursesWrapper.RadioFrameState.COMMANDS)
+        self.assertEqual(keymap.lookup(curses.KEY_UP), radio.CursesWrapper.Command.change_channel_up)
+        self.assertEqual(keymap.lookup(ord('p')), radio.CursesWrapper.Command.play_radio)
+        self.assertEqual(keymap.lookup(ord('>')), radio.CursesWrapper.Command.move_channel_down)
+        # Bound to the exit dialog, not to the radio frame
+        self.assertIsNone(keymap.lookup(ord('q')))
+        self.assertIsNone(keymap.lookup(-1))
+
+    def test_overrides(self):
+        overrides = {'play_radio': ['KEY_F5', 'x'], 'quit_app': ['ESC', 17]}
+        keymap = radio.CursesWrapper.KeyMap(('play_radio', 'stop_radio', 'quit_app'), overrides)
+        self.assertEqual(keymap.lookup(curses.KEY_F5), radio.CursesWrapper.Command.play_radio)
+        self.assertEqual(keymap.lookup(ord('x')), radio.CursesWrapper.Command.play_radio)
+        self.assertIsNone(keymap.lookup(ord('p')))
+        self.assertEqual(keymap.lookup(ord('s')), radio.CursesWrapper.Command.stop_radio)
+        self.assertEqual(keymap.lookup(curses.ascii.ESC), radio.CursesWrapper.Command.quit_app)
+        self.assertEqual(keymap.lookup(17), radio.CursesWrapper.Command.quit_app)
+
+    def test_invalid_binding(self):
+        with self.assertRaises(Exception):
+            radio.CursesWrapper.KeyMap(('play_radio',), {'play_radio': ['F5']})
+
+class PcmTapTest(unittest.TestCase):
+
+    CHANNELS = 2
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, 'export')
+        self.size = 2 * self.CHANNELS * radio.PCM_TAP_SAMPLES
+        with open(self.file_path, 'wb') as f:
+            f.write(bytes(radio.PcmTap.HEADER_SIZE + self.size))
+        self.file = open(self.file_path, 'r+b')
+        self.export = mmap.mmap(self.file.fileno(), 0)
+        self.counter = 0
+        self.noise = array.array('h', (random.Random(0).randint(-8000, 8000) for i in range(self.CHANNELS * radio.PCM_TAP_SAMPLES))).tobytes()
+        self.silence = bytes(self.size)
+
+    def tearDown(self):
+        self.export.close()
+        self.file.close()
+        self.tmp_dir.cleanup()
+
+    def write_block(self, payload):
+        """As the export filter of mplayer does"""
+        self.export[radio.PcmTap.HEADER_SIZE:] = payload
+        self.counter += 1
+        struct.pack_into(radio.PcmTap.HEADER_FORMAT, self.export, 0, self.CHANNELS, self.size, self.counter)
+
+    def check_levels(self):
+        tap = radio.PcmTap(self.file_path)
+        self.assertIsNone(tap.read_levels())
+        self.write_block(array.array('h', [16384, -16384] * (self.size // 4)).tobytes())
+        (rms, peak) = tap.read_levels()
+        self.assertAlmostEqual(rms, 0.5)
+        self.assertAlmostEqual(peak, 0.5)
+        self.assertIsNone(tap.read_levels()) # Nothing new
+        self.write_block(self.silence)
+        self.assertEqual(tap.read_levels(), (0, 0))
+        tap.close()
+        self.assertFalse(os.path.exists(self.file_path))
+
+    @unittest.skipIf(radio.numpy is None, 'needs numpy')
+    def test_levels(self):
+        self.check_levels()
+
+    def test_levels_without_numpy(self):
+        with mock.patch.object(radio, 'numpy', None):
+            self.check_levels()
+
+    def test_no_file(self):
+        self.assertIsNone(radio.PcmTap(os.path.join(self.tmp_dir.name, 'missing')).read_levels())
+
+    def poll(self, detector, start, seconds, payload=None):
+        """Writes a block of payload before each poll, none if None. Returns the times at which dead air started or ended"""
+        changes = list()
+        for i in range(round(seconds / radio.PCM_TAP_POLL_INTERVAL)):
+            if payload is not None:
+                self.write_block(payload)
+            now = start + i * radio.PCM_TAP_POLL_INTERVAL
+            if detector.update(now):
+                changes.append(now)
+        return changes
+
+    def test_dead_air_after_the_silence_duration(self):
+        detector = radio.DeadAirDetector(radio.PcmTap(self.file_path))
+        self.assertEqual(self.poll(detector, 0, 10, self.noise), [])
+        self.assertGreater(detector.rms, 0.1)
+        changes = self.poll(detector, 10, 30, self.silence)
+        self.assertEqual(len(changes), 1)
+        # The noise leaves the RMS window, then the silence lasts DEAD_AIR_DURATION
+        self.assertGreaterEqual(changes[0], 10 + radio.DEAD_AIR_DURATION)
+        self.assertLessEqual(changes[0], 10 + radio.DEAD_AIR_WINDOW + radio.DEAD_AIR_DURATION + radio.PCM_TAP_POLL_INTERVAL)
+        self.assertTrue(detector.is_dead_air)
+        changes = self.poll(detector, 40, 1, self.noise)
+        self.assertEqual(len(changes), 1)
+        self.assertLessEqual(changes[0], 40 + 2 * radio.PCM_TAP_POLL_INTERVAL) # At the first poll the interval allows
+        self.assertFalse(detector.is_dead_air)
+
+    def test_dead_air_without_samples(self):
+        detector = radio.DeadAirDetector(radio.PcmTap(self.file_path))
+        self.poll(detector, 0, 5, self.noise)
+        changes = self.poll(detector, 5, 30)
+        self.assertEqual(len(changes), 1)
+        self.assertEqual((detector.rms, detector.is_dead_air), (0, True))
+
+    def test_short_silence_is_not_dead_air(self):
+        detector = radio.DeadAirDetector(radio.PcmTap(self.file_path))
+        for start in range(0, 100, 10):
+            self.assertEqual(self.poll(detector, start, 2, self.noise), [])
+            self.assertEqual(self.poll(detector, start + 2, 8, self.silence), [])
+        self.assertFalse(detector.is_dead_air)
+
+@unittest.skipIf(radio.numpy is None, 'needs numpy')
+class SpectrumAnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.analyzer = radio.SpectrumAnalyzer()
+        self.numpy = radio.numpy
+
+    def tone(self, fft_bin, amplitude, channels=1):
+        """Sine on the center frequency of an FFT bin, in the first channel only"""
+        t = self.numpy.arange(radio.PCM_TAP_SAMPLES)
+        block = self.numpy.zeros((channels, radio.PCM_TAP_SAMPLES), dtype=self.numpy.int16)
+        block[0] = amplitude * self.numpy.sin(2 * self.numpy.pi * fft_bin * t / radio.PCM_TAP_SAMPLES)
+        return block
+
+    def get_band(self, fft_bin):
+        return int(self.numpy.searchsorted(self.analyzer._edges, fft_bin, side='right')) - 1
+
+    def test_silence(self):
+        self.analyzer.feed(self.numpy.zeros((2, radio.PCM_TAP_SAMPLES), dtype=self.numpy.int16))
+        self.assertEqual(self.analyzer.get_bands().tolist(), [0] * radio.SPECTRUM_BANDS)
+
+    def test_tone(self):
+        for i in range(radio.SPECTRUM_BLOCKS):
+            self.analyzer.feed(self.tone(12, 8000))
+        bands = self.analyzer.get_bands()
+        self.assertEqual(int(bands.argmax()), self.get_band(12))
+        # Levels on a METER_RANGE_DB scale, 0 dBFS at 1
+        self.assertAlmostEqual(float(bands.max()), 1 + 20 * math.log10(8000 / 32768) / radio.METER_RANGE_DB, delta=0.01)
+        self.assertEqual(float(bands[0]), 0)
+
+    def test_channels_mixed_down(self):
+        for i in range(radio.SPECTRUM_BLOCKS):
+            self.analyzer.feed(self.tone(40, 8000, channels=2))
+        self.assertAlmostEqual(float(self.analyzer.get_bands().max()), 1 + 20 * math.log10(4000 / 32768) / radio.METER_RANGE_DB, delta=0.01)
+
+    def test_ring(self):
+        self.analyzer.feed(self.tone(12, 8000))
+        bands = self.analyzer.get_bands()
+        self.assertGreater(float(bands.max()), 0)
+        self.assertIs(self.analyzer.get_bands(), bands) # Computed once per new block, in place
+        for i in range(radio.SPECTRUM_BLOCKS):
+            self.analyzer.feed(self.numpy.zeros((1, radio.PCM_TAP_SAMPLES), dtype=self.numpy.int16))
+        self.assertEqual(self.analyzer.get_bands().tolist(), [0] * radio.SPECTRUM_BANDS)
+
+    def test_other_block_size_ignored(self):
+        self.analyzer.feed(self.numpy.full((1, radio.PCM_TAP_SAMPLES // 2), 8000, dtype=self.numpy.int16))
+        self.assertEqual(self.analyzer.get_bands().tolist(), [0] * radio.SPECTRUM_BANDS)
+
+class RenderSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        for (name, clock) in (('time.monotonic', lambda: self.now), ('time.time', lambda: self.now + 0.25)):
+            patcher = mock.patch(name, side_effect=clock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.scheduler = radio.CursesWrapper.RenderScheduler()
+        self.Mode = radio.CursesWrapper.RenderScheduler.Mode
+
+    def test_modes(self):
+        self.scheduler.update_mode(self.now)
+        self.assertEqual(self.scheduler.get_mode(), self.Mode.idle)
+        self.scheduler.notify_input()
+        self.scheduler.update_mode(self.now)
+        self.assertEqual(self.scheduler.get_mode(), self.Mode.active)
+        self.now += radio.RENDER_ACTIVE_DURATION
+        self.scheduler.update_mode(self.now)
+        self.assertEqual(self.scheduler.get_mode(), self.Mode.idle)
+        self.scheduler.set_power_state(radio.System.BatteryState.discharging, 50)
+        self.scheduler.notify_input()
+        self.scheduler.update_mode(self.now)
+        self.assertEqual(self.scheduler.get_mode(), self.Mode.battery)
+        self.scheduler.set_power_state(radio.System.BatteryState.discharging, radio.BATTERY_LOW_CHARGE)
+        self.scheduler.update_mode(self.now)
+        self.assertEqual((self.scheduler.get_mode(), self.scheduler.get_tick()), (self.Mode.low_battery, radio.RENDER_LOW_BATTERY_TICK))
+        self.scheduler.set_power_state(radio.System.BatteryState.charging, 50)
+        self.scheduler.set_asleep(True)
+        self.scheduler.update_mode(self.now)
+        self.assertEqual(self.scheduler.get_mode(), self.Mode.asleep)
+        self.scheduler.notify_input()
+        self.scheduler.update_mode(self.now)
+        self.assertEqual(self.scheduler.get_mode(), self.Mode.active)
+
+    def test_frames_after_input(self):
+        self.scheduler.notify_input()
+        self.scheduler.notify_frame()
+        self.assertEqual(self.scheduler.get_timeout(True, False), int(radio.RENDER_ACTIVE_INTERVAL * 1000) + 1)
+        self.assertEqual(self.scheduler.get_timeout(True, True), 0)
+        self.assertFalse(self.scheduler.is_frame_due(True))
+        self.now += radio.RENDER_ACTIVE_INTERVAL * 1.01
+        self.assertTrue(self.scheduler.is_frame_due(True))
+        self.assertFalse(self.scheduler.is_frame_due(False))
+
+    def test_ticks_without_changes(self):
+        self.scheduler.notify_frame()
+        # The next redraw is on the next wall clock second
+        self.assertEqual(self.scheduler.get_timeout(False, False), 750 + 1)
+        self.now += 0.5
+        self.assertFalse(self.scheduler.is_frame_due(False))
+        self.now += 0.25
+        self.assertTrue(self.scheduler.is_frame_due(False))
+        self.scheduler.set_power_state(radio.System.BatteryState.discharging, radio.BATTERY_LOW_CHARGE)
+        self.scheduler.notify_frame()
+        self.assertEqual(self.scheduler.get_timeout(False, False), radio.RENDER_MAX_SLEEP * 1000)
+
+    def test_animation(self):
+        self.scheduler.notify_input()
+        self.scheduler.notify_frame()
+        self.scheduler.set_animation(radio.METER_REFRESH_INTERVAL)
+        self.assertEqual(self.scheduler.get_timeout(False, False), int(radio.METER_REFRESH_INTERVAL * 1000) + 1)
+        self.scheduler.set_animation(0.001)
+        self.assertEqual(self.scheduler.get_animation_interval(), radio.RENDER_ACTIVE_INTERVAL)
+        self.scheduler.set_power_state(radio.System.BatteryState.discharging, radio.BATTERY_LOW_CHARGE)
+        self.scheduler.update_mode(self.now)
+        self.assertIsNone(self.scheduler.get_animation_interval())
+
+    def test_stats(self):
+        for i in range(10):
+            self.now += 0.5
+            self.scheduler.notify_wakeup()
+            if i % 2 == 0:
+                self.scheduler.notify_frame()
+        (seconds, wakeups, frames, cpu) = self.scheduler.get_stats()[self.Mode.idle]
+        self.assertEqual((seconds, wakeups, frames), (5, 120, 60))
+        self.assertGreaterEqual(cpu, 0)
+
+class CursesWrapperTest(unittest.TestCase):
+
+    def setUp(self):
+        for (name, value) in (('get_battery_charge', 55), ('get_battery_status', radio.System.BatteryState.charging)):
+            patcher = mock.patch.object(radio.System, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        try:
+            self.gui = create_gui(self.tmp_dir.name, ['Radio {0:d}'.format(i) for i in range(20)])
+        except curses.error as err:
+            self.tmp_dir.cleanup()
+            self.skipTest('no curses screen: {0}'.format(err))
+        self.window = self.gui._current_panel.window()
+
+    def tearDown(self):
+        self.gui._clock_radio.close()
+        self.tmp_dir.cleanup()
+
+    def test_repeated_keys_coalesced(self):
+        type_keys(*[curses.KEY_DOWN] * 5, ord('p'), curses.KEY_DOWN, curses.KEY_DOWN)
+        self.gui.drain_input(self.window)
+        # Only up to the first key which is not a repeatable command of the top state
+        self.assertEqual(self.gui._pending_keys, [(curses.KEY_DOWN, 5), (ord('p'), 1), (curses.KEY_DOWN, 1), (curses.KEY_DOWN, 1)])
+        self.gui.consume_input(self.window)
+        self.assertEqual(self.gui.get_repeat_count(), 5)
+        self.gui.update()
+        self.assertEqual(self.gui._current_channel, 'Radio {0:d}'.format(self.gui.get_repeat_steps()))
+        self.assertGreaterEqual(self.gui.get_repeat_steps(), 5)
+        self.assertEqual(len(self.gui._pending_keys), 3)
+
+    def test_other_keys_not_coalesced(self):
+        type_keys(ord('p'), ord('p'), curses.KEY_UP, curses.KEY_UP)
+        self.gui.drain_input(self.window)
+        self.assertEqual(self.gui._pending_keys, [(ord('p'), 1), (ord('p'), 1), (curses.KEY_UP, 1), (curses.KEY_UP, 1)])
+
+    def press(self, *keys):
+        type_keys(*keys)
+        self.gui.drain_input(self.window)
+        while self.gui._pending_keys:
+            self.gui.clear_input() # As main_loop does on every iteration
+            self.gui.consume_input(self.window)
+            self.gui.update()
+        self.gui.draw()
+
+    def test_dialog_reused(self):
+        self.press(curses.ascii.ESC)
+        exit_dialog = radio.CursesWrapper.exit_dialog
+        self.assertIs(self.gui.top_state(), exit_dialog)
+        (window, panel) = (exit_dialog.get_dialog_window(), exit_dialog._dialog_panel)
+        self.assertEqual(window.getbegyx(), (10, 14))
+        self.assertEqual(window.instr(2, 2, 9), b'Poweroff,')
+        self.press(curses.ascii.ESC)
+        self.assertIs(self.gui.top_state(), radio.CursesWrapper.radio_frame)
+        self.assertTrue(panel.hidden())
+        self.press(curses.ascii.ESC)
+        self.assertIs(exit_dialog.get_dialog_window(), window)
+        self.assertFalse(panel.hidden())
+        self.assertEqual(list(radio.CursesWrapper.DialogFrameState.dialog_pool), [exit_dialog.DIALOG_SIZE])
+        self.press(curses.ascii.ESC)
+        # Created again for another screen size, in the same panel
+        self.resize(30, 100)
+        self.press(curses.ascii.ESC)
+        self.assertIsNot(exit_dialog.get_dialog_window(), window)
+        self.assertIs(exit_dialog._dialog_panel, panel)
+        self.assertEqual(exit_dialog.get_dialog_window().getbegyx(), (13, 24))
+        self.assertEqual(len(radio.CursesWrapper.DialogFrameState.dialog_pool), 1)
+
+    def set_idle(self, seconds):
+        self.gui._scheduler._last_input_time = time.monotonic() - seconds
+
+    def suspend_when_idle(self):
+        del radio.SimulatedSystem.suspend_requests[:]
+        self.gui.suspend_when_idle()
+        return len(radio.SimulatedSystem.suspend_requests)
+
+    def test_suspend_when_idle(self):
+        self.gui._prefs['CursesWrapper.SuspendIdleTime'] = 600
+        alarm = datetime.datetime.now() + datetime.timedelta(hours=2)
+        self.gui._clock_radio.set_alarm_time((alarm.hour, alarm.minute))
+        self.gui._clock_radio.set_alarm_on(True)
+        self.set_idle(590)
+        self.assertEqual(self.suspend_when_idle(), 0)
+        self.set_idle(600)
+        self.assertEqual(self.suspend_when_idle(), 1)
+        self.assertAlmostEqual(radio.SimulatedSystem.suspend_requests[0], 7200 - radio.SUSPEND_MARGIN, delta=61)
+        # Idle time counted again from the resume
+        self.assertLess(self.gui._scheduler.get_idle_time(), 1)
+        self.assertEqual(self.suspend_when_idle(), 0)
+
+    def test_no_suspend_when_busy(self):
+        self.gui._prefs['CursesWrapper.SuspendIdleTime'] = 600
+        alarm = datetime.datetime.now() + datetime.timedelta(hours=2)
+        self.gui._clock_radio.set_alarm_time((alarm.hour, alarm.minute))
+        self.set_idle(3600)
+        self.assertEqual(self.suspend_when_idle(), 0) # Alarm off
+        self.gui._clock_radio.set_alarm_on(True)
+        self.gui._clock_radio.play_radio('Radio 0')
+        self.assertEqual(self.suspend_when_idle(), 0)
+        self.gui._clock_radio.stop_radio()
+        self.press(curses.ascii.ESC)
+        self.set_idle(3600)
+        self.assertEqual(self.suspend_when_idle(), 0) # A dialog waits for an answer
+        self.press(curses.ascii.ESC)
+        self.set_idle(3600)
+        self.assertEqual(self.suspend_when_idle(), 1)
+        self.gui._prefs['CursesWrapper.SuspendIdleTime'] = None
+        self.set_idle(3600)
+        self.assertEqual(self.suspend_when_idle(), 0)
+
+    def resize(self, rows, cols):
+        curses.resizeterm(rows, cols) # Queues a KEY_RESIZE
+        self.gui.consume_input(self.window)
+        self.gui.update()
+        self.gui.draw()
+
+    def test_resize(self):
+        (main_frame, radio_frame) = (radio.CursesWrapper.main_frame, radio.CursesWrapper.radio_frame)
+        self.resize(30, 100)
+        self.assertEqual(self.gui.get_screen_size(), (30, 100))
+        self.assertEqual((main_frame._bottom_win.getbegyx(), main_frame._bottom_win.getmaxyx()), ((27, 0), (3, 100)))
+        self.assertEqual((radio_frame._center_win.getbegyx(), radio_frame._center_win.getmaxyx()), ((3, 0), (21, 100)))
+        self.assertEqual(self.window.instr(13, 1, 98).decode().strip(), 'Radio 0') # Middle row of the list
+        self.resize(24, 80)
+        self.assertEqual(main_frame._bottom_win.getbegyx(), (21, 0))
+        self.assertEqual(set(main_frame._layouts), {(24, 80), (30, 100)})
+
+    def test_screen_too_small(self):
+        self.resize(radio.SCREEN_MIN_ROWS - 1, 80)
+        self.assertEqual(self.window.instr(0, 0, 18), b'Terminal too small')
+        type_keys(curses.KEY_DOWN)
+        self.gui.consume_input(self.window)
+        self.gui.update()
+        self.assertEqual((self.gui._pending_keys, self.gui._current_channel), ([], None))
+        self.resize(24, 80)
+        self.assertFalse(self.gui._screen_too_small)
+        self.assertEqual(radio.CursesWrapper.main_frame._bottom_win.getbegyx(), (21, 0))
+        self.assertEqual(self.window.instr(10, 1, 78).decode().strip(), 'Radio 0')
+
+class ClockRadioTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.clock = radio.SimulatedClock(datetime.datetime(2026, 1, 1, 22, 0), 'Europe/Berlin')
+        self.clock_radio = create_clock_radio(self.tmp_dir.name, ['A', 'B', 'C'], self.clock)
+
+    def tearDown(self):
+        self.clock_radio.close()
+        self.tmp_dir.cleanup()
+
+    def test_move_channel_skips_hidden_entries(self):
+        # X and Y are not in the catalog, the view is A B C
+        self.clock_radio.set_channel_list('L', ['A', 'X', 'B', 'Y', 'C'])
+        self.clock_radio.set_active_channel_list('L')
+        self.assertTrue(self.clock_radio.move_channel('A', 1))
+        self.assertEqual(self.clock_radio.get_channel_list_view(), ['B', 'A', 'C'])
+        self.clock_radio.move_channel('C', -1)
+        self.assertEqual(self.clock_radio.get_channel_list_view(), ['B', 'C', 'A'])
+        self.clock_radio.move_channel('B', -5)
+        self.clock_radio.move_channel('A', 5, view=['B', 'A'])
+        self.assertEqual(self.clock_radio.get_channel_list_view(), ['B', 'C', 'A'])
+        self.clock_radio.move_channel('B', 2, view=['B', 'A'])
+        self.assertEqual(self.clock_radio.get_channel_list_view(), ['C', 'A', 'B'])
+
+    def test_sleep_timer_fade(self):
+        expired = mock.Mock()
+        self.clock_radio.set_sleep_event_listener(expired)
+        self.clock_radio.play_radio('A')
+        player = self.clock_radio._core_radio._player
+        volume = player.get_volume()
+        self.clock_radio.set_sleep_timer(120)
+        volumes = list()
+        for i in range(120):
+            self.clock.advance(1)
+            self.clock_radio.update()
+            volumes.append(player.get_volume())
+        # Full volume until the fade, then down to 0 over SLEEP_FADE_DURATION
+        fade = radio.SLEEP_FADE_DURATION
+        self.assertEqual(volumes[:120 - fade], [volume] * (120 - fade))
+        self.assertEqual(volumes[120 - fade + 29], round(volume * 30 / fade))
+        self.assertEqual(volumes[-2], round(volume / fade))
+        self.assertEqual(volumes[-1], 0)
+        self.assertEqual(volumes, sorted(volumes, reverse=True))
+        self.assertEqual(player.commands[-2:], [('volume', 0), ('stop',)])
+        self.assertFalse(self.clock_radio._core_radio.is_playing())
+        self.assertIsNone(self.clock_radio.get_sleep_countdown())
+        expired.assert_called_once_with()
+        # The next play is at the volume of before the fade
+        self.clock_radio.play_radio('A')
+        self.assertEqual(self.clock_radio._core_radio._player.get_volume(), volume)
+
+    def test_sleep_timer_cancelled_by_stop(self):
+        self.clock_radio.play_radio('A')
+        self.clock_radio.set_sleep_timer(60)
+        self.clock.advance(30)
+        self.clock_radio.update()
+        self.clock_radio.stop_radio()
+        self.clock_radio.update()
+        self.assertIsNone(self.clock_radio.get_sleep_countdown())
+        self.clock_radio.play_radio('A')
+        self.assertEqual(self.clock_radio._core_radio._player.get_volume(), radio.START_VOLUME)
+
+class AlarmSimulatorTest(unittest.TestCase):
+
+    def simulate(self, start, days, **settings):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report = bench_radio.AlarmSimulator(tmp_dir, start, **settings).run(days)
+        # An alarm is noticed by the first loop after it, and fires on the next one
+        self.assertLessEqual(report['jitter_max'], 2 * settings.get('latency', 1.0))
+        self.assertGreaterEqual(report['jitter_mean'], 0)
+        return report
+
+    def test_spring_dst_gap(self):
+        # 2:30 does not exist on 2026-03-29 in Berlin, the alarm rings after the gap
+        report = self.simulate(datetime.datetime(2026, 3, 25), 7, alarm_time=(2, 30))
+        self.assertEqual((report['fired'], report['missed']), (7, 0))
+        self.assertLessEqual(report['wake_error_max'], 1)
+
+    def test_autumn_dst_fold(self):
+        # 1:30 happens twice on 2026-10-25 in Berlin, the alarm rings once
+        report = self.simulate(datetime.datetime(2026, 10, 20), 10, alarm_time=(1, 30))
+        self.assertEqual((report['fired'], report['missed']), (10, 0))
+        self.assertLessEqual(report['wake_error_max'], 1)
+
+    def test_missed_alarms(self):
+        report = self.simulate(datetime.datetime(2026, 1, 1), 365, stall_probability=0.05, snoozes=3)
+        self.assertGreater(report['stalls'], 0)
+        self.assertEqual(report['missed'], report['stalls'])
+        self.assertEqual(report['fired'], 365 - report['stalls'])
+
+    def test_unanswered_alarms(self):
+        report = self.simulate(datetime.datetime(2026, 1, 1), 28, answer_delay=None)
+        self.assertEqual((report['fired'], report['missed'], report['timeouts'], report['snoozes']), (28, 0, 28, 0))
+
+class PlaybackManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        channels_file = os.path.join(self.tmp_dir.name, 'channels')
+        with open(channels_file, 'w') as f:
+            f.write('A|http://a.example.com/stream.mp3\n')
+        self.channels_file_b = os.path.join(self.tmp_dir.name, 'channels_b')
+        with open(self.channels_file_b, 'w') as f:
+            f.write('B|http://b.example.com/stream.mp3\n')
+        prefs = radio.ClockRadio.get_default_preferences()
+        core_radio = radio.CoreRadio(prefs)
+        core_radio.load_radio_list(channels_file)
+        self.manager = radio.PlaybackManager(prefs, core_radio)
+        self.output = self.manager.add_output('null', backend='null')
+        self.now = 1000
+        self.clock = mock.patch('time.monotonic', side_effect=lambda: self.now)
+        self.clock.start()
+        self.manager.play('null', 'A')
+
+    def tearDown(self):
+        self.clock.stop()
+        self.manager.close()
+        self.tmp_dir.cleanup()
+
+    def fail_and_restart(self, playing_time):
+        self.output.player.emit(radio.AudioBackend.Event.error, 'stream lost')
+        self.manager.update()
+        self.assertIsNotNone(self.output.restart_time)
+        self.now = self.output.restart_time
+        self.manager.update() # Restarts
+        self.manager.update() # Started
+        self.now += playing_time
+        self.manager.update()
+
+    def test_spaced_failures(self):
+        for i in range(3 * radio.PLAYBACK_MAX_RESTARTS):
+            self.fail_and_restart(radio.PLAYBACK_RECOVERY_TIME)
+            self.assertEqual(self.output.restarts, 0)
+        self.assertTrue(self.manager.is_playing('null'))
+
+    def test_failure_of_a_removed_channel(self):
+        self.manager._core_radio.load_radio_list(self.channels_file_b)
+        with mock.patch.object(self.manager._core_radio, 'record_stream_stats') as record_stream_stats:
+            self.output.player.emit(radio.AudioBackend.Event.error, 'stream lost')
+            self.manager.update()
+        record_stream_stats.assert_not_called()
+        self.assertIsNone(self.output.restart_time)
+        self.assertFalse(self.manager.is_playing('null'))
+
+    def test_channel_removed_before_the_restart(self):
+        self.output.player.emit(radio.AudioBackend.Event.error, 'stream lost')
+        self.manager.update()
+        self.manager._core_radio.load_radio_list(self.channels_file_b)
+        self.now = self.output.restart_time
+        self.manager.update()
+        self.assertIsNone(self.output.player)
+        self.assertFalse(self.manager.is_playing('null'))
+        self.manager.update()
+
+    def test_repeated_failures(self):
+        for i in range(radio.PLAYBACK_MAX_RESTARTS):
+            self.fail_and_restart(radio.PLAYBACK_RECOVERY_TIME / 2)
+            self.assertEqual(self.output.restarts, i + 1)
+        self.output.player.emit(radio.AudioBackend.Event.error, 'stream lost')
+        self.manager.update()
+        self.assertFalse(self.manager.is_playing('null'))
+
+FAKE_MPLAYER = '''
+import os, sys, time
+for line in sys.stdin:
+    if line.startswith(('loadfile', 'loadlist')):
+        print('Playing {0}.'.format(line.split()[1]), flush=True)
+        time.sleep(float(os.environ.get('FAKE_MPLAYER_DELAY', '0')))
+        sys.stdout.write('Cache fill:  5.00% (16384 bytes)\\r\\nStarting playback...\\n')
+        sys.stdout.flush()
+'''
+
+class MPlayerBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        executable = os.path.join(self.tmp_dir.name, 'mplayer')
+        with open(executable, 'w') as f:
+            f.write('#!{0}\n{1}'.format(sys.executable, FAKE_MPLAYER))
+        os.chmod(executable, 0o755)
+        radio.MPlayer.executable = executable
+        self.events = list()
+
+    def tearDown(self):
+        radio.MPlayer.executable = None
+        os.environ.pop('FAKE_MPLAYER_DELAY', None)
+        self.tmp_dir.cleanup()
+
+    def test_started_when_playback_starts(self):
+        os.environ['FAKE_MPLAYER_DELAY'] = '0.3'
+        player = radio.AudioBackend.create('mplayer', 100, 50)
+        player.set_event_listener(lambda event, value: self.events.append((event, value)))
+        try:
+            player.play_stream('http://example.com/stream')
+            start_time = time.monotonic()
+            with selectors.DefaultSelector() as selector:
+                for fd in player.get_selectables():
+                    selector.register(fd, selectors.EVENT_READ)
+                while not self.events and time.monotonic() - start_time < 5:
+                    selector.select(1)
+                    player.poll()
+            self.assertEqual(self.events, [(radio.AudioBackend.Event.started, 'http://example.com/stream')])
+            self.assertGreaterEqual(time.monotonic() - start_time, 0.3)
+        finally:
+            player.stop()
+        self.assertEqual(player.get_selectables(), [])
+
+    def test_exit(self):
+        player = radio.AudioBackend.create('mplayer', 100, 50)
+        player.set_event_listener(lambda event, value: self.events.append(event))
+        try:
+            player.play('http://example.com/playlist.m3u')
+            player._mplayer._stdin.close()
+            deadline = time.monotonic() + 5
+            while radio.AudioBackend.Event.error not in self.events and time.monotonic() < deadline:
+                player.poll()
+                time.sleep(0.01)
+            self.assertEqual(self.events, [radio.AudioBackend.Event.started, radio.AudioBackend.Event.error])
+            self.assertEqual(player.get_selectables(), [player._exit_fd])
+        finally:
+            player.stop()
+
+FAKE_MPV = '''
+import json, os, socket, sys, time
+args = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:])
+if os.environ.get('FAKE_MPV_EXIT'):
+    sys.exit(1)
+time.sleep(float(os.environ.get('FAKE_MPV_DELAY', '0')))
+server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+server.bind(args['input-ipc-server'])
+server.listen(1)
+(connection, _) = server.accept()
+for line in connection.makefile('rb'):
+    message = json.loads(line)
+    connection.sendall((json.dumps(dict(error='success', request_id=message['request_id'])) + '\\n').encode())
+    if message['command'][0] == 'loadfile':
+        connection.sendall(b'{"event": "playback-restart"}\\n')
+'''
+
+class MpvBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        executable = os.path.join(self.tmp_dir.name, 'mpv')
+        with open(executable, 'w') as f:
+            f.write('#!{0}\n{1}'.format(sys.executable, FAKE_MPV))
+        os.chmod(executable, 0o755)
+        radio.MpvBackend.executable = executable
+        self.events = list()
+
+    def tearDown(self):
+        radio.MpvBackend.executable = None
+        os.environ.pop('FAKE_MPV_DELAY', None)
+        os.environ.pop('FAKE_MPV_EXIT', None)
+        self.tmp_dir.cleanup()
+
+    def start(self):
+        start_time = time.monotonic()
+        player = radio.AudioBackend.create('mpv', 100, 50)
+        self.assertLess(time.monotonic() - start_time, 0.2)
+        player.set_event_listener(lambda event, value: self.events.append(event))
+        return player
+
+    def poll_until(self, player, event, timeout=5):
+        deadline = time.monotonic() + timeout
+        while event not in self.events and time.monotonic() < deadline:
+            player.poll()
+            time.sleep(0.01)
+        self.assertIn(event, self.events)
+
+    def test_connects_from_poll(self):
+        os.environ['FAKE_MPV_DELAY'] = '0.5'
+        player = self.start()
+        try:
+            player.play('http://example.com/stream')
+            self.assertEqual(player.get_selectables(), [])
+            self.poll_until(player, radio.AudioBackend.Event.started)
+            self.assertTrue(player.get_selectables())
+        finally:
+            player.stop()
+
+    def test_exit_before_connecting(self):
+        os.environ['FAKE_MPV_EXIT'] = '1'
+        player = self.start()
+        try:
+            self.poll_until(player, radio.AudioBackend.Event.error)
+        finally:
+            player.stop()
+
+class CatalogImporterTest(unittest.TestCase):
+
+    def test_csv_with_header(self):
+        f = io.StringIO('Station,Country,URL\nRadio A,FR,http://a.example.com/stream\n')
+        self.assertEqual(list(radio.CatalogImporter.parse_csv(f)), [('Radio A', 'http://a.example.com/stream')])
+
+    def test_csv_without_header(self):
+        f = io.StringIO('Radio A,http://A.example.com/Stream\nRadio B,http://b.example.com/stream\n')
+        self.assertEqual(list(radio.CatalogImporter.parse_csv(f)), [('Radio A', 'http://A.example.com/Stream'), ('Radio B', 'http://b.example.com/stream')])
+
+    def test_import_csv_without_header(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            (channels_file, csv_file) = (os.path.join(tmp_dir, 'channels'), os.path.join(tmp_dir, 'stations.csv'))
+            with open(csv_file, 'w') as f:
+                f.write('Radio A,http://a.example.com/Stream?Key=X\n')
+            importer = radio.CatalogImporter(channels_file)
+            importer.index_catalog()
+            importer.import_files([csv_file])
+            with open(channels_file) as f:
+                self.assertEqual(f.read(), 'Radio A|http://a.example.com/Stream?Key=X\n')
+
+class StreamCachePolicyTest(unittest.TestCase):
+
+    def test_settings_within_bounds(self):
+        generator = random.Random(0)
+        for i in range(1000):
+            entry = dict(bitrate=generator.choice([None, 8, 32, 128, 320, 1411]))
+            for session in range(generator.randint(1, 10)):
+                entry.update(radio.StreamCachePolicy.merge_stats(entry, generator.uniform(0, 7200), generator.randint(0, 50), generator.randint(0, 5), generator.choice([None, 64, 256])))
+            settings = radio.StreamCachePolicy.get_settings(entry)
+            if entry['play_seconds'] < radio.STREAM_STATS_MIN_SECONDS:
+                self.assertIsNone(settings)
+                continue
+            bitrate = entry.get('observed_bitrate') or entry['bitrate'] or radio.STREAM_DEFAULT_BITRATE
+            (size, prefill, prefill_seconds) = settings
+            default_prefill_seconds = 8 * radio.STREAM_CACHE_DEFAULT[0] * radio.STREAM_CACHE_DEFAULT[1] / 100 / bitrate
+            self.assertGreaterEqual(size, radio.STREAM_CACHE_DEFAULT[0])
+            self.assertLessEqual(size, max(radio.STREAM_CACHE_DEFAULT[0], math.ceil(bitrate / 8 * radio.STREAM_CACHE_MAX_SECONDS)))
+            self.assertTrue(1 <= prefill <= 99)
+            self.assertTrue(radio.STREAM_PREFILL_MIN_SECONDS <= prefill_seconds <= max(radio.STREAM_PREFILL_MAX_SECONDS, default_prefill_seconds))
+
+    def test_prefill_shrinks_after_calm_listening(self):
+        entry = dict(bitrate=128)
+        default_prefill = radio.StreamCachePolicy.get_settings(radio.StreamCachePolicy.merge_stats(entry, 3600))[1:]
+        self.assertEqual(default_prefill, (radio.STREAM_CACHE_DEFAULT[1], 8 * radio.STREAM_CACHE_DEFAULT[0] * radio.STREAM_CACHE_DEFAULT[1] / 100 / 128))
+        prefills = list()
+        for hour in range(radio.STREAM_CALM_SECONDS // 3600 + 3):
+            entry.update(radio.StreamCachePolicy.merge_stats(entry, 3600))
+            prefills.append(radio.StreamCachePolicy.get_settings(entry)[2])
+        calm_hours = radio.STREAM_CALM_SECONDS // 3600
+        self.assertEqual(prefills[:calm_hours - 1], [default_prefill[1]] * (calm_hours - 1))
+        self.assertEqual(prefills[calm_hours - 1:], [max(radio.STREAM_PREFILL_MIN_SECONDS, default_prefill[1] / 2 ** i) for i in range(1, 5)])
+        # One incident brings the default back, the cache is never below the default
+        entry.update(radio.StreamCachePolicy.merge_stats(entry, 60, underruns=1))
+        self.assertEqual(radio.StreamCachePolicy.get_settings(entry)[1:], default_prefill)
+        self.assertEqual(radio.StreamCachePolicy.get_settings(entry)[0], radio.STREAM_CACHE_DEFAULT[0])
+
+    def test_random_trace(self):
+        trace = bench_radio.StreamCacheSimulator.random_trace(3600, 10, 4, seed=1)
+        self.assertTrue(trace)
+        self.assertEqual(trace, sorted(trace))
+        self.assertTrue(all(start < end and 0 <= throughput < 1 for (start, end, throughput) in trace))
+        self.assertTrue(all(a[1] <= b[0] for (a, b) in zip(trace, trace[1:])))
+
+class SparePlayerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        channels_file = os.path.join(self.tmp_dir.name, 'channels')
+        with open(channels_file, 'w') as f:
+            f.write('A|http://a.example.com/stream.mp3\n')
+        self.prefs = radio.CoreRadio.get_default_preferences()
+        self.prefs['CoreRadio.Backend'] = 'null'
+        self.core_radio = radio.CoreRadio(self.prefs)
+        self.core_radio.load_radio_list(channels_file)
+        catalog_cache = radio.CatalogCache(os.path.join(self.tmp_dir.name, 'catalog_cache'))
+        catalog_cache.update('http://a.example.com/stream.mp3', radio.StreamCachePolicy.merge_stats(dict(), 3600, underruns=10))
+        self.core_radio.set_catalog_cache(catalog_cache)
+        self.cache = self.core_radio.get_cache_settings('http://a.example.com/stream.mp3')
+
+    def tearDown(self):
+        self.core_radio.stop()
+        radio.CoreRadio.release_spare_player()
+        self.tmp_dir.cleanup()
+
+    def play_with_spare(self, cache):
+        radio.CoreRadio.prespawn_player(self.prefs, resume=False, cache=cache)
+        radio.CoreRadio.spare_player_thread.join()
+        spare = radio.CoreRadio.spare_player[0]
+        self.core_radio.play('A')
+        return spare
+
+    def test_spare_with_the_channel_cache(self):
+        spare = self.play_with_spare(self.cache)
+        self.assertIs(self.core_radio._player, spare)
+        self.assertEqual(spare.cache, self.cache)
+
+    def test_spare_with_another_cache(self):
+        spare = self.play_with_spare(None)
+        self.assertIsNot(self.core_radio._player, spare)
+        self.assertEqual(spare.commands, [('stop',)])
+        self.assertEqual(self.core_radio._player.cache, self.cache)
+
+class StationScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = bench_radio.StationServerSimulator(hosts=3, delay=0.05)
+
+    def tearDown(self):
+        self.simulator.close()
+
+    def test_limits(self):
+        urls = self.simulator.get_urls('/stream', 12)
+        results = radio.StationScanner(max_concurrency=6, max_per_host=3).scan(urls)
+        self.assertEqual(len(results), len(urls))
+        self.assertTrue(all(h['status'] == 'alive' for h in results.values()))
+        self.assertEqual(self.simulator.get_peaks(), [3, 3, 3])
+        self.assertEqual(self.simulator.peak_total, 6)
+
+    def test_busy_host_does_not_hold_global_slots(self):
+        # The first host's checks are queued first, the other hosts must still run alongside it
+        urls = self.simulator.get_urls('/stream', 8)
+        radio.StationScanner(max_concurrency=6, max_per_host=2).scan(urls)
+        self.assertEqual(self.simulator.peak_total, 6)
+
+    def test_errors(self):
+        (missing, empty, redirect) = (self.simulator.get_urls(path)[0] for path in ('/missing', '/empty', '/redirect'))
+        results = radio.StationScanner().scan([missing, empty, redirect])
+        self.assertEqual((results[missing]['status'], results[missing]['code'], results[missing]['error']), ('dead', 404, 'http status 404'))
+        self.assertEqual((results[empty]['status'], results[empty]['error']), ('dead', 'empty stream'))
+        self.assertEqual((results[redirect]['status'], results[redirect]['codec'], results[redirect]['bitrate']), ('alive', 'mp3', 128))
+
+if __name__ == '__main__':
+    unittest.main()